@@ -1,9 +1,13 @@
 from rest_framework.views import APIView
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
-from .models import Conversation
+from .models import Conversation, ConversationReadState
 from .serializers import ConversationMessageSerializer, ConversationDynamicSerializer
 from useraccounts.models import User
+from helpers.pagination import keyset_page, encode_cursor, InvalidCursor
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .unread import publish_unread_counts_sync
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from .swagger_usecases import (
@@ -12,6 +16,39 @@ from .swagger_usecases import (
     conversation_detail_response_schema,
 )
 
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+MESSAGE_ORDERING = ['created_at', 'id']
+
+
+def message_cursor(message):
+    return encode_cursor([getattr(message, field) for field in MESSAGE_ORDERING])
+
+
+def message_page(conversation, before=None, after=None, page_size=MESSAGES_PAGE_SIZE):
+    """
+    One page of a conversation's messages, oldest first, as (messages, before, after).
+
+    Without a cursor this is the latest page; `before` pages back through older
+    messages and `after` picks up newer ones, e.g. when polling. The returned
+    `before` is None once the start of the conversation is reached; `after`
+    points at the newest message returned, or is passed through when nothing
+    newer exists yet. Every page is one range scan of the (conversation,
+    created_at) index, with both users of each message joined in.
+    """
+    qs = conversation.messages.select_related('sent_to', 'created_by')
+    if after:
+        messages, _ = keyset_page(qs, MESSAGE_ORDERING, after, page_size)
+        # Anything newer than the cursor has the cursor's message before it
+        older = message_cursor(messages[0]) if messages else None
+    else:
+        newest_first = [f'-{field}' for field in MESSAGE_ORDERING]
+        messages, older = keyset_page(qs, newest_first, before, page_size)
+        messages.reverse()
+    newer = message_cursor(messages[-1]) if messages else after
+    return messages, older, newer
+
+
 class ConversationListAPIView(APIView):
     """
     Retrieve a list of all conversations for the authenticated user.
@@ -22,10 +59,17 @@ class ConversationListAPIView(APIView):
         responses={200: conversation_list_response_schema, 401: "Unauthorized"},
     )
     def get(self, request):
-        conversations = request.user.conversations.all().order_by('-modified_at')
+        # Unread counters come from the user's read states in the same query
+        unread_count = (ConversationReadState.objects
+                        .filter(conversation=OuterRef('pk'), user=request.user)
+                        .values('unread_count')[:1])
+        conversations = (request.user.conversations
+                         .annotate(unread_count=Coalesce(Subquery(unread_count), Value(0)))
+                         .prefetch_related('users')
+                         .order_by('-modified_at'))
         serializer = ConversationDynamicSerializer(
             conversations,
-            fields=['id', 'users', 'modified_at', 'has_unread_messages'],
+            fields=['id', 'users', 'modified_at', 'has_unread_messages', 'unread_count'],
             many=True,
             context={'request': request},
         )
@@ -34,31 +78,58 @@ class ConversationListAPIView(APIView):
 
 class ConversationDetailAPIView(APIView):
     """
-    Retrieve details of a specific conversation, including all messages.
+    Retrieve details of a specific conversation with one page of its messages.
     """
     @swagger_auto_schema(
         operation_summary="Retrieve Conversation Details",
-        operation_description="Retrieve details of a specific conversation, including all messages.",
-        responses={200: conversation_detail_response_schema, 404: "Conversation Not Found"},
+        operation_description=(
+            "Retrieve details of a specific conversation with its latest messages, oldest first. "
+            "Pass the returned `before` cursor to load older messages and `after` to load newer ones."
+        ),
+        manual_parameters=[
+            openapi.Parameter("before", openapi.IN_QUERY, description="Cursor: messages older than this one.", type=openapi.TYPE_STRING),
+            openapi.Parameter("after", openapi.IN_QUERY, description="Cursor: messages newer than this one.", type=openapi.TYPE_STRING),
+            openapi.Parameter("page_size", openapi.IN_QUERY, description=f"Messages per page (default {MESSAGES_PAGE_SIZE}, max {MESSAGES_MAX_PAGE_SIZE}).", type=openapi.TYPE_INTEGER),
+        ],
+        responses={200: conversation_detail_response_schema, 400: "Invalid Cursor", 404: "Conversation Not Found"},
     )
     def get(self, request, pk):
+        before = request.GET.get('before')
+        after = request.GET.get('after')
+        if before and after:
+            return JsonResponse({'error': 'Pass either before or after, not both'}, status=400)
+        try:
+            page_size = min(int(request.GET.get('page_size', MESSAGES_PAGE_SIZE)), MESSAGES_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'page_size must be an integer'}, status=400)
+        if page_size < 1:
+            return JsonResponse({'error': 'page_size must be positive'}, status=400)
+
         conversation = get_object_or_404(request.user.conversations, pk=pk)
         user = request.user
 
-        # Mark messages as read by the user
-        conversation.messages.exclude(read_by=user).update()
-        for msg in conversation.messages.exclude(read_by=user):
-            msg.read_by.add(user)
+        # Opening the conversation marks everything in it read
+        if ConversationReadState.mark_read(conversation, user):
+            # Updates the badge in the user's other tabs and devices; anything that
+            # arrived while marking read is still counted
+            unread_count = (ConversationReadState.objects
+                            .filter(conversation=conversation, user=user)
+                            .values_list('unread_count', flat=True).get())
+            publish_unread_counts_sync({(conversation.id, user.pk): unread_count})
 
         conversation_serializer = ConversationDynamicSerializer(
             conversation, fields=['id', 'users', 'modified_at'], many=False
         )
-        messages_serializer = ConversationMessageSerializer(
-            conversation.messages.all(), many=True
-        )
+        try:
+            messages, older, newer = message_page(conversation, before, after, page_size)
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        messages_serializer = ConversationMessageSerializer(messages, many=True)
         return JsonResponse({
             'conversation': conversation_serializer.data,
             'messages': messages_serializer.data,
+            'before': older,
+            'after': newer,
         }, safe=False)
 
 
@@ -79,13 +150,9 @@ class ConversationStartAPIView(APIView):
         responses={200: conversation_start_response_schema, 404: "User Not Found"},
     )
     def get(self, request, user_id):
-        # Check if a conversation already exists
-        conversation = Conversation.objects.filter(users__in=[user_id]).filter(users__in=[request.user.id]).first()
-        if conversation:
-            return JsonResponse({'success': True, 'conversation_id': conversation.id}, safe=False)
-
-        # Create a new conversation
-        user = get_object_or_404(User, pk=user_id)
-        conversation = Conversation.objects.create()
-        conversation.users.add(request.user, user)
+        # Usually the conversation already exists, found without loading the other user
+        conversation = Conversation.objects.filter(participants_key=Conversation.pair_key(request.user.id, user_id)).first()
+        if conversation is None:
+            user = get_object_or_404(User, pk=user_id)
+            conversation, _ = Conversation.get_or_create_for_pair(request.user, user)
         return JsonResponse({'success': True, 'conversation_id': conversation.id}, safe=False)
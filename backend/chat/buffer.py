@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from .models import Conversation, ConversationMessage
+from .unread import count_new_messages, publish_unread_counts
+
+logger = logging.getLogger(__name__)
+
+# A batch is written FLUSH_INTERVAL seconds after its first message, or as soon
+# as it reaches FLUSH_SIZE messages, whichever comes first
+FLUSH_INTERVAL = 0.05
+FLUSH_SIZE = 500
+
+
+class MessageBuffer:
+    """
+    Per-process write-behind buffer for chat messages.
+
+    Consumers submit messages instead of saving them one by one; the buffer
+    writes everything submitted by every consumer in the process with a single
+    bulk_create, and bumps Conversation.modified_at and the recipients' unread
+    counters once per conversation in the batch. One batch is written at a time, so messages reach the database
+    in the order they were submitted.
+
+    A message is durable only once its future resolves; until then it lives in
+    process memory, which is why consumers acknowledge saved messages to the
+    sender.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = []
+        self._timer = None
+        self._flushing = None
+
+    def submit(self, conversation_id, body, sent_to_id, created_by_id):
+        """
+        Queue a message for the next batch. Returns a future that resolves to
+        the saved ConversationMessage, or raises if its batch failed.
+        """
+        loop = asyncio.get_running_loop()
+        message = ConversationMessage(
+            conversation_id=conversation_id,
+            body=body,
+            sent_to_id=sent_to_id,
+            created_by_id=created_by_id,
+        )
+        future = loop.create_future()
+        self._pending.append((message, future))
+        if len(self._pending) >= self.flush_size:
+            self._flush_soon(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush_soon, loop)
+        return future
+
+    async def flush(self):
+        """Write everything submitted so far; waits for a batch already in flight first."""
+        while self._flushing is not None:
+            await self._flushing
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        self._flushing = asyncio.get_running_loop().create_future()
+        try:
+            unread_counts, errors = await database_sync_to_async(self._write)([message for message, _ in batch])
+        except Exception as e:
+            logger.error(f"Failed to save {len(batch)} chat messages: {e}")
+            unread_counts, errors = {}, dict.fromkeys(range(len(batch)), e)
+        try:
+            for index, (message, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if index in errors:
+                    future.set_exception(errors[index])
+                else:
+                    future.set_result(message)
+            await publish_unread_counts(unread_counts)
+        finally:
+            flushing, self._flushing = self._flushing, None
+            flushing.set_result(None)
+
+    def _flush_soon(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        loop.create_task(self.flush())
+
+    @classmethod
+    def _write(cls, messages):
+        """
+        Save a batch; returns (unread_counts, errors by index in the batch).
+        If the batch insert fails, each message is retried on its own so one
+        bad message only fails its own future.
+        """
+        try:
+            return cls._write_batch(messages), {}
+        except DatabaseError as e:
+            logger.warning(f"Batch of {len(messages)} chat messages failed ({e}), saving them one by one")
+        unread_counts, errors = {}, {}
+        for index, message in enumerate(messages):
+            try:
+                unread_counts.update(cls._write_batch([message]))
+            except DatabaseError as e:
+                logger.error(f"Failed to save chat message to conversation {message.conversation_id}: {e}")
+                errors[index] = e
+        return unread_counts, errors
+
+    @staticmethod
+    def _write_batch(messages):
+        with transaction.atomic():
+            ConversationMessage.objects.bulk_create(messages)
+            conversation_ids = {message.conversation_id for message in messages}
+            Conversation.objects.filter(pk__in=conversation_ids).update(modified_at=timezone.now())
+            return count_new_messages(messages)
+
+message_buffer = MessageBuffer()
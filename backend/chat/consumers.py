@@ -1,7 +1,11 @@
+import asyncio
 import json
-from asgiref.sync import sync_to_async
+import uuid
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from .models import ConversationMessage
+from .buffer import message_buffer
+from .models import Conversation
+from .unread import user_group
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,9 +16,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'chat_{self.room_name}'
 
         token = self.scope.get('query_string', '').decode()
-        if not token:
+        user = self.scope.get('user')
+        if not token or user is None or not user.is_authenticated:
             await self.close(code=403)
             return
+        # conversation id -> its participants' ids, for the conversations this user may post to
+        self.participants = {}
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -64,6 +71,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 return await self.send(text_data=json.dumps({
                     'error': 'sent_to_id, name, and body are required for chat_message'
                 }))
+            participants = await self.conversation_participants(conversation_id)
+            if participants is None or str(sent_to_id) not in participants:
+                # Rejected here so a bad frame never reaches the shared write batch
+                return await self.send(text_data=json.dumps({
+                    'event': 'chat_message_failed',
+                    'data': {'conversation_id': conversation_id, 'client_id': data['data'].get('client_id')},
+                    'error': 'Unknown conversation or recipient',
+                }))
 
             await self.channel_layer.group_send(
                 self.room_group_name,
@@ -73,7 +88,26 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'name': name,
                 }
             )
-            await self.save_message(conversation_id, body, sent_to_id)
+            # Saved in the next batch; receive moves on without waiting for the database
+            saved = message_buffer.submit(conversation_id, body, sent_to_id, self.scope['user'].pk)
+            asyncio.ensure_future(self.acknowledge(saved, conversation_id, data['data'].get('client_id')))
+
+    async def conversation_participants(self, conversation_id):
+        """Participant ids of the conversation if the signed-in user is one of them, else None."""
+        key = str(conversation_id)
+        if key not in self.participants:
+            try:
+                conversation_uuid = uuid.UUID(key)
+            except ValueError:
+                return None
+            participants = await database_sync_to_async(
+                lambda: {str(user_id) for user_id in Conversation.users.through.objects
+                         .filter(conversation_id=conversation_uuid).values_list('user_id', flat=True)}
+            )()
+            if str(self.scope['user'].pk) not in participants:
+                return None
+            self.participants[key] = participants
+        return self.participants[key]
 
     async def chat_typing(self, event):
         name = event['name']
@@ -99,13 +133,51 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }
         }))
 
-    @sync_to_async
-    def save_message(self, conversation_id, body, sent_to_id):
-        user = self.scope['user']
-        logger.info(f"Saving message: user={user}, conversation_id={conversation_id}, body={body}, sent_to_id={sent_to_id}")
-        return ConversationMessage.objects.create(
-            conversation_id=conversation_id,
-            body=body,
-            sent_to_id=sent_to_id,
-            created_by=user
-        )
+    async def acknowledge(self, saved, conversation_id, client_id):
+        """Tell the sender once their message is durable; client_id lets them match it to what they sent."""
+        try:
+            message = await saved
+        except Exception:
+            await self.send(text_data=json.dumps({
+                'event': 'chat_message_failed',
+                'data': {'conversation_id': conversation_id, 'client_id': client_id},
+            }))
+            return
+        await self.send(text_data=json.dumps({
+            'event': 'chat_message_saved',
+            'data': {
+                'id': str(message.id),
+                'conversation_id': conversation_id,
+                'client_id': client_id,
+                'created_at': message.created_at.isoformat(),
+            },
+        }))
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    One socket per signed-in user for inbox updates, so the conversation list
+    can stay current without polling. Sends 'unread_count' events whenever a
+    counter changes, see chat.unread.
+    """
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=403)
+            return
+        self.user_group_name = user_group(user.pk)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'user_group_name'):
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+
+    async def unread_count(self, event):
+        await self.send(text_data=json.dumps({
+            'event': 'unread_count',
+            'data': {
+                'conversation_id': event['conversation_id'],
+                'unread_count': event['unread_count'],
+            }
+        }))
@@ -0,0 +1,109 @@
+import asyncio
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from unittest.mock import patch
+
+from chat.buffer import MessageBuffer
+from chat.models import Conversation, ConversationMessage
+from chat.routing import websocket_urlpatterns
+from chat.unread import count_new_messages
+from useraccounts.models import User
+
+
+class DirectSaver:
+    """The pre-buffer write path: one create per message, each on its own thread-pool hop."""
+
+    def submit(self, conversation_id, body, sent_to_id, created_by_id):
+        return asyncio.ensure_future(database_sync_to_async(self._save)(
+            conversation_id=conversation_id, body=body, sent_to_id=sent_to_id, created_by_id=created_by_id,
+        ))
+
+    @staticmethod
+    def _save(**fields):
+        # Same per-message work as the buffer, unread counters included
+        message = ConversationMessage.objects.create(**fields)
+        count_new_messages([message])
+        return message
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many in-process chat sockets, send messages on all of them at once and report how many "
+        "messages per second get saved and acknowledged. Failed sends are reported separately. "
+        "Seeded rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=1000)
+        parser.add_argument('--messages', type=int, default=10, help='Messages sent on each socket.')
+        parser.add_argument('--mode', choices=['buffered', 'direct'], default='buffered')
+
+    def handle(self, *args, **options):
+        in_memory = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 100_000}}}
+        saver = MessageBuffer() if options['mode'] == 'buffered' else DirectSaver()
+        with override_settings(CHANNEL_LAYERS=in_memory), patch('chat.consumers.message_buffer', saver), \
+                transaction.atomic():
+            users, conversations = self.seed(options['sockets'])
+            elapsed, failed = async_to_sync(self.run)(users, conversations, options['messages'])
+            saved = ConversationMessage.objects.filter(conversation__in=conversations).count()
+            transaction.set_rollback(True)
+
+        total = options['sockets'] * options['messages']
+        # Only messages confirmed saved count towards the rate
+        self.stdout.write(
+            f"mode={options['mode']}  sockets={options['sockets']}  messages={total}  saved={saved}  "
+            f"failed={failed}  elapsed={elapsed:.2f}s  rate={(total - failed) / elapsed:,.0f} msg/s"
+        )
+
+    def seed(self, count):
+        """One sender per socket, each chatting with their own recipient, so every message bumps an unread counter."""
+        users = User.objects.bulk_create([
+            User(id=uuid.uuid4(), email=f'chat-bench-{uuid.uuid4().hex}@example.com', name=f'Chat {index}')
+            for index in range(2 * count)
+        ])
+        conversations = Conversation.objects.bulk_create([Conversation() for _ in range(count)])
+        Through = Conversation.users.through
+        Through.objects.bulk_create([
+            Through(conversation=conversation, user=user)
+            for index, conversation in enumerate(conversations)
+            for user in users[2 * index:2 * index + 2]
+        ])
+        return [(users[2 * index], users[2 * index + 1]) for index in range(count)], conversations
+
+    async def run(self, users, conversations, messages):
+        communicators = []
+        for (sender, recipient), conversation in zip(users, conversations):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/{conversation.id}/?token=x')
+            communicator.scope['user'] = sender
+            await communicator.connect()
+            communicators.append((communicator, sender, recipient, conversation))
+
+        async def chat(communicator, sender, recipient, conversation):
+            for number in range(messages):
+                await communicator.send_json_to({'event': 'chat_message', 'data': {
+                    'name': sender.name, 'body': f'Benchmark message {number}', 'sent_to_id': str(recipient.pk),
+                    'conversation_id': str(conversation.id), 'client_id': number,
+                }})
+            acknowledged = failed = 0
+            while acknowledged + failed < messages:
+                event = await communicator.receive_json_from(timeout=120)
+                if event['event'] == 'chat_message_saved':
+                    acknowledged += 1
+                elif event['event'] == 'chat_message_failed':
+                    failed += 1
+            return failed
+
+        started = time.perf_counter()
+        failed = await asyncio.gather(*(chat(*item) for item in communicators))
+        elapsed = time.perf_counter() - started
+        for communicator, *_ in communicators:
+            await communicator.disconnect()
+        return elapsed, sum(failed)
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_read_states(apps, schema_editor):
+    # Opening a conversation marked everything in it read, so the newest
+    # message a user had read is where their watermark stands
+    ReadBy = apps.get_model('chat', 'ConversationMessage').read_by.through
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    watermarks = (ReadBy.objects
+                  .values('conversationmessage__conversation_id', 'user_id')
+                  .annotate(last_read_at=Max('conversationmessage__created_at')))
+    ConversationReadState.objects.bulk_create([
+        ConversationReadState(
+            conversation_id=row['conversationmessage__conversation_id'],
+            user_id=row['user_id'],
+            last_read_at=row['last_read_at'],
+        )
+        for row in watermarks.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_lookup_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationReadState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_at', models.DateTimeField()),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='read_states', to='chat.conversation')),
+                ('last_read_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.conversationmessage')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_read_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('conversation', 'user'), name='read_state_conversation_user')],
+            },
+        ),
+        migrations.RunPython(backfill_read_states, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='conversationmessage',
+            name='read_by',
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counts(apps, schema_editor):
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMessage = apps.get_model('chat', 'ConversationMessage')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+    # Every participant gets a counter, including those who never opened the conversation
+    ConversationReadState.objects.bulk_create([
+        ConversationReadState(conversation_id=conversation_id, user_id=user_id)
+        for conversation_id, user_id in Conversation.users.through.objects.values_list('conversation_id', 'user_id')
+    ], batch_size=1000, ignore_conflicts=True)
+
+    def unread(since_watermark):
+        messages = (ConversationMessage.objects
+                    .filter(conversation=OuterRef('conversation'))
+                    .exclude(created_by=OuterRef('user')))
+        if since_watermark:
+            messages = messages.filter(created_at__gt=OuterRef('last_read_at'))
+        count = messages.order_by().values('conversation').annotate(count=Count('id')).values('count')
+        return Coalesce(Subquery(count), Value(0))
+
+    ConversationReadState.objects.filter(last_read_at__isnull=False).update(unread_count=unread(True))
+    ConversationReadState.objects.filter(last_read_at__isnull=True).update(unread_count=unread(False))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_read_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationreadstate',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='conversationreadstate',
+            name='last_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:13
+
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_conversations(apps, schema_editor):
+    """
+    Give every two-person conversation its participants_key. Pairs that ended
+    up with several conversations are merged into the oldest one: messages
+    move over, read watermarks keep the furthest point read, and unread
+    counters are recounted.
+    """
+    Conversation = apps.get_model('chat', 'Conversation')
+    ConversationMessage = apps.get_model('chat', 'ConversationMessage')
+    ConversationReadState = apps.get_model('chat', 'ConversationReadState')
+
+    participants = defaultdict(list)
+    for conversation_id, user_id in Conversation.users.through.objects.values_list('conversation_id', 'user_id'):
+        participants[conversation_id].append(user_id)
+    by_pair = defaultdict(list)
+    for conversation in Conversation.objects.filter(pk__in=participants).order_by('created', 'id'):
+        users = participants[conversation.id]
+        if len(users) == 2:
+            by_pair[':'.join(sorted(str(user_id) for user_id in users))].append(conversation)
+
+    canonical = []
+    for key, conversations in by_pair.items():
+        keep, duplicates = conversations[0], conversations[1:]
+        keep.participants_key = key
+        canonical.append(keep)
+        if not duplicates:
+            continue
+        duplicate_ids = [conversation.id for conversation in duplicates]
+        ConversationMessage.objects.filter(conversation_id__in=duplicate_ids).update(conversation_id=keep.id)
+        watermarks = (ConversationReadState.objects
+                      .filter(conversation_id__in=[keep.id, *duplicate_ids], last_read_at__isnull=False)
+                      .values('user_id')
+                      .annotate(last_read_at=Max('last_read_at')))
+        last_read = {row['user_id']: row['last_read_at'] for row in watermarks}
+        ConversationReadState.objects.filter(conversation_id__in=duplicate_ids).delete()
+        for user_id in participants[keep.id]:
+            ConversationReadState.objects.update_or_create(
+                conversation_id=keep.id, user_id=user_id,
+                defaults={'last_read_at': last_read.get(user_id), 'last_read_message': None},
+            )
+        keep.modified_at = max(conversation.modified_at for conversation in conversations)
+        Conversation.objects.filter(pk__in=duplicate_ids).delete()
+
+        for since_watermark in (True, False):
+            messages = (ConversationMessage.objects
+                        .filter(conversation=OuterRef('conversation'))
+                        .exclude(created_by=OuterRef('user')))
+            if since_watermark:
+                messages = messages.filter(created_at__gt=OuterRef('last_read_at'))
+            count = messages.order_by().values('conversation').annotate(count=Count('id')).values('count')
+            (ConversationReadState.objects
+             .filter(conversation_id=keep.id, last_read_at__isnull=not since_watermark)
+             .update(unread_count=Coalesce(Subquery(count), Value(0))))
+
+    # bulk_update leaves modified_at alone, unlike save() with auto_now
+    Conversation.objects.bulk_update(canonical, ['participants_key', 'modified_at'], batch_size=1000)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_unread_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='participants_key',
+            field=models.CharField(blank=True, editable=False, max_length=80, null=True, unique=True),
+        ),
+        migrations.RunPython(merge_duplicate_conversations, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 import uuid
-from django.db import models
+from datetime import datetime, timezone
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from useraccounts.models import User
 
 class Conversation(models.Model):
@@ -8,13 +11,104 @@ class Conversation(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
     has_unread_messages = models.BooleanField(default=False)
+    # Sorted ids of the two participants; unique, so a pair has exactly one conversation
+    participants_key = models.CharField(max_length=80, unique=True, null=True, blank=True, editable=False)
+
+    @staticmethod
+    def pair_key(user_id, other_user_id):
+        return ':'.join(sorted([str(user_id), str(other_user_id)]))
+
+    @classmethod
+    def get_or_create_for_pair(cls, user, other_user):
+        """
+        The conversation between two users, created on first contact. Looked up
+        by participants_key, a single indexed equality; when two requests race
+        to create it, the unique index rejects the loser, which then reads the
+        winner's conversation. Returns (conversation, created).
+        """
+        key = cls.pair_key(user.pk, other_user.pk)
+        conversation = cls.objects.filter(participants_key=key).first()
+        if conversation:
+            return conversation, False
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(participants_key=key)
+                conversation.users.add(user, other_user)
+        except IntegrityError:
+            return cls.objects.get(participants_key=key), False
+        return conversation, True
 
 
 class ConversationMessage(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     body = models.TextField()
-    read_by = models.ManyToManyField(User, related_name="read_messages", blank=True)
     sent_to = models.ForeignKey(User, related_name='received_messages', on_delete=models.CASCADE)
     created_by = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A conversation's messages in the order they were sent
+            models.Index(fields=['conversation', 'created_at'], name='message_conversation_created'),
+        ]
+
+
+# Stands in for a watermark that was never set: everything is after it
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class ConversationReadState(models.Model):
+    """
+    How far a participant has read a conversation: every message created up to
+    last_read_at counts as read. Replaces a read receipt per message, so
+    marking a whole backlog read is a single upsert of this row.
+
+    unread_count is maintained alongside it, see chat.unread, so the inbox
+    never has to count messages. Rows without last_read_at belong to
+    participants who have been sent messages but never opened the conversation.
+    """
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='read_states')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_read_states')
+    last_read_at = models.DateTimeField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
+    last_read_message = models.ForeignKey(ConversationMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'], name='read_state_conversation_user'),
+        ]
+
+    @classmethod
+    def mark_read(cls, conversation, user):
+        """
+        Move the user's watermark up to the newest message in the conversation and
+        take the messages it passes off unread_count. The counter is lowered rather
+        than reset, so a message counted while this runs stays unread. Two queries
+        whatever the backlog; returns whether there was anything unread to clear.
+        """
+        state = cls.objects.filter(conversation=OuterRef('conversation'), user=user)
+        newest = (conversation.messages.order_by('-created_at', '-id')
+                  .annotate(unread_count=Subquery(state.values('unread_count')[:1]))
+                  .values_list('id', 'created_at', 'unread_count').first())
+        if newest is None:
+            return False
+        message_id, created_at, unread_count = newest
+        if unread_count is None:
+            # Nothing was ever counted for this user, so there is nothing to take off
+            cls.objects.bulk_create(
+                [cls(conversation=conversation, user=user, last_read_at=created_at, last_read_message_id=message_id)],
+                ignore_conflicts=True,
+            )
+            return False
+        passed = (ConversationMessage.objects
+                  .filter(conversation=OuterRef('conversation'), created_at__lte=created_at,
+                          created_at__gt=Coalesce(OuterRef('last_read_at'), Value(EPOCH)))
+                  .exclude(created_by=user)
+                  .order_by().values('conversation').annotate(count=Count('id')).values('count'))
+        updated = (cls.objects
+                   .filter(conversation=conversation, user=user)
+                   .filter(Q(last_read_at__isnull=True) | Q(last_read_at__lt=created_at))
+                   .update(last_read_at=created_at, last_read_message_id=message_id,
+                           unread_count=Greatest(F('unread_count') - Coalesce(Subquery(passed), 0), 0)))
+        return bool(updated) and unread_count > 0
@@ -4,6 +4,7 @@ from useraccounts.serializers import UserModelDynamicSerializer
 
 class ConversationDynamicSerializer(serializers.ModelSerializer):
     has_unread_messages = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True, default=0)
     users = UserModelDynamicSerializer(fields=['id', 'name', 'avatar_url'], many=True, read_only=True)
 
     def __init__(self, *args, **kwargs):
@@ -18,12 +19,9 @@ class ConversationDynamicSerializer(serializers.ModelSerializer):
 
     def get_has_unread_messages(self, obj):
         """
-        Only include the `has_unread_messages` field when it's needed.
+        Derived from the `unread_count` annotation the conversation list adds.
         """
-        if 'request' in self.context:
-            user = self.context['request'].user
-            return obj.messages.exclude(read_by=user).exists()
-        return False
+        return getattr(obj, 'unread_count', 0) > 0
 
     class Meta:
         model = Conversation
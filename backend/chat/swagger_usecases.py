@@ -11,7 +11,9 @@ conversation_list_response_schema = openapi.Response(
                     {"id": 1, "name": "John Doe", "email": "john@example.com"},
                     {"id": 2, "name": "Jane Smith", "email": "jane@example.com"}
                 ],
-                "modified_at": "2024-01-01T12:00:00Z"
+                "modified_at": "2024-01-01T12:00:00Z",
+                "has_unread_messages": True,
+                "unread_count": 3
             },
         ]
     }
@@ -37,7 +39,9 @@ conversation_detail_response_schema = openapi.Response(
                     "sent_to": {"id": 2, "name": "Jane Smith", "email": "jane@example.com"},
                     "created_by": {"id": 1, "name": "John Doe", "email": "john@example.com"}
                 }
-            ]
+            ],
+            "before": "WyIyMDI0LTAxLTAxVDEyOjAwOjAwKzAwOjAwIiwgIjFhM2U1YzFkIl0",
+            "after": "WyIyMDI0LTAxLTAxVDEyOjAwOjAwKzAwOjAwIiwgIjFhM2U1YzFkIl0"
         }
     }
 )
@@ -0,0 +1,313 @@
+import json
+import pytest
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError, connection
+from django.test import override_settings
+from rest_framework import status
+from helpers.pagination import encode_cursor
+from useraccounts.models import User
+from .buffer import MessageBuffer
+from .models import Conversation, ConversationMessage, ConversationReadState
+from .routing import websocket_urlpatterns
+from .unread import count_new_messages
+
+
+@pytest.mark.django_db
+def test_conversation_detail_query_plans(api_client, query_plans):
+    users = User.objects.bulk_create([User(email=f"user{n}@test.com", name=f"User {n}") for n in range(100)])
+    conversations = Conversation.objects.bulk_create([Conversation() for _ in range(100)])
+    Through = Conversation.users.through
+    Through.objects.bulk_create([
+        Through(conversation=conversation, user=user)
+        for n, conversation in enumerate(conversations)
+        for user in (users[n], users[(n + 1) % 100])
+    ])
+    messages = ConversationMessage.objects.bulk_create([
+        ConversationMessage(conversation=conversation, body=f"Message {m}", created_by=users[n],
+                            sent_to=users[(n + 1) % 100])
+        for n, conversation in enumerate(conversations)
+        for m in range(50)
+    ])
+    ConversationReadState.objects.bulk_create([
+        ConversationReadState(conversation=message.conversation, user=message.sent_to,
+                              last_read_at=message.created_at, last_read_message=message)
+        for message in messages[25::50]
+    ])
+
+    api_client.force_authenticate(user=users[1])
+    with query_plans() as plans:
+        response = api_client.get(f"/api/chat/{conversations[0].id}/")
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["messages"]) == 50
+    assert plans.sequential_scans() == []
+
+
+@pytest.mark.django_db
+def test_conversation_messages_are_cursor_paginated(api_client, django_assert_max_num_queries):
+    users = User.objects.bulk_create([User(email=f"user{n}@test.com", name=f"User {n}") for n in range(2)])
+    conversation = Conversation.objects.create()
+    conversation.users.add(*users)
+    # Written in one batch, so many messages share a millisecond
+    messages = ConversationMessage.objects.bulk_create([
+        ConversationMessage(conversation=conversation, body=f"Message {n}", created_by=users[n % 2],
+                            sent_to=users[(n + 1) % 2])
+        for n in range(120)
+    ])
+    api_client.force_authenticate(user=users[0])
+    url = f"/api/chat/{conversation.id}/"
+
+    with django_assert_max_num_queries(8):
+        latest = api_client.get(url).json()
+    assert [m["body"] for m in latest["messages"]] == [f"Message {n}" for n in range(70, 120)]
+
+    bodies = [m["body"] for m in latest["messages"]]
+    page = latest
+    while page["before"]:
+        page = api_client.get(url, {"before": page["before"]}).json()
+        bodies = [m["body"] for m in page["messages"]] + bodies
+    assert bodies == [f"Message {n}" for n in range(120)]
+    # The oldest page still points forward, and the newest has nothing after it yet
+    forward = api_client.get(url, {"after": page["after"], "page_size": 100}).json()
+    assert [m["body"] for m in forward["messages"]] == [f"Message {n}" for n in range(20, 120)]
+    newer = api_client.get(url, {"after": latest["after"]}).json()
+    assert newer["messages"] == [] and newer["after"] == latest["after"]
+
+    assert api_client.get(url, {"before": "not-a-cursor"}).status_code == status.HTTP_400_BAD_REQUEST
+    for cursor in ("before", "after"):
+        response = api_client.get(url, {cursor: encode_cursor(["notadate", "nope"])})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert api_client.get(url, {"before": page["after"], "after": page["after"]}).status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+def test_opening_a_conversation_marks_the_backlog_read_in_bulk(api_client, django_assert_num_queries):
+    guest, host = User.objects.bulk_create([User(email="guest@test.com", name="Guest"), User(email="host@test.com", name="Host")])
+    conversation = Conversation.objects.create()
+    conversation.users.add(guest, host)
+    messages = ConversationMessage.objects.bulk_create([
+        ConversationMessage(conversation=conversation, body=f"Message {n}", created_by=host, sent_to=guest)
+        for n in range(5000)
+    ])
+    newest = max(messages, key=lambda message: (message.created_at, message.id))
+
+    with django_assert_num_queries(2):
+        ConversationReadState.mark_read(conversation, guest)
+    state = ConversationReadState.objects.get(conversation=conversation, user=guest)
+    assert (state.last_read_at, state.last_read_message_id) == (newest.created_at, newest.id)
+
+    def has_unread(user):
+        api_client.force_authenticate(user=user)
+        return api_client.get("/api/chat/").json()[0]["has_unread_messages"]
+
+    # The host never opened it, but their own messages do not count as unread
+    assert has_unread(guest) is False and has_unread(host) is False
+    count_new_messages([ConversationMessage.objects.create(conversation=conversation, body="One more",
+                                                           created_by=host, sent_to=guest)])
+    assert has_unread(guest) is True
+    api_client.get(f"/api/chat/{conversation.id}/")
+    assert has_unread(guest) is False
+
+
+@pytest.mark.django_db
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+def test_marking_read_keeps_messages_counted_meanwhile(api_client):
+    guest, host = User.objects.bulk_create([User(email="guest@test.com", name="Guest"), User(email="host@test.com", name="Host")])
+    conversation = Conversation.objects.create()
+    conversation.users.add(guest, host)
+
+    def send(body):
+        count_new_messages([ConversationMessage.objects.create(conversation=conversation, body=body,
+                                                               created_by=host, sent_to=guest)])
+
+    for n in range(3):
+        send(f"Message {n}")
+    raced = []
+
+    def message_arrives_first(execute, sql, params, many, context):
+        # Another message is saved and counted after mark_read picked its watermark
+        if not raced and sql.startswith('UPDATE "chat_conversationreadstate"'):
+            raced.append(True)
+            send("Meanwhile")
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(message_arrives_first):
+        assert ConversationReadState.mark_read(conversation, guest) is True
+    assert raced
+    assert ConversationReadState.objects.get(conversation=conversation, user=guest).unread_count == 1
+
+    api_client.force_authenticate(user=guest)
+    with patch("chat.api.publish_unread_counts_sync") as publish:
+        api_client.get(f"/api/chat/{conversation.id}/")
+        api_client.get(f"/api/chat/{conversation.id}/")
+    # Only the first visit had anything to clear
+    publish.assert_called_once_with({(conversation.id, guest.pk): 0})
+
+
+def chat_exchange(user, conversation, bodies):
+    """Send chat messages over a websocket as `user`; returns every event the sender got back."""
+    async def run():
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/{conversation.id}/?token=x")
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        assert connected
+        for number, body in enumerate(bodies):
+            await communicator.send_json_to({"event": "chat_message", "data": {
+                "name": user.name, "body": body, "sent_to_id": str(user.pk),
+                "conversation_id": str(conversation.id), "client_id": number,
+            }})
+        # A broadcast plus an acknowledgement per message
+        events = [await communicator.receive_json_from(timeout=5) for _ in range(2 * len(bodies))]
+        await communicator.disconnect()
+        return events
+    return async_to_sync(run)()
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+def test_chat_messages_are_written_behind_in_batches():
+    user = User.objects.create(email="user@test.com", name="User")
+    conversation = Conversation.objects.create()
+    conversation.users.add(user)
+    before = conversation.modified_at
+    buffer = MessageBuffer(flush_interval=0.05)
+
+    with patch("chat.consumers.message_buffer", buffer), \
+            patch.object(MessageBuffer, "_write_batch", wraps=MessageBuffer._write_batch) as write:
+        events = chat_exchange(user, conversation, [f"Message {n}" for n in range(5)])
+
+    acks = [event["data"] for event in events if event["event"] == "chat_message_saved"]
+    assert sorted(ack["client_id"] for ack in acks) == list(range(5))
+    # Every message went out in a single bulk write
+    assert write.call_count == 1
+    saved = ConversationMessage.objects.filter(conversation=conversation)
+    assert {str(message.id) for message in saved} == {ack["id"] for ack in acks}
+    conversation.refresh_from_db()
+    assert conversation.modified_at > before
+
+    with patch("chat.consumers.message_buffer", buffer), \
+            patch.object(MessageBuffer, "_write", side_effect=RuntimeError("database is down")):
+        events = chat_exchange(user, conversation, ["Lost"])
+    assert [event["event"] for event in events if event["event"] != "chat_message"] == ["chat_message_failed"]
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+def test_bad_chat_messages_only_fail_their_own_sender():
+    user, stranger = User.objects.bulk_create([User(email=f"{name}@test.com", name=name) for name in ("user", "stranger")])
+    conversation, elsewhere = Conversation.objects.create(), Conversation.objects.create()
+    conversation.users.add(user)
+    elsewhere.users.add(stranger)
+
+    async def run():
+        anonymous = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/{conversation.id}/?token=x")
+        anonymous.scope["user"] = AnonymousUser()
+        connected, _ = await anonymous.connect()
+        assert not connected
+
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/{conversation.id}/?token=x")
+        communicator.scope["user"] = user
+        await communicator.connect()
+        for number, conversation_id in enumerate([elsewhere.id, "not-a-uuid", None]):
+            await communicator.send_json_to({"event": "chat_message", "data": {
+                "name": user.name, "body": "Hi", "sent_to_id": str(user.pk),
+                "conversation_id": str(conversation_id), "client_id": number,
+            }})
+            reply = await communicator.receive_json_from(timeout=5)
+            assert (reply["event"], reply["data"]["client_id"]) == ("chat_message_failed", number)
+        # Rejected before the broadcast, too
+        assert await communicator.receive_nothing()
+        await communicator.disconnect()
+
+        # A message that still fails in the database takes only itself down
+        buffer = MessageBuffer()
+        good = buffer.submit(conversation.id, "Fine", user.pk, user.pk)
+        bad = buffer.submit(None, "Broken", user.pk, user.pk)
+        await buffer.flush()
+        return await good, bad.exception()
+
+    good, error = async_to_sync(run)()
+    assert isinstance(error, IntegrityError)
+    assert list(ConversationMessage.objects.values_list("id", "body")) == [(good.id, "Fine")]
+
+
+@pytest.mark.django_db(transaction=True)
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+def test_unread_counters_are_maintained_and_pushed(api_client, django_assert_num_queries):
+    guest, host, other = User.objects.bulk_create([
+        User(email=f"{name}@test.com", name=name) for name in ("guest", "host", "other")
+    ])
+    conversations = Conversation.objects.bulk_create([Conversation() for _ in range(5)])
+    for conversation in conversations:
+        conversation.users.add(guest, host)
+    quiet = Conversation.objects.create()
+    quiet.users.add(guest, other)
+
+    async def run():
+        inbox = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/notifications/?token=x")
+        inbox.scope["user"] = guest
+        connected, _ = await inbox.connect()
+        assert connected
+        buffer = MessageBuffer()
+        saved = [
+            buffer.submit(conversation.id, f"Hello {n}", guest.pk, host.pk)
+            for conversation in conversations[:2] for n in range(3)
+        ] + [buffer.submit(conversations[0].id, "Reply", host.pk, guest.pk)]
+        await buffer.flush()
+        for future in saved:
+            await future
+        events = [await inbox.receive_json_from(timeout=5) for _ in range(2)]
+        assert await inbox.receive_nothing()
+        await inbox.disconnect()
+        return events
+
+    with patch("chat.consumers.message_buffer", MessageBuffer()):
+        events = async_to_sync(run)()
+    # The guest was told about both conversations; the host's own messages never count for them
+    assert sorted((event["data"]["conversation_id"], event["data"]["unread_count"]) for event in events) == sorted(
+        (str(conversation.id), 3) for conversation in conversations[:2]
+    )
+    assert ConversationReadState.objects.get(conversation=conversations[0], user=host).unread_count == 1
+
+    api_client.force_authenticate(user=guest)
+    # The conversations with their counters, then their users: nothing per conversation
+    with django_assert_num_queries(2):
+        inbox = api_client.get("/api/chat/").json()
+    counts = {row["id"]: (row["unread_count"], row["has_unread_messages"]) for row in inbox}
+    assert counts[str(conversations[0].id)] == (3, True)
+    assert counts[str(conversations[4].id)] == (0, False)
+    assert counts[str(quiet.id)] == (0, False)
+
+    api_client.get(f"/api/chat/{conversations[0].id}/")
+    inbox = api_client.get("/api/chat/").json()
+    assert {row["id"]: row["unread_count"] for row in inbox}[str(conversations[0].id)] == 0
+
+
+@pytest.mark.django_db
+def test_starting_a_conversation_reuses_the_pair_conversation(api_client, django_assert_num_queries):
+    guest, host, other = User.objects.bulk_create([
+        User(email=f"{name}@test.com", name=name) for name in ("guest", "host", "other")
+    ])
+    api_client.force_authenticate(user=guest)
+    first = api_client.get(f"/api/chat/start/{host.id}/").json()["conversation_id"]
+    api_client.force_authenticate(user=host)
+    with django_assert_num_queries(1):
+        again = api_client.get(f"/api/chat/start/{guest.id}/").json()["conversation_id"]
+    assert again == first
+    # A group chat the guest shares with the host is not their 1:1 conversation
+    group = Conversation.objects.create()
+    group.users.add(guest, host, other)
+    assert api_client.get(f"/api/chat/start/{guest.id}/").json()["conversation_id"] == first
+    assert api_client.get(f"/api/chat/start/{other.id}/").json()["conversation_id"] not in (first, str(group.id))
+
+    # Losing a race to create the conversation returns the one that won
+    conversation = Conversation.objects.get(pk=first)
+    with patch("django.db.models.query.QuerySet.first", side_effect=[None]):
+        raced, created = Conversation.get_or_create_for_pair(host, guest)
+    assert (raced, created) == (conversation, False)
+    # Still only the pair's conversation and the group
+    assert Conversation.objects.filter(users=guest).filter(users=host).count() == 2
@@ -1,21 +1,18 @@
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from rest_framework_simplejwt.tokens import AccessToken
-from useraccounts.models import User
+from useraccounts.authentication import user_from_token
 import logging
 
 logger = logging.getLogger(__name__)
 
 @database_sync_to_async
 def get_user(token_key):
-    try:
-        token = AccessToken(token_key)
-        user_id = token.payload['user_id']
-        return User.objects.get(pk=user_id)
-    except Exception as e:
-        logger.error(f"Error in getting user: {e}")  # You can log this for debugging
-        return AnonymousUser
+    user = user_from_token(token_key)
+    if user is None:
+        logger.error("Error in getting user: invalid token or unknown user")
+        return AnonymousUser()
+    return user
 
 
 class TokenAuthMiddleware(BaseMiddleware):
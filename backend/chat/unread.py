@@ -0,0 +1,83 @@
+import logging
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db.models import F, Q
+from .models import Conversation, ConversationReadState
+
+logger = logging.getLogger(__name__)
+
+
+def user_group(user_id):
+    """Channel layer group reaching every socket a user has open."""
+    return f'user_{user_id}'
+
+
+def count_new_messages(messages):
+    """
+    Add a batch of freshly saved messages to their recipients' unread counters.
+    Every participant but the sender gets one more unread message per message.
+    Costs one query to find the participants, one to create missing counters,
+    one update per distinct increment (usually just +1) and one to read the
+    new totals, whatever the batch size. Returns {(conversation_id, user_id): unread_count}.
+    """
+    conversation_ids = {message.conversation_id for message in messages}
+    participants = defaultdict(list)
+    for conversation_id, user_id in (Conversation.users.through.objects
+                                     .filter(conversation_id__in=conversation_ids)
+                                     .values_list('conversation_id', 'user_id')):
+        participants[conversation_id].append(user_id)
+
+    increments = defaultdict(int)
+    for message in messages:
+        for user_id in participants[message.conversation_id]:
+            if user_id != message.created_by_id:
+                increments[(message.conversation_id, user_id)] += 1
+    if not increments:
+        return {}
+
+    ConversationReadState.objects.bulk_create(
+        [ConversationReadState(conversation_id=conversation_id, user_id=user_id)
+         for conversation_id, user_id in increments],
+        ignore_conflicts=True,
+    )
+    by_amount = defaultdict(list)
+    for pair, amount in increments.items():
+        by_amount[amount].append(pair)
+    for amount, pairs in by_amount.items():
+        ConversationReadState.objects.filter(_pairs_filter(pairs)).update(unread_count=F('unread_count') + amount)
+    return {
+        (conversation_id, user_id): unread_count
+        for conversation_id, user_id, unread_count in ConversationReadState.objects
+        .filter(_pairs_filter(increments))
+        .values_list('conversation_id', 'user_id', 'unread_count')
+    }
+
+
+def _pairs_filter(pairs):
+    return reduce(or_, (Q(conversation_id=conversation_id, user_id=user_id) for conversation_id, user_id in pairs))
+
+
+def unread_count_events(counts):
+    for (conversation_id, user_id), unread_count in counts.items():
+        yield user_group(user_id), {
+            'type': 'unread_count',
+            'conversation_id': str(conversation_id),
+            'unread_count': unread_count,
+        }
+
+
+async def publish_unread_counts(counts):
+    """Push new counters to their users' sockets; best effort, the inbox endpoint stays the source of truth."""
+    channel_layer = get_channel_layer()
+    for group, event in unread_count_events(counts):
+        try:
+            await channel_layer.group_send(group, event)
+        except Exception as e:
+            logger.warning(f"Failed to publish unread count to {group}: {e}")
+
+
+def publish_unread_counts_sync(counts):
+    async_to_sync(publish_unread_counts)(counts)
@@ -1,6 +1,77 @@
+import re
+from contextlib import contextmanager
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 import pytest
 
 @pytest.fixture
 def api_client():
-    return APIClient()
\ No newline at end of file
+    return APIClient()
+
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    # The in-process cache tier outlives a single test; start every test cold
+    from property.cache import catalogue_cache
+    catalogue_cache.clear_local()
+    yield
+
+
+# SQLite reports a full table scan as a bare "SCAN <table>"; index walks, virtual
+# tables (FTS) and materialized subqueries carry extra words or parentheses
+SQLITE_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+class QueryPlans:
+    """Plans of the SELECTs captured by the query_plans fixture."""
+
+    def __init__(self):
+        self.plans = []
+
+    def explain(self, queries):
+        with connection.cursor() as cursor:
+            # Plan against statistics for the data the test seeded
+            cursor.execute('ANALYZE')
+            for query in queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                if connection.vendor == 'sqlite':
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    lines = [row[-1] for row in cursor.fetchall()]
+                else:
+                    cursor.execute(f"EXPLAIN {query['sql']}")
+                    lines = [row[0] for row in cursor.fetchall()]
+                self.plans.append((query['sql'], lines))
+
+    def sequential_scans(self):
+        """(table, sql) for every full table scan in the captured plans."""
+        pattern = SQLITE_FULL_SCAN if connection.vendor == 'sqlite' else POSTGRES_FULL_SCAN
+        scans = []
+        for sql, lines in self.plans:
+            for line in lines:
+                match = pattern.search(line.strip())
+                if match:
+                    scans.append((match.group(1), sql))
+        return scans
+
+
+@pytest.fixture
+def query_plans(db):
+    """
+    Context manager that EXPLAINs every SELECT run inside it, for query-plan
+    regression tests. Seed enough rows that an index is the right choice, then:
+
+        with query_plans() as plans:
+            api_client.get(url)
+        assert plans.sequential_scans() == []
+    """
+    @contextmanager
+    def capture():
+        plans = QueryPlans()
+        with CaptureQueriesContext(connection) as captured:
+            yield plans
+        plans.explain(captured.captured_queries)
+
+    return capture
@@ -24,6 +24,22 @@ app.conf.beat_schedule = {
         'task': 'property.tasks.send_property_report',
         'schedule': crontab(minute=1, hour=0),  # Every day at 00:01
     },
+    'release-expired-booking-holds': {
+        'task': 'property.tasks.release_expired_holds',
+        'schedule': crontab(),  # Every minute
+    },
+    'reconcile-stripe-payments': {
+        'task': 'my_stripe.tasks.reconcile_stripe_payments',
+        'schedule': crontab(minute=30, hour=2),  # Every day at 02:30
+    },
+    'provision-missing-stripe-customers': {
+        'task': 'useraccounts.tasks.provision_missing_stripe_customers',
+        'schedule': crontab(minute=0, hour=3),  # Every day at 03:00
+    },
+    'requeue-stripe-events': {
+        'task': 'my_stripe.tasks.requeue_stripe_events',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes
+    },
 }
 
 @app.task(bind=True)
@@ -0,0 +1,127 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# Upper bound on how many cells a single area lookup is split into
+MAX_COVER_CELLS = 16
+KM_PER_DEGREE = 111.32
+
+
+class InvalidGeoParameter(ValueError):
+    pass
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Standard geohash: interleave longitude/latitude bisection bits, five per character.
+    Nearby points share long prefixes, so an area maps onto a few index ranges.
+    """
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(latitude, longitude) extent in degrees of a cell with `precision` characters."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _cells(south, west, north, east, precision):
+    lat_step, lng_step = cell_size(precision)
+    cells = set()
+    for row in range(int((south + 90) // lat_step), int(min(north + 90, 179.999999) // lat_step) + 1):
+        for column in range(int((west + 180) // lng_step), int(min(east + 180, 359.999999) // lng_step) + 1):
+            cells.add(encode_geohash(-90 + (row + 0.5) * lat_step, -180 + (column + 0.5) * lng_step, precision))
+    return cells
+
+
+def _successor(cell):
+    """The first geohash after every hash that starts with `cell`, or None past the end."""
+    cell = cell.rstrip(BASE32[-1])
+    if not cell:
+        return None
+    return cell[:-1] + BASE32[BASE32.index(cell[-1]) + 1]
+
+
+def cover_ranges(south, west, north, east):
+    """
+    Half-open [start, stop) geohash ranges that together cover the box, using
+    the finest cell size that needs at most MAX_COVER_CELLS cells. Adjacent
+    cells are merged, so a lookup is a handful of index range scans. `stop` is
+    None for a range that runs to the end of the keyspace.
+    """
+    cells = {''}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        lat_step, lng_step = cell_size(precision)
+        estimate = ((north - south) / lat_step + 2) * ((east - west) / lng_step + 2)
+        if estimate > MAX_COVER_CELLS * 4:
+            break
+        candidate = _cells(south, west, north, east, precision)
+        if len(candidate) > MAX_COVER_CELLS:
+            break
+        cells = candidate
+    ranges = []
+    for cell in sorted(cells):
+        start, stop = cell, _successor(cell)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = stop
+        else:
+            ranges.append([start, stop])
+    return [tuple(item) for item in ranges]
+
+
+def parse_bbox(value):
+    """`west,south,east,north` in degrees (GeoJSON order) -> list of boxes as (south, west, north, east)."""
+    try:
+        west, south, east, north = (float(part) for part in value.split(','))
+    except ValueError:
+        raise InvalidGeoParameter('bbox must be west,south,east,north')
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise InvalidGeoParameter('bbox is out of range')
+    if west > east:
+        # Crosses the antimeridian
+        return [(south, west, north, 180.0), (south, -180.0, north, east)]
+    return [(south, west, north, east)]
+
+
+def parse_point(value):
+    """`lat,lng` in degrees."""
+    try:
+        latitude, longitude = (float(part) for part in value.split(','))
+    except ValueError:
+        raise InvalidGeoParameter('near must be lat,lng')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise InvalidGeoParameter('near is out of range')
+    return latitude, longitude
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Boxes (south, west, north, east) enclosing a circle; split at the antimeridian."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    south, north = max(latitude - lat_delta, -90.0), min(latitude + lat_delta, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    lng_delta = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-6 else 360.0
+    if lng_delta >= 180:
+        return [(south, -180.0, north, 180.0)]
+    west, east = longitude - lng_delta, longitude + lng_delta
+    if west < -180:
+        return [(south, west + 360, north, 180.0), (south, -180.0, north, east)]
+    if east > 180:
+        return [(south, west, north, 180.0), (south, -180.0, north, east - 360)]
+    return [(south, west, north, east)]
@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded, thread-safe LRU with a per-entry TTL, living in the worker process.
+    """
+
+    def __init__(self, max_entries=1024, timeout=30):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = min(timeout, self.timeout) if timeout else self.timeout
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Per-worker LocalCache in front of the shared django-redis cache.
+
+    Reads try the local tier first and only pay the Redis round trip (and
+    unpickling) on a local miss. Invalidations are broadcast on a Redis pub/sub
+    channel so every worker evicts its local copy; the short local TTL bounds
+    staleness if a message is ever lost.
+    """
+
+    RECONNECT_DELAY = 5
+
+    def __init__(self, channel, max_entries=1024, local_timeout=30):
+        self.channel = channel
+        self.local = LocalCache(max_entries=max_entries, timeout=local_timeout)
+        self._counters = {'local_hits': 0, 'local_misses': 0, 'redis_hits': 0, 'redis_misses': 0}
+        self._counters_lock = threading.Lock()
+        self._subscriber_pid = None
+        self._subscribe_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self._counters)
+        counters['local_entries'] = len(self.local)
+        return counters
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._count('local_hits')
+            return value
+        self._count('local_misses')
+        self._ensure_subscribed()
+        value = cache.get(key)
+        if value is None:
+            self._count('redis_misses')
+            return None
+        self._count('redis_hits')
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout):
+        cache.set(key, value, timeout=timeout)
+        self.local.set(key, value, timeout)
+
+    def delete(self, *keys):
+        """Remove keys from Redis and from every worker's local tier."""
+        cache.delete_many(keys)
+        self.evict(*keys)
+
+    def evict(self, *keys):
+        """Drop local copies everywhere, e.g. after a key was changed in Redis directly."""
+        self.local.delete(*keys)
+        try:
+            get_redis_connection('default').publish(self.channel, json.dumps(keys))
+        except NotImplementedError:
+            # Not backed by Redis (e.g. locmem in tests): there are no other workers to tell
+            pass
+        except Exception as e:
+            logger.warning(f"Could not publish cache invalidation for {keys}: {e}")
+
+    def clear_local(self):
+        self.local.clear()
+
+    def _ensure_subscribed(self):
+        # Checked per pid because gunicorn forks workers after the module is imported
+        if self._subscriber_pid == os.getpid():
+            return
+        with self._subscribe_lock:
+            if self._subscriber_pid == os.getpid():
+                return
+            self._subscriber_pid = os.getpid()
+            self.local.clear()
+            threading.Thread(target=self._listen, name=f'{self.channel}-listener', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                connection = get_redis_connection('default')
+            except NotImplementedError:
+                return
+            try:
+                pubsub = connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Anything published while we were disconnected is lost, so start clean
+                self.local.clear()
+                for message in pubsub.listen():
+                    self.local.delete(*json.loads(message['data']))
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener on {self.channel} failed: {e}")
+                self.local.clear()
+                time.sleep(self.RECONNECT_DELAY)
@@ -52,7 +52,7 @@ class InquiriesAPIView(APIView):
         if request.user.role == User.RoleChoises.ADMIN:
             inquiries = Inquiry.objects.all()
         elif request.user.role == User.RoleChoises.CUSTOMER_SERVICE:
-            inquiries = Inquiry.objects.filter(customer_service=request.user, is_assigned_to_customer_service=True).select_related('user', 'customer_service')
+            inquiries = Inquiry.objects.filter(customer_service=request.user, is_assigned_to_customer_service=True)
         else:
             inquiries = Inquiry.objects.filter(user=request.user)
 
@@ -64,7 +64,8 @@ class InquiriesAPIView(APIView):
         if in_queue:
             inquiries = inquiries.filter(is_assigned_to_customer_service=False)
 
-        inquiries = inquiries.order_by('-created_at')
+        # Each query above is served by one of the Inquiry indexes ending in created_at
+        inquiries = inquiries.order_by('-created_at').select_related('user', 'customer_service').prefetch_related('messages')
         serializer = GetInquirySerializer(inquiries, many=True)
         return JsonResponse(serializer.data, safe=False)
 
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiries', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['status', 'is_assigned_to_customer_service', 'created_at'], name='inquiry_status_queue'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['customer_service', 'is_assigned_to_customer_service', 'created_at'], name='inquiry_agent_queue'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['user', 'created_at'], name='inquiry_user_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['created_at'], name='inquiry_created_at'),
+        ),
+    ]
@@ -22,6 +22,17 @@ class Inquiry(models.Model):
     severity = models.CharField(max_length=10, choices=SeverityChoises, default=SeverityChoises.NORMAL.value)
     is_assigned_to_customer_service = models.BooleanField(default=False)
 
+    class Meta:
+        # One per InquiriesAPIView audience, each ending in created_at so the
+        # newest-first list is read in index order without a sort
+        indexes = [
+            models.Index(fields=['status', 'is_assigned_to_customer_service', 'created_at'], name='inquiry_status_queue'),
+            models.Index(fields=['customer_service', 'is_assigned_to_customer_service', 'created_at'],
+                         name='inquiry_agent_queue'),
+            models.Index(fields=['user', 'created_at'], name='inquiry_user_created_at'),
+            models.Index(fields=['created_at'], name='inquiry_created_at'),
+        ]
+
     def __str__(self):
         return self.subject
     
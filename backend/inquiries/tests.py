@@ -3,6 +3,9 @@ from .models import Inquiry
 from rest_framework import status
 from rest_framework.test import APIClient
 from reviews.conftest import create_user, create_customer_service
+from useraccounts.models import User
+from .models import Message
+import random
 
 
 @pytest.mark.django_db
@@ -156,3 +159,38 @@ def test_get_inquiry(api_client: APIClient, create_inquiry, create_user):
     assert response_data["updated_at"] == inquiry.updated_at.isoformat().replace('+00:00', 'Z')
 
     # Additional assertions as needed
+
+
+@pytest.mark.django_db
+def test_inquiries_query_plans(api_client: APIClient, create_user, create_customer_service, query_plans):
+    admin, agent = create_user, create_customer_service
+    guests = User.objects.bulk_create([User(email=f"guest{n}@test.com", name=f"Guest {n}") for n in range(100)])
+    agents = [agent] + User.objects.bulk_create([
+        User(email=f"agent{n}@test.com", name=f"Agent {n}", role=User.RoleChoises.CUSTOMER_SERVICE.value)
+        for n in range(9)
+    ])
+    # Like production: mostly resolved history, a small open queue spread across agents.
+    # Seeded, so the planner sees the same data on every run
+    rng = random.Random(0)
+    inquiries = []
+    for n in range(3000):
+        status_value = rng.choices([choice.value for choice in Inquiry.StatusChoice], [3, 3, 94])[0]
+        assigned = status_value == Inquiry.StatusChoice.CLOSED or n % 2 == 0
+        inquiries.append(Inquiry(
+            user=rng.choice(guests), subject=f"Subject {n}", message="Help", status=status_value,
+            customer_service=rng.choice(agents) if assigned else None, is_assigned_to_customer_service=assigned,
+        ))
+    Inquiry.objects.bulk_create(inquiries)
+    Message.objects.bulk_create([
+        Message(inquiry=inquiry, sender="user", message="Hello") for inquiry in inquiries for _ in range(2)
+    ])
+
+    # The unfiltered admin list returns every inquiry, so reading whole tables is the right plan there
+    for user, query in [
+        (admin, "?status=pending"), (admin, "?queue=1"), (admin, "?status=active&queue=1"),
+        (agent, ""), (agent, "?status=pending"), (guests[0], ""),
+    ]:
+        api_client.force_authenticate(user=user)
+        with query_plans() as plans:
+            assert api_client.get(f"/api/inquiries/get/{query}").status_code == status.HTTP_200_OK
+        assert plans.sequential_scans() == [], (user.role, query)
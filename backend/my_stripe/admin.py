@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import UserPayment
+from .models import UserPayment, StripeEvent
 
 
-admin.site.register(UserPayment)
\ No newline at end of file
+admin.site.register(UserPayment)
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'type', 'received_at', 'processed_at', 'attempts']
+    list_filter = ['type']
+    search_fields = ['event_id', 'object_id']
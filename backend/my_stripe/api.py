@@ -1,16 +1,22 @@
+import json
 import stripe
 import stripe.error
 from rest_framework.views import APIView
 import stripe.webhook
 from .serializers import BookingSerializer
 from django.http import JsonResponse
-from .models import UserPayment
+from .models import UserPayment, StripeEvent, MAX_EVENT_ATTEMPTS
 from django.shortcuts import get_object_or_404  
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from property.models import Property, Reservation
-from .tasks import send_invoice_creation_message
+from property.booking import create_reservation, BookingConflict
+from .tasks import send_invoice_creation_message, queue_stripe_event
+from .webhooks import confirmation_data, is_paid
+from .checkout import checkout_session, success_page_key, CheckoutLookupTimeout, SUCCESS_PAGE_TIMEOUT
 from drf_yasg.utils import swagger_auto_schema
 from .swagger_usecases import payment_success_response, payment_cancel_response, stripe_webhook_response
 
@@ -26,8 +32,12 @@ class PaymentSuccessAPIView(APIView):
 
     @swagger_auto_schema(
         operation_summary="Handle Successful Payments",
-        operation_description="Retrieve details about a successful Stripe payment, including reservation and customer information.",
-        responses={200: payment_success_response, 400: "Bad Request", 404: "Not Found"}
+        operation_description=(
+            "Retrieve details about a successful Stripe payment, including reservation and customer information. "
+            "Served from the recorded webhook event when it has arrived, otherwise looked up at Stripe."
+        ),
+        responses={200: payment_success_response, 400: "Bad Request", 404: "Not Found", 409: "Dates already booked",
+                   504: "Stripe did not respond in time"}
     )
     def get(self, request):
         try:
@@ -35,18 +45,19 @@ class PaymentSuccessAPIView(APIView):
             if not checkout_session_id:
                    return JsonResponse({'success': False, 'error': 'Missing session_id'}, status=400)
 
-            session = stripe.checkout.Session.retrieve(checkout_session_id)
-            customer_id = session.customer
-            customer = stripe.Customer.retrieve(customer_id)
+            cache_key = success_page_key(checkout_session_id)
+            response_data = cache.get(cache_key)
+            if response_data is not None:
+                return JsonResponse(response_data, status=200)
 
+            session = checkout_session(checkout_session_id)
             metadata = {
-                'pk': session.metadata['property_id'],
-                'start_date': session.metadata['start_date'],
-                'end_date': session.metadata['end_date'],
-                'total_price': session.metadata['total_price'],
-                'number_of_nights': session.metadata['number_of_nights'],
-                'guests': session.metadata['guests'],
-                'has_paid': session.metadata.get('has_paid', False)
+                'pk': session['metadata']['property_id'],
+                'start_date': session['metadata']['start_date'],
+                'end_date': session['metadata']['end_date'],
+                'total_price': session['metadata']['total_price'],
+                'number_of_nights': session['metadata']['number_of_nights'],
+                'guests': session['metadata']['guests'],
             }
 
             serializer = BookingSerializer(data=metadata)
@@ -54,48 +65,40 @@ class PaymentSuccessAPIView(APIView):
                 return JsonResponse({'success': False, 'errors': serializer.errors}, status=400)
 
             property_instance = Property.objects.get(pk=metadata['pk'])
-            reservation = Reservation.objects.create(
-                property=property_instance,
+            # Whichever of this view and the webhook runs first creates the reservation
+            # from the checkout's hold; reloads and later deliveries get the same one back
+            reservation, created = create_reservation(
+                property_id=property_instance.pk,
                 start_date=serializer.validated_data['start_date'],
                 end_date=serializer.validated_data['end_date'],
                 number_of_nights=serializer.validated_data['number_of_nights'],
                 total_price=serializer.validated_data['total_price'],
                 guests=serializer.validated_data['guests'],
-                has_paid=serializer.validated_data.get('has_paid', False),
+                has_paid=is_paid(session['payment_status']),
                 stripe_checkout_id=checkout_session_id,
+                hold_id=session['metadata'].get('hold_id'),
                 created_by=request.user
             )
 
-            response_data = {
-                "success": True,
-                "reservation": {
-                    "id": reservation.id,
-                    "start_date": reservation.start_date,
-                    "end_date": reservation.end_date,
-                    "total_price": float(reservation.total_price),
-                    "number_of_nights": reservation.number_of_nights,
-                    "guests": reservation.guests,
-                    "has_paid": reservation.has_paid,
-                    "created_by": request.user.name,
-                    "property": {
-                        "id": property_instance.id,
-                        "name": property_instance.title,
-                        "address": property_instance.country,
-                        "image_url": property_instance.image_url(),
-                    },
-                },
-                "customer": {
-                    "id": customer.id,
-                    "email": customer.email,
-                    "name": customer.name,
-                },
-            }
-            send_invoice_creation_message.delay(response_data)
+            response_data = confirmation_data(reservation, session['customer'])
+            if created:
+                send_invoice_creation_message.delay(response_data)
+            if reservation.has_paid:
+                # An unpaid page is not memoized so it picks up a delayed payment
+                cache.set(cache_key, response_data, timeout=SUCCESS_PAGE_TIMEOUT)
             return JsonResponse(response_data, status=200)
 
+        except CheckoutLookupTimeout:
+            return JsonResponse({'success': False, 'error': 'Payment provider did not respond, please retry'},
+                                status=504)
+
         except Property.DoesNotExist:
             return JsonResponse({'success': False, 'error': 'Property not found'}, status=404)
 
+        except BookingConflict as e:
+            logger.warning(f"Booking conflict for checkout {checkout_session_id}: {e}")
+            return JsonResponse({'success': False, 'error': 'These dates are no longer available'}, status=409)
+
         except Exception as e:
             logger.error(f"Error: {e}")
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
@@ -122,7 +125,11 @@ class PaymentCancelAPIView(APIView):
 
 @swagger_auto_schema(
     operation_summary="Stripe Webhook Handler",
-    operation_description="Process Stripe webhook events, including payment completions.",
+    operation_description=(
+        "Verify and record a Stripe webhook event, then acknowledge it. Processing "
+        "(payment completions, expired checkouts) happens asynchronously; duplicate "
+        "deliveries of the same event are acknowledged and ignored."
+    ),
     responses={200: stripe_webhook_response, 400: "Bad Request"}
 )
 @require_POST
@@ -133,7 +140,12 @@ def stripe_webhook(request):
     signature_header = request.META.get('HTTP_STRIPE_SIGNATURE')
 
     try:
-        event = stripe.Webhook.construct_event(payload, signature_header, endpoint_secret)
+        stripe.WebhookSignature.verify_header(
+            payload.decode('utf-8'), signature_header, endpoint_secret, tolerance=stripe.Webhook.DEFAULT_TOLERANCE
+        )
+        event = json.loads(payload)
+        event_id, event_type = event['id'], event['type']
+        object_id = event['data']['object'].get('id', '')
     except stripe.error.SignatureVerificationError as e:
         logger.error(f"Signature verification failed: {e}")
         return JsonResponse({'error': 'Invalid signature'}, status=400)
@@ -141,16 +153,12 @@ def stripe_webhook(request):
         logger.error(f"Error processing webhook: {e}")
         return JsonResponse({'error': 'Webhook error'}, status=400)
 
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        reservation_id = session.metadata.get('reservation_id')
-        if reservation_id:
-            try:
-                reservation = Reservation.objects.get(id=reservation_id)
-                reservation.has_paid = True
-                reservation.save()
-            except Reservation.DoesNotExist:
-                logger.warning(f"Reservation not found for ID: {reservation_id}")
-                return JsonResponse({'error': 'Reservation not found'}, status=404)
-
+    # Stripe retries until it gets a 2xx, so acknowledge as soon as the event is stored
+    stored, created = StripeEvent.objects.get_or_create(
+        event_id=event_id,
+        defaults={'type': event_type, 'object_id': object_id, 'payload': event},
+    )
+    # A redelivery of an event that never got processed is queued again, unless it was dead-lettered
+    if created or (stored.processed_at is None and stored.attempts < MAX_EVENT_ATTEMPTS):
+        transaction.on_commit(lambda: queue_stripe_event(event_id))
     return JsonResponse({'status': 'success'}, status=200)
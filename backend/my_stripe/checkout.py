@@ -0,0 +1,73 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import stripe
+from .models import StripeEvent
+
+logger = logging.getLogger(__name__)
+
+# How long the success page waits for Stripe when the webhook has not arrived yet
+SESSION_LOOKUP_TIMEOUT = 5
+# The success page is memoized per checkout session, so refreshes are free
+SUCCESS_PAGE_TIMEOUT = 3600
+PAID_SESSION_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+# Bounds the worker time spent waiting on Stripe; a lookup that outlives its
+# timeout finishes in the background instead of holding the request
+_stripe_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='stripe-lookup')
+
+
+class CheckoutLookupTimeout(Exception):
+    """Stripe did not answer within SESSION_LOOKUP_TIMEOUT."""
+
+
+def success_page_key(session_id):
+    return f"payment_success_{session_id}"
+
+
+def stored_checkout_session(session_id):
+    """The checkout session as recorded by the webhook pipeline, or None when no event has arrived."""
+    event = (StripeEvent.objects
+             .filter(object_id=session_id, type__in=PAID_SESSION_EVENTS)
+             .order_by('-received_at')
+             .first())
+    if event is None:
+        return None
+    session = event.payload['data']['object']
+    details = session.get('customer_details') or {}
+    return {
+        'id': session['id'],
+        'payment_status': session.get('payment_status'),
+        'metadata': session.get('metadata') or {},
+        'customer': {'id': session.get('customer'), 'email': details.get('email'), 'name': details.get('name')},
+    }
+
+
+def _retrieve_checkout_session(session_id):
+    # Expanding the customer returns it in the same round trip as the session
+    session = stripe.checkout.Session.retrieve(session_id, expand=['customer'])
+    customer = session.customer
+    return {
+        'id': session.id,
+        'payment_status': session.payment_status,
+        'metadata': dict(session.metadata or {}),
+        'customer': {'id': customer.id, 'email': customer.email, 'name': customer.name} if customer else None,
+    }
+
+
+def fetch_checkout_session(session_id, timeout=None):
+    """Retrieve the session and its customer from Stripe, giving up after `timeout` seconds."""
+    future = _stripe_pool.submit(_retrieve_checkout_session, session_id)
+    try:
+        return future.result(timeout=timeout or SESSION_LOOKUP_TIMEOUT)
+    except FutureTimeout:
+        logger.warning(f"Stripe lookup for checkout {session_id} timed out")
+        raise CheckoutLookupTimeout(session_id)
+
+
+def checkout_session(session_id):
+    """
+    Session data for the success page: read locally from the stored webhook
+    event when it has arrived, which is the common case, otherwise fetched
+    from Stripe.
+    """
+    return stored_checkout_session(session_id) or fetch_checkout_session(session_id)
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+def backfill_object_id(apps, schema_editor):
+    StripeEvent = apps.get_model('my_stripe', 'StripeEvent')
+    events = list(StripeEvent.objects.all())
+    for event in events:
+        event.object_id = event.payload.get('data', {}).get('object', {}).get('id', '')
+    StripeEvent.objects.bulk_update(events, ['object_id'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_stripe', '0002_stripe_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='object_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_object_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('my_stripe', '0003_stripeevent_object_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['received_at'], name='stripe_event_unprocessed'),
+        ),
+    ]
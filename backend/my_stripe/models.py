@@ -15,4 +15,44 @@ class UserPayment(models.Model):
 
 
     def __str__(self):
-        return f'{self.user.name} - {self.product_name} -Paid: {self.has_paid}'
\ No newline at end of file
+        return f'{self.user.name} - {self.product_name} -Paid: {self.has_paid}'
+
+# Three full retry runs of my_stripe.tasks.process_stripe_event (1 try + 5 retries each)
+MAX_EVENT_ATTEMPTS = 18
+
+
+class StripeEvent(models.Model):
+    """
+    Raw webhook event as Stripe delivered it, stored once per event id.
+
+    The webhook only verifies and records the event; my_stripe.tasks.process_stripe_event
+    applies it later and sets processed_at, so retried or duplicate deliveries
+    are acknowledged without doing the work again. Events left unprocessed are
+    queued again by redelivery and by my_stripe.tasks.requeue_stripe_events
+    until they have failed too often, see dead_lettered.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=255)
+    # Id of the object the event is about (e.g. the checkout session), for local lookups
+    object_id = models.CharField(max_length=255, blank=True, db_index=True)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Failed processing attempts; at MAX_EVENT_ATTEMPTS the event is dead-lettered
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Keeps the sweep for stuck events proportional to the backlog, not the history
+            models.Index(fields=['received_at'], condition=models.Q(processed_at__isnull=True),
+                         name='stripe_event_unprocessed'),
+        ]
+
+    @classmethod
+    def dead_lettered(cls):
+        """Unprocessed events that are no longer retried and need a person to look at them."""
+        return cls.objects.filter(processed_at__isnull=True, attempts__gte=MAX_EVENT_ATTEMPTS)
+
+    def __str__(self):
+        return f'{self.event_id} ({self.type})'
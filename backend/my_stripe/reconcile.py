@@ -0,0 +1,84 @@
+import logging
+import time
+from datetime import timedelta
+import stripe
+from django.utils import timezone
+from property.models import Reservation
+from .models import UserPayment
+from .webhooks import checkout_completed, is_paid
+
+logger = logging.getLogger(__name__)
+
+# Stripe's maximum page size; also the batch compared against the database at once
+RECONCILE_PAGE_SIZE = 100
+# Checkout sessions expire within a day, but delayed payment methods settle later
+RECONCILE_WINDOW = timedelta(days=3)
+
+
+def reconcile_checkout_sessions(since=None, page_size=RECONCILE_PAGE_SIZE):
+    """
+    Compare Stripe checkout sessions created after `since` (default: the last
+    RECONCILE_WINDOW) with our reservations and fix what drifted:
+
+    - paid at Stripe but not marked paid here: marked paid with one bulk_update
+      per page (UserPayment rows for the checkout too);
+    - paid at Stripe with no reservation at all, e.g. the webhook never
+      arrived: booked through the webhook handler;
+    - paid at Stripe but still without a reservation after that, e.g. the
+      dates were taken (the handler refunds those) or the session carries no
+      booking metadata: counted and logged as unbooked;
+    - marked paid here but not at Stripe: only counted and logged, since that
+      needs a person to look at it.
+
+    Sessions are streamed with auto-pagination and handled a page at a time,
+    so memory stays bounded by the page size whatever the volume. Returns a
+    summary of the counts.
+    """
+    since = since or timezone.now() - RECONCILE_WINDOW
+    summary = {'sessions': 0, 'marked_paid': 0, 'booked': 0, 'unbooked': 0, 'paid_locally_only': 0}
+    started = time.monotonic()
+
+    sessions = stripe.checkout.Session.list(limit=page_size, created={'gte': int(since.timestamp())})
+    page = []
+    for session in sessions.auto_paging_iter():
+        page.append(session)
+        if len(page) == page_size:
+            _reconcile_page(page, summary)
+            page = []
+    if page:
+        _reconcile_page(page, summary)
+
+    summary['seconds'] = round(time.monotonic() - started, 1)
+    logger.info(f"Stripe reconciliation: {summary}")
+    return summary
+
+
+def _reconcile_page(sessions, summary):
+    summary['sessions'] += len(sessions)
+    paid_ids = {session['id'] for session in sessions if is_paid(session.get('payment_status'))}
+    reservations = {
+        reservation.stripe_checkout_id: reservation
+        for reservation in Reservation.objects
+        .filter(stripe_checkout_id__in=[session['id'] for session in sessions])
+        .only('id', 'stripe_checkout_id', 'has_paid')
+    }
+
+    to_mark = []
+    for checkout_id, reservation in reservations.items():
+        if checkout_id in paid_ids and not reservation.has_paid:
+            reservation.has_paid = True
+            to_mark.append(reservation)
+        elif checkout_id not in paid_ids and reservation.has_paid:
+            summary['paid_locally_only'] += 1
+            logger.warning(f"Reservation {reservation.id} is marked paid but checkout {checkout_id} is not")
+    Reservation.objects.bulk_update(to_mark, ['has_paid'])
+    summary['marked_paid'] += len(to_mark)
+    UserPayment.objects.filter(stripe_checkout_id__in=paid_ids, has_paid=False).update(has_paid=True)
+
+    for session in sessions:
+        if session['id'] in paid_ids and session['id'] not in reservations:
+            if checkout_completed(session) is not None:
+                summary['booked'] += 1
+            else:
+                summary['unbooked'] += 1
+                logger.warning(f"Paid checkout {session['id']} has no reservation")
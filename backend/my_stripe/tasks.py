@@ -2,10 +2,18 @@ from celery import shared_task
 from io import BytesIO
 from helpers.messaging import send_message
 from helpers.create_pdf import generate_payment_pdf
+from datetime import timedelta
+from django.utils import timezone
+from django.db.models import F
+from .models import StripeEvent, MAX_EVENT_ATTEMPTS
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Unprocessed events older than this are assumed lost (broker down, retries
+# used up) and queued again; well past process_stripe_event's retry backoff
+STALE_EVENT_AGE = timedelta(minutes=10)
+
 @shared_task
 def send_invoice_creation_message(response_data):
     try:
@@ -125,3 +133,72 @@ def send_invoice_creation_message(response_data):
 
     except Exception as e:
         logger.error(f"Error sending invoice email: {e}")
+
+
+@shared_task(bind=True, max_retries=5)
+def process_stripe_event(self, event_id):
+    """
+    Apply a stored webhook event once. Failures are retried with exponential
+    backoff and counted on the event; an event already marked processed is
+    skipped, and the handlers themselves are idempotent in case a retry races
+    a duplicate task. After MAX_EVENT_ATTEMPTS failures the event is
+    dead-lettered: logged critically and never queued again.
+    """
+    # Deferred: the handlers enqueue tasks from this module
+    from .webhooks import HANDLERS
+
+    event = StripeEvent.objects.filter(
+        event_id=event_id, processed_at__isnull=True, attempts__lt=MAX_EVENT_ATTEMPTS
+    ).first()
+    if event is None:
+        return
+    handler = HANDLERS.get(event.type)
+    try:
+        if handler is not None:
+            handler(event.payload['data']['object'])
+    except Exception as e:
+        logger.error(f"Error processing Stripe event {event_id}: {e}")
+        StripeEvent.objects.filter(pk=event.pk).update(attempts=F('attempts') + 1, last_error=repr(e)[:2000])
+        if event.attempts + 1 >= MAX_EVENT_ATTEMPTS:
+            logger.critical(f"Stripe event {event_id} dead-lettered after {MAX_EVENT_ATTEMPTS} attempts: {e}")
+            return
+        raise self.retry(exc=e, countdown=2 ** self.request.retries)
+    StripeEvent.objects.filter(pk=event.pk).update(processed_at=timezone.now())
+
+
+def queue_stripe_event(event_id):
+    """Queue an event for processing; if the broker is unreachable the sweep picks it up later."""
+    try:
+        process_stripe_event.delay(event_id)
+    except Exception as e:
+        logger.error(f"Could not queue Stripe event {event_id}: {e}")
+
+
+@shared_task
+def requeue_stripe_events(batch_size=500):
+    """
+    Queue again the events that were stored but never processed, leaving out
+    dead-lettered ones so they cannot crowd newer events out of the batch.
+    Returns how many were queued.
+    """
+    stale = list(StripeEvent.objects
+                 .filter(processed_at__isnull=True, attempts__lt=MAX_EVENT_ATTEMPTS,
+                         received_at__lt=timezone.now() - STALE_EVENT_AGE)
+                 .order_by('received_at')
+                 .values_list('event_id', flat=True)[:batch_size])
+    for event_id in stale:
+        queue_stripe_event(event_id)
+    if stale:
+        logger.warning(f"Queued {len(stale)} unprocessed Stripe events again")
+    dead = StripeEvent.dead_lettered().count()
+    if dead:
+        logger.critical(f"{dead} Stripe events are dead-lettered and need attention")
+    return len(stale)
+
+
+@shared_task
+def reconcile_stripe_payments():
+    """Nightly comparison of Stripe checkout sessions with reservations, see my_stripe.reconcile."""
+    from .reconcile import reconcile_checkout_sessions
+
+    return reconcile_checkout_sessions()
@@ -1,9 +1,34 @@
 from unittest.mock import patch, Mock
 from rest_framework import status
 from useraccounts.conftest import create_reservation, create_landlord
+from useraccounts.models import User
+from property.booking import place_hold, create_reservation as book
+from property.models import BookingHold, BookedNight
+from my_stripe.models import StripeEvent, MAX_EVENT_ATTEMPTS
+from my_stripe.tasks import process_stripe_event, requeue_stripe_events, STALE_EVENT_AGE
+from datetime import timedelta
+from django.utils import timezone
+from my_stripe.reconcile import reconcile_checkout_sessions
+from property.models import Reservation
+from django.core.cache import cache
+from django.test import override_settings
+import hashlib
+import hmac
+import json
+import time
 import pytest
 
+WEBHOOK_SECRET = "whsec_test"
+
+
+def sign(payload, secret=WEBHOOK_SECRET):
+    """Stripe-Signature header for `payload`, computed the way Stripe does."""
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
 @pytest.mark.django_db
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
 @patch("stripe.checkout.Session.retrieve")
 @patch("stripe.Customer.retrieve")
 @patch("my_stripe.api.send_invoice_creation_message.delay")
@@ -14,12 +39,20 @@ def test_payment_success_view(
     api_client, 
     create_reservation
 ):
+    cache.clear()
     # Mock the Celery task
     mock_send_invoice_creation_message.return_value = None
 
-    # Mock Stripe Session and Customer objects
+    # Mock Stripe Session and Customer objects; the customer comes expanded on the session
+    mock_customer = Mock()
+    mock_customer.id = "mock_customer_id"
+    mock_customer.email = "testcustomer@example.com"
+    mock_customer.name = "Test Customer"
+
     mock_session = Mock()
-    mock_session.customer = "mock_customer_id"
+    mock_session.id = "mock_session_id"
+    mock_session.customer = mock_customer
+    mock_session.payment_status = "paid"
     mock_session.metadata = {
         "property_id": str(create_reservation.property.id),
         "start_date": "2025-01-01",
@@ -31,12 +64,6 @@ def test_payment_success_view(
     }
     mock_stripe_session_retrieve.return_value = mock_session
 
-    mock_customer = Mock()
-    mock_customer.id = "mock_customer_id"
-    mock_customer.email = "testcustomer@example.com"
-    mock_customer.name = "Test Customer"
-    mock_stripe_customer_retrieve.return_value = mock_customer
-
     # Test URL with mock session ID
     url = f"/api/stripe/payment/success/?session_id=mock_session_id"
 
@@ -58,6 +85,8 @@ def test_payment_success_view(
     print(f"Reservation Stripe Checkout ID: {reservation.stripe_checkout_id}")  # Debugging
     assert reservation.stripe_checkout_id == "mock_session_id"
     assert reservation.has_paid is True
+    mock_stripe_session_retrieve.assert_called_once_with("mock_session_id", expand=["customer"])
+    mock_stripe_customer_retrieve.assert_not_called()
 
 
 @pytest.mark.django_db
@@ -84,3 +113,248 @@ def test_payment_cancel_view(api_client, create_reservation):
         "success": False,
         "message": f"Payment for reservation {reservation.id} was canceled."
     }
+
+
+@pytest.mark.django_db
+@patch("my_stripe.webhooks.send_invoice_creation_message.delay")
+@patch("my_stripe.tasks.process_stripe_event.delay")
+def test_stripe_webhook_records_event_once_and_defers_processing(
+    mock_process, mock_send_invoice, api_client, create_reservation, settings, django_capture_on_commit_callbacks
+):
+    settings.STRIPE_WEBHOOK_SECRET = WEBHOOK_SECRET
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    property_instance = create_reservation.property
+    hold = place_hold(property_instance.pk, "2030-05-01", "2030-05-04", guest)
+    payload = json.dumps({
+        "id": "evt_test_1",
+        "type": "checkout.session.completed",
+        "data": {"object": {
+            "id": "cs_test_1",
+            "payment_status": "paid",
+            "customer": "cus_test",
+            "customer_details": {"email": "guest@test.com", "name": "Guest"},
+            "metadata": {
+                "property_id": str(property_instance.pk), "start_date": "2030-05-01", "end_date": "2030-05-04",
+                "number_of_nights": "3", "guests": "1", "total_price": "300", "has_paid": "False",
+                "hold_id": str(hold.pk), "user_id": str(guest.pk),
+            },
+        }},
+    })
+    url = "/api/stripe/stripe_webhook/"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(url, data=payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=sign(payload))
+    assert response.status_code == 200
+    mock_process.assert_called_once_with("evt_test_1")
+    # Nothing was booked on the request thread
+    assert not property_instance.reservations.filter(stripe_checkout_id="cs_test_1").exists()
+
+    # A redelivery is stored once; it is queued again only while the event is unprocessed,
+    # e.g. after the broker was down or the task gave up
+    mock_process.side_effect = ConnectionError("broker down")
+    with django_capture_on_commit_callbacks(execute=True):
+        response = api_client.post(url, data=payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=sign(payload))
+    assert response.status_code == 200
+    assert mock_process.call_count == 2
+    assert StripeEvent.objects.count() == 1
+    mock_process.side_effect = None
+
+    # The sweep queues events left unprocessed for too long
+    assert requeue_stripe_events() == 0
+    StripeEvent.objects.update(received_at=timezone.now() - STALE_EVENT_AGE - timedelta(minutes=1))
+    assert requeue_stripe_events() == 1
+    assert mock_process.call_count == 3
+
+    response = api_client.post(
+        url, data=payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=sign(payload, "whsec_other")
+    )
+    assert response.status_code == 400
+
+    process_stripe_event("evt_test_1")
+    reservation = property_instance.reservations.get(stripe_checkout_id="cs_test_1")
+    assert reservation.has_paid and reservation.created_by == guest
+    assert not BookingHold.objects.exists()
+    assert StripeEvent.objects.get(event_id="evt_test_1").processed_at is not None
+    mock_send_invoice.assert_called_once()
+    with django_capture_on_commit_callbacks(execute=True):
+        api_client.post(url, data=payload, content_type="application/json", HTTP_STRIPE_SIGNATURE=sign(payload))
+    assert requeue_stripe_events() == 0
+    assert mock_process.call_count == 3
+
+    # A processed event is skipped, and the handler itself tolerates being re-run
+    process_stripe_event("evt_test_1")
+    StripeEvent.objects.update(processed_at=None)
+    process_stripe_event("evt_test_1")
+    assert property_instance.reservations.filter(stripe_checkout_id="cs_test_1").count() == 1
+    mock_send_invoice.assert_called_once()
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+@patch("my_stripe.api.send_invoice_creation_message.delay")
+def test_payment_success_page_avoids_stripe_round_trips(
+    mock_send_invoice, api_client, create_reservation, django_assert_num_queries
+):
+    cache.clear()
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    property_instance = create_reservation.property
+    metadata = {
+        "property_id": str(property_instance.pk), "start_date": "2030-05-01", "end_date": "2030-05-04",
+        "number_of_nights": "3", "guests": "1", "total_price": "300", "has_paid": "False", "user_id": str(guest.pk),
+    }
+    api_client.force_authenticate(user=guest)
+
+    def slow_stripe(session_id, **kwargs):
+        # Local Stripe stand-in that answers slower than the lookup timeout
+        time.sleep(0.5)
+        return Mock()
+
+    with patch("stripe.checkout.Session.retrieve", side_effect=slow_stripe), \
+            patch("my_stripe.checkout.SESSION_LOOKUP_TIMEOUT", 0.05):
+        started = time.monotonic()
+        response = api_client.get("/api/stripe/payment/success/?session_id=cs_test_1")
+        assert response.status_code == 504
+        assert time.monotonic() - started < 0.4
+
+    # Once the webhook has recorded the session, no Stripe call is needed at all
+    StripeEvent.objects.create(
+        event_id="evt_test_1", type="checkout.session.completed", object_id="cs_test_1",
+        payload={"id": "evt_test_1", "type": "checkout.session.completed", "data": {"object": {
+            "id": "cs_test_1", "payment_status": "paid", "customer": "cus_test", "metadata": metadata,
+            "customer_details": {"email": "guest@test.com", "name": "Guest"},
+        }}},
+    )
+    with patch("stripe.checkout.Session.retrieve", side_effect=AssertionError("Stripe was called")):
+        response = api_client.get("/api/stripe/payment/success/?session_id=cs_test_1")
+        assert response.status_code == 200
+        assert response.json()["customer"] == {"id": "cus_test", "email": "guest@test.com", "name": "Guest"}
+        assert response.json()["reservation"]["has_paid"] is True
+
+        # Refreshes are served from the memo without touching the database
+        with django_assert_num_queries(0):
+            assert api_client.get("/api/stripe/payment/success/?session_id=cs_test_1").json() == response.json()
+    mock_send_invoice.assert_called_once()
+
+
+class FakeSessionList:
+    """Local stand-in for stripe.checkout.Session.list that serves pages lazily."""
+
+    def __init__(self, sessions, limit, **params):
+        self.sessions, self.limit, self.pages_served = sessions, limit, 0
+
+    def auto_paging_iter(self):
+        for offset in range(0, len(self.sessions), self.limit):
+            self.pages_served += 1
+            yield from self.sessions[offset:offset + self.limit]
+
+
+@pytest.mark.django_db
+@patch("my_stripe.webhooks.send_invoice_creation_message.delay")
+def test_reconciliation_fixes_payment_drift(mock_send_invoice, create_reservation):
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    property_instance = create_reservation.property
+    paid_elsewhere = Reservation.objects.create(
+        property=property_instance, start_date="2030-06-01", end_date="2030-06-02", number_of_nights=1, guests=1,
+        total_price=100, stripe_checkout_id="cs_unpaid", has_paid=True, created_by=guest,
+    )
+    lost_webhook = {
+        "property_id": str(property_instance.pk), "start_date": "2030-05-01", "end_date": "2030-05-04",
+        "number_of_nights": "3", "guests": "1", "total_price": "300", "user_id": str(guest.pk),
+    }
+    sessions = [
+        # The fixture reservation was paid but never marked so
+        {"id": "mock_session_id", "payment_status": "paid", "metadata": {}},
+        {"id": "cs_unpaid", "payment_status": "unpaid", "metadata": {}},
+        {"id": "cs_lost", "payment_status": "paid", "metadata": lost_webhook, "customer": "cus_test"},
+        {"id": "cs_abandoned", "payment_status": "unpaid", "metadata": {}},
+        {"id": "cs_other", "payment_status": "paid", "metadata": {}},
+    ]
+    listing = {}
+
+    def fake_list(**params):
+        listing["result"] = FakeSessionList(sessions, **params)
+        return listing["result"]
+
+    with patch("stripe.checkout.Session.list", side_effect=fake_list):
+        summary = reconcile_checkout_sessions(page_size=2)
+
+    assert listing["result"].pages_served == 3
+    assert {key: value for key, value in summary.items() if key != "seconds"} == {
+        "sessions": 5, "marked_paid": 1, "booked": 1, "unbooked": 1, "paid_locally_only": 1,
+    }
+    create_reservation.refresh_from_db()
+    assert create_reservation.has_paid
+    paid_elsewhere.refresh_from_db()
+    assert paid_elsewhere.has_paid  # Flagged for a person, never flipped automatically
+    assert Reservation.objects.get(stripe_checkout_id="cs_lost").has_paid
+    mock_send_invoice.assert_called_once()
+
+    # Nothing is left to fix on a second run
+    with patch("stripe.checkout.Session.list", side_effect=fake_list):
+        summary = reconcile_checkout_sessions(page_size=2)
+    assert (summary["marked_paid"], summary["booked"]) == (0, 0)
+
+
+@pytest.mark.django_db
+@patch("my_stripe.webhooks.send_invoice_creation_message.delay")
+@patch("stripe.Refund.create")
+def test_paid_checkout_that_lost_its_dates_is_refunded(mock_refund, mock_send_invoice, create_reservation):
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    rival = User.objects.create(email="rival@test.com", name="Rival")
+    property_instance = create_reservation.property
+    hold = place_hold(property_instance.pk, "2030-05-01", "2030-05-04", guest)
+    # The guest's hold lapses while they are still paying, and the rival books the dates
+    BookingHold.objects.filter(pk=hold.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+    BookedNight.objects.filter(hold=hold).update(expires_at=timezone.now() - timedelta(minutes=1))
+    book(property_id=property_instance.pk, start_date="2030-05-02", end_date="2030-05-05", created_by=rival,
+         number_of_nights=3, total_price=300, guests=1)
+
+    session = {
+        "id": "cs_late", "payment_status": "paid", "payment_intent": "pi_late", "customer": "cus_test",
+        "metadata": {
+            "property_id": str(property_instance.pk), "start_date": "2030-05-01", "end_date": "2030-05-04",
+            "number_of_nights": "3", "guests": "1", "total_price": "300", "has_paid": "False",
+            "hold_id": str(hold.pk), "user_id": str(guest.pk),
+        },
+    }
+    StripeEvent.objects.create(event_id="evt_late", type="checkout.session.completed", object_id="cs_late",
+                               payload={"data": {"object": session}})
+    process_stripe_event("evt_late")
+
+    assert not Reservation.objects.filter(stripe_checkout_id="cs_late").exists()
+    mock_refund.assert_called_once_with(
+        payment_intent="pi_late", metadata={"checkout_id": "cs_late", "reason": "dates_unavailable"},
+        idempotency_key="refund-cs_late",
+    )
+    mock_send_invoice.assert_not_called()
+
+    # Reconciliation still reports it, and retrying the refund reuses the same key
+    with patch("stripe.checkout.Session.list", side_effect=lambda **params: FakeSessionList([session], **params)):
+        summary = reconcile_checkout_sessions()
+    assert (summary["booked"], summary["unbooked"]) == (0, 1)
+    assert {call.kwargs["idempotency_key"] for call in mock_refund.call_args_list} == {"refund-cs_late"}
+
+
+@pytest.mark.django_db
+@patch("my_stripe.tasks.process_stripe_event.delay")
+def test_failing_stripe_events_are_dead_lettered(mock_process):
+    old = timezone.now() - STALE_EVENT_AGE - timedelta(minutes=1)
+    poison = StripeEvent.objects.create(event_id="evt_poison", type="checkout.session.expired", object_id="cs_poison",
+                                        payload={"data": {"object": {"id": "cs_poison"}}})
+    with patch.dict("my_stripe.webhooks.HANDLERS", {"checkout.session.expired": Mock(side_effect=ValueError("boom"))}):
+        with pytest.raises(ValueError):
+            process_stripe_event("evt_poison")
+        poison.refresh_from_db()
+        assert (poison.attempts, poison.last_error) == (1, "ValueError('boom')")
+
+        # The last allowed attempt gives up instead of retrying
+        StripeEvent.objects.filter(pk=poison.pk).update(attempts=MAX_EVENT_ATTEMPTS - 1)
+        process_stripe_event("evt_poison")
+    assert list(StripeEvent.dead_lettered()) == [poison]
+
+    # The sweep skips it, so a newer lost event still gets through a batch of one
+    StripeEvent.objects.create(event_id="evt_lost", type="checkout.session.expired", object_id="cs_lost",
+                               payload={"data": {"object": {"id": "cs_lost"}}})
+    StripeEvent.objects.update(received_at=old)
+    assert requeue_stripe_events(batch_size=1) == 1
+    mock_process.assert_called_once_with("evt_lost")
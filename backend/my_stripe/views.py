@@ -1,10 +1,16 @@
 import stripe
 from django.conf import settings
+from django.utils import timezone
+from property.booking import CHECKOUT_SESSION_TTL
+from useraccounts.customers import ensure_stripe_customer
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
-def product_checkout_view(request, property, pk, total_price, start_date, end_date, number_of_nights, guests, has_paid):
+def product_checkout_view(request, property, pk, total_price, start_date, end_date, number_of_nights, guests, has_paid,
+                          hold=None):
+    # The session closes before the hold on its nights lapses, see property.booking
+    expires_at = timezone.now() + CHECKOUT_SESSION_TTL
     checkout_session = stripe.checkout.Session.create(
             line_items=[
                 {
@@ -20,10 +26,11 @@ def product_checkout_view(request, property, pk, total_price, start_date, end_da
             ],
             mode='payment',
             payment_method_types=['card'],
-            customer_creation='always',
             success_url='https://www.diplomaroad.pro/payment/success?session_id={CHECKOUT_SESSION_ID}',  # Redirect to success URL after payment  # Redirect to success URL after payment
             cancel_url=(f'https://www.diplomaroad.pro/payment/cancel/'),  # Redirect to cancel URL if payment fails
-            customer_email=request.user.email,  # Optional: Prefill user email in checkout
+            # The guest's own customer, created now if signup provisioning has not caught up
+            customer=ensure_stripe_customer(request.user),
+            expires_at=int(expires_at.timestamp()),
             metadata={
                 'property_id': pk,
                 'start_date': start_date,
@@ -31,7 +38,10 @@ def product_checkout_view(request, property, pk, total_price, start_date, end_da
                 'number_of_nights': number_of_nights,
                 'guests': guests,
                 'total_price': total_price,
-                'has_paid': has_paid
+                'has_paid': has_paid,
+                'hold_id': str(hold.pk) if hold else '',
+                # Lets the webhook book the stay without the guest's browser
+                'user_id': str(request.user.pk),
             }
         )
     return checkout_session
\ No newline at end of file
@@ -0,0 +1,130 @@
+import logging
+import stripe
+from django.conf import settings
+from property.booking import create_reservation, release_hold, BookingConflict
+from property.models import Reservation
+from useraccounts.models import User
+from .serializers import BookingSerializer
+from .tasks import send_invoice_creation_message
+
+logger = logging.getLogger(__name__)
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+
+
+def confirmation_data(reservation, customer):
+    """Reservation summary shown on the success page and rendered into the invoice email."""
+    property_instance = reservation.property
+    return {
+        "success": True,
+        "reservation": {
+            "id": reservation.id,
+            "start_date": reservation.start_date,
+            "end_date": reservation.end_date,
+            "total_price": float(reservation.total_price),
+            "number_of_nights": reservation.number_of_nights,
+            "guests": reservation.guests,
+            "has_paid": reservation.has_paid,
+            "created_by": reservation.created_by.name,
+            "property": {
+                "id": property_instance.id,
+                "name": property_instance.title,
+                "address": property_instance.country,
+                "image_url": property_instance.image_url(),
+            },
+        },
+        "customer": customer,
+    }
+
+
+def is_paid(payment_status):
+    return payment_status in ('paid', 'no_payment_required')
+
+
+def checkout_completed(session):
+    """
+    Create the reservation for a paid checkout, turning its hold into it.
+    Idempotent: create_reservation returns the existing reservation for a
+    checkout it has already seen, and only the call that creates it sends
+    the invoice, whether that is this handler or the success page. Returns
+    the reservation, or None when the checkout could not be booked.
+    """
+    if not is_paid(session.get('payment_status')):
+        # Delayed payment methods complete later with async_payment_succeeded
+        return
+    metadata = session.get('metadata') or {}
+    if metadata.get('reservation_id'):
+        # Sessions created before reservations were made from the checkout itself
+        Reservation.objects.filter(pk=metadata['reservation_id']).update(has_paid=True)
+        return
+    user = User.objects.filter(pk=metadata.get('user_id')).first() if metadata.get('user_id') else None
+    if user is None:
+        # Older sessions did not record the guest; the success page books those
+        logger.warning(f"Checkout {session['id']} has no user_id, leaving it to the success page")
+        return
+
+    serializer = BookingSerializer(data=metadata)
+    if not serializer.is_valid():
+        logger.error(f"Checkout {session['id']} has invalid booking metadata: {serializer.errors}")
+        return
+    try:
+        reservation, created = create_reservation(
+            property_id=metadata['property_id'],
+            start_date=serializer.validated_data['start_date'],
+            end_date=serializer.validated_data['end_date'],
+            number_of_nights=serializer.validated_data['number_of_nights'],
+            total_price=serializer.validated_data['total_price'],
+            guests=serializer.validated_data['guests'],
+            has_paid=True,
+            stripe_checkout_id=session['id'],
+            hold_id=metadata.get('hold_id'),
+            created_by=user,
+        )
+    except BookingConflict as e:
+        # Paid after the hold lapsed and someone else took the dates
+        logger.error(f"Paid checkout {session['id']} conflicts with an existing booking, refunding: {e}")
+        refund_checkout(session, 'dates_unavailable')
+        return
+    if created:
+        details = session.get('customer_details') or {}
+        customer = {"id": session.get('customer'), "email": details.get('email'), "name": details.get('name')}
+        send_invoice_creation_message.delay(confirmation_data(reservation, customer))
+    return reservation
+
+
+def refund_checkout(session, reason):
+    """
+    Refund a paid checkout that could not be booked. Keyed on the session, so
+    a retried event or a later reconciliation run never refunds twice. Stripe
+    errors propagate so the event is retried.
+    """
+    payment_intent = session.get('payment_intent')
+    if not payment_intent:
+        logger.error(f"Checkout {session['id']} has no payment to refund ({reason})")
+        return None
+    try:
+        return stripe.Refund.create(
+            payment_intent=payment_intent,
+            metadata={'checkout_id': session['id'], 'reason': reason},
+            idempotency_key=f"refund-{session['id']}",
+        )
+    except stripe.error.InvalidRequestError as e:
+        # Idempotency keys expire after a day; a repeat after that finds the charge refunded
+        if e.code == 'charge_already_refunded':
+            logger.info(f"Checkout {session['id']} was already refunded")
+            return None
+        raise
+
+
+def checkout_expired(session):
+    # Abandoned checkout: give its nights back without waiting for the sweeper
+    release_hold((session.get('metadata') or {}).get('hold_id'))
+
+
+# Event type -> handler taking the event's data.object. Every handler must be
+# safe to run more than once for the same event.
+HANDLERS = {
+    'checkout.session.completed': checkout_completed,
+    'checkout.session.async_payment_succeeded': checkout_completed,
+    'checkout.session.expired': checkout_expired,
+}
@@ -2,137 +2,316 @@ from django.http import JsonResponse
 from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.generics import RetrieveAPIView, ListAPIView
 from rest_framework.views import APIView
-from .models import Property, Reservation, PropertyImage
-from .serializers import PropertyModelDynamicSerializer, ReservationListSerializer
+from .models import Property, Reservation, PropertyImage, BookedNight, PropertyListing
+from .serializers import PropertyModelDynamicSerializer, PropertyListingSerializer, ReservationListSerializer
 from .forms import PropertyForm
+from helpers.pagination import keyset_page, InvalidCursor
 from django.shortcuts import get_object_or_404
 from useraccounts.models import User
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAdminUser
 from .tasks import send_property_creation_message
+from .cache import (properties_list_key, properties_facets_key, property_detail_key, user_favorite_ids,
+                    favorites_digest, get_or_rebuild, catalogue_cache, availability_key, AVAILABILITY_TIMEOUT)
 from django.forms.models import model_to_dict
 import stripe
 from my_stripe.views import product_checkout_view
 from django.conf import settings
-from rest_framework_simplejwt.tokens import AccessToken
-from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import InvalidToken
+from useraccounts.authentication import CachedJWTAuthentication
+from django.db.models import Count, Exists, OuterRef
+from collections import Counter
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from .booking import place_hold, release_hold, BookingConflict
+from .search import search_listings, within_boxes, annotate_distance, InvalidSearchParameter
+from helpers.geo import InvalidGeoParameter, parse_bbox, parse_point, radius_bbox
 from .swagger_usecases import (property_detail_schema, property_list_schema, booking_request_schema, 
-                            reservation_list_schema, favorite_toggle_response_schema, create_property_request_schema)
+                            reservation_list_schema, favorite_toggle_response_schema, create_property_request_schema,
+                            cache_stats_schema, property_facets_schema, availability_schema)
 import logging
+import os
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.utils.dateparse import parse_date
 
 logger = logging.getLogger('default')
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+PROPERTIES_PAGE_SIZE = 20
+PROPERTIES_MAX_PAGE_SIZE = 100
+PROPERTIES_ORDERING = ['-created_at', '-property_id']
+# Text searches list the most relevant matches first, radius searches the nearest
+SEARCH_ORDERING = ['-search_rank', *PROPERTIES_ORDERING]
+DISTANCE_ORDERING = ['distance_km', *PROPERTIES_ORDERING]
+# Explicit `sort` choices; each is served by a (column, property) index on PropertyListing
+SORT_ORDERINGS = {
+    'newest': PROPERTIES_ORDERING,
+    'price': ['price_per_night', 'property_id'],
+    '-price': ['-price_per_night', '-property_id'],
+    'popular': ['-popularity', '-property_id'],
+}
+# Longest window the availability calendar serves in one request
+AVAILABILITY_MAX_MONTHS = 24
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+PROPERTY_FACETS = ('country', 'category', 'bedrooms')
+
+
+def exclude_booked_properties(qs, checkin_date, checkout_date):
+    """
+    Drop properties that have at least one booked or actively held night in
+    [checkin_date, checkout_date). Resolved in the database as an anti-join on
+    the (property, night) index; hold expiry is checked on the matched rows.
+    Works for Property and PropertyListing querysets, whose pk is the property id.
+    """
+    booked_nights = BookedNight.active().filter(
+        property=OuterRef('pk'),
+        night__gte=checkin_date,
+        night__lt=checkout_date,
+    )
+    return qs.exclude(Exists(booked_nights))
+
+
+def optional_user_id(request):
+    """
+    Id of the bearer-token user, resolved from the cached user snapshot.
+    Invalid or missing tokens browse anonymously.
+    """
+    try:
+        authenticated = CachedJWTAuthentication().authenticate(request)
+    except (AuthenticationFailed, InvalidToken):
+        return None
+    return str(authenticated[0].pk) if authenticated else None
+
+
+def parse_radius(value):
+    try:
+        radius = float(value) if value else DEFAULT_RADIUS_KM
+    except ValueError:
+        raise InvalidGeoParameter('radius must be a number of kilometres')
+    if not 0 < radius <= MAX_RADIUS_KM:
+        raise InvalidGeoParameter(f'radius must be between 0 and {MAX_RADIUS_KM} km')
+    return radius
+
+
+def parse_price(params, name):
+    value = params.get(name, '')
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidSearchParameter(f'{name} must be an integer')
+
+
+def listing_ordering(params):
+    sort = params.get('sort', '')
+    if sort:
+        if sort not in SORT_ORDERINGS:
+            raise InvalidSearchParameter(f"sort must be one of {', '.join(SORT_ORDERINGS)}")
+        return SORT_ORDERINGS[sort]
+    if params.get('near', ''):
+        return DISTANCE_ORDERING
+    if params.get('q', '').strip():
+        return SEARCH_ORDERING
+    return PROPERTIES_ORDERING
+
+
+def filter_listings(params, favorites, facet_filters=True):
+    """
+    Apply the search query parameters to the PropertyListing projection.
+    With facet_filters=False the country/category/bedrooms filters are left
+    out so the facets endpoint can count across them.
+    """
+    qs = PropertyListing.objects.all()
+    text = params.get('q', '').strip()
+    if text:
+        qs = search_listings(qs, text)
+    landlord_id = params.get('landlord_id')
+    if landlord_id:
+        qs = qs.filter(landlord_id=landlord_id)
+    bbox = params.get('bbox', '')
+    if bbox:
+        qs = within_boxes(qs, parse_bbox(bbox))
+    near = params.get('near', '')
+    if near:
+        latitude, longitude = parse_point(near)
+        radius = parse_radius(params.get('radius'))
+        qs = within_boxes(qs, radius_bbox(latitude, longitude, radius))
+        qs = annotate_distance(qs, latitude, longitude).filter(distance_km__lte=radius)
+    if params.get('is_favorites', ''):
+        # Anonymous callers have no favorites, so this is empty for them
+        qs = qs.filter(property_id__in=favorites)
+    checkin_date = params.get('checkIn', '')
+    checkout_date = params.get('checkOut', '')
+    if checkin_date and checkout_date:
+        qs = exclude_booked_properties(qs, checkin_date, checkout_date)
+    guests = params.get('numGuests', '')
+    if guests:
+        qs = qs.filter(guests__gte=guests)
+    bathrooms = params.get('numBathrooms', '')
+    if bathrooms:
+        qs = qs.filter(bathrooms__gte=bathrooms)
+    min_price = parse_price(params, 'min_price')
+    if min_price is not None:
+        qs = qs.filter(price_per_night__gte=min_price)
+    max_price = parse_price(params, 'max_price')
+    if max_price is not None:
+        qs = qs.filter(price_per_night__lte=max_price)
+    if not facet_filters:
+        return qs
+    bedrooms = params.get('numBedrooms', '')
+    if bedrooms:
+        qs = qs.filter(bedrooms__gte=bedrooms)
+    country = params.get('country', '')
+    if country:
+        qs = qs.filter(country=country)
+    category = params.get('category', '')
+    if category and category != 'undefined':
+        qs = qs.filter(category=category)
+    return qs
+
+
 class PropertiesListAPIView(ListAPIView):
-    serializer_class = PropertyModelDynamicSerializer
+    serializer_class = PropertyListingSerializer
     permission_classes = []
     authentication_classes = []
 
     @swagger_auto_schema(
         operation_summary="List all properties",
-        operation_description="Retrieve a list of properties with optional filters (e.g., country, category, etc.).",
+        operation_description=(
+            "Retrieve a list of properties with optional filters (e.g., country, category, etc.). "
+            "`q` runs a full-text search over title and description and orders results by relevance. "
+            "`bbox=west,south,east,north` limits results to a map area; `near=lat,lng&radius=km` "
+            "to a circle, nearest first. `min_price`/`max_price` bound the nightly price and "
+            "`sort=newest|price|-price|popular` overrides the default order."
+        ),
         responses={200: property_list_schema},
     )
     def get(self, request, *args, **kwargs):
-        user = None
+        user_id = optional_user_id(request)
+
+        is_favorites = request.GET.get('is_favorites', '')
+        # Passing `cursor` (empty for the first page) opts into keyset pagination
+        cursor_mode = 'cursor' in request.GET
+        cursor = request.GET.get('cursor', '')
         try:
-            # Extract token from Authorization header
-            auth_header = request.META.get('HTTP_AUTHORIZATION')
-            if not auth_header:
-                raise AuthenticationFailed('Authorization token not provided')
-
-            token = auth_header.split('Bearer ')[1]
-            token = AccessToken(token)
-
-            # Debugging the payload
-
-            # Extract user ID from token payload
-            user_id = token.payload.get('user_id')
-            logger.debug('User_id:', user_id)
-            if user_id is None:
-                raise AuthenticationFailed('User ID not found in token')
-            
-            user = User.objects.get(pk=user_id)
-        except KeyError:
-            raise AuthenticationFailed('Authorization token not provided')
-        except (AuthenticationFailed, User.DoesNotExist):
-            user = None
-
-        cache_key = f"properties_list_{request.GET.urlencode()}_{user.id if user else 'anonymous'}"
-        cached_response = cache.get(cache_key)  
+            page_size = min(int(request.GET.get('page_size', PROPERTIES_PAGE_SIZE)), PROPERTIES_MAX_PAGE_SIZE)
+        except ValueError:
+            return JsonResponse({'error': 'page_size must be an integer'}, status=400)
+        if page_size < 1:
+            return JsonResponse({'error': 'page_size must be positive'}, status=400)
+
+        favorites = user_favorite_ids(user_id) if user_id else []
+
+        # The key embeds the catalogue version, so a hit is served without touching the database.
+        # Only favorites-filtered pages depend on the caller; everything else is shared.
+        scope = f"{user_id}_{favorites_digest(favorites)}" if is_favorites and user_id else None
+        cache_key = properties_list_key(request.GET, scope)
         logger.info(f"Cache Key: {cache_key}")
-        logger.info('Cache Miss')
-        favorites = []
-        country = request.GET.get('country', '')
-        category = request.GET.get('category', '')
-        checkin_date = request.GET.get('checkIn', '')
-        checkout_date = request.GET.get('checkOut', '')
-        bedrooms = request.GET.get('numBedrooms', '')
-        bathrooms = request.GET.get('numBathrooms', '')
-        guests = request.GET.get('numGuests', '')
-        is_favorites = request.GET.get('is_favorites', '')
 
-        # Filter properties based on query parameters
-        qs = Property.objects.all()
-        landlord_id = request.GET.get('landlord_id')
-        if landlord_id:
-            qs = qs.filter(landlord_id=landlord_id)
-        if is_favorites:
-            if user:
-                # Filter properties that are favorited by the authenticated user
-                qs = qs.filter(favorited=user)
-            else:
-                # If the user is not authenticated, return an empty queryset
-                qs = qs.none()
-        if checkin_date and checkout_date:
-            exact_matches = Reservation.objects.filter(start_date=checkin_date) | Reservation.objects.filter(end_date=checkout_date)
-            overlap_matches = Reservation.objects.filter(start_date__lte=checkout_date, end_date__gte=checkin_date)
-            all_matches = []
-            for reservation in exact_matches | overlap_matches:
-                all_matches.append(reservation.property_id)
-            qs = qs.exclude(id__in=all_matches)
-
-        if cached_response:
-            cached_count = cached_response.get('count', 0)
-            if cached_count== qs.count():
-                logger.info(f"Cache hit: Returning cached response for key {cache_key}")
-                return JsonResponse(cached_response)
-            else:
-                logger.info("Cache invalid: Length mismatch. Continuing without cached data.")
-        
-        # Collect IDs of favorite properties
-        if user:
-            favorites = Property.objects.filter(favorited=user).values_list('id', flat=True)
-        else:
-            favorites = []
-        if guests:
-            qs = qs.filter(guests__gte=guests)
-        if bedrooms:
-            qs = qs.filter(bedrooms__gte=bedrooms)
-        if bathrooms:
-            qs = qs.filter(bathrooms__gte=bathrooms)
-        if country:
-            qs = qs.filter(country=country)
-        if category and category != 'undefined':
-            qs = qs.filter(category=category)
-        
+        def build_response():
+            logger.info('Cache Miss')
+            qs = filter_listings(request.GET, favorites)
+            logger.debug(
+                f"Properties list API accessed. User: {user_id or 'Anonymous'}, "
+                f"Country: {request.GET.get('country', '')}, Guests: {request.GET.get('numGuests', '')}, "
+                f"Check-in: {request.GET.get('checkIn', '')}, Check-out: {request.GET.get('checkOut', '')}"
+            )
+            ordering = listing_ordering(request.GET)
+            if cursor_mode:
+                page, next_cursor = keyset_page(qs, ordering, cursor, page_size)
+                serializer = PropertyListingSerializer(page, many=True)
+                return {
+                    'data': serializer.data,
+                    'next': next_cursor,
+                }
+            serializer = PropertyListingSerializer(qs.order_by(*ordering), many=True)
+            data = serializer.data
+            return {
+                'data': data,
+                'count': len(data),
+            }
+
+        try:
+            response_data = get_or_rebuild(cache_key, build_response, timeout=600)
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        except (InvalidGeoParameter, InvalidSearchParameter) as e:
+            return JsonResponse({'error': str(e)}, status=400)
         logger.debug(f"Favorites: {favorites}")
+        return JsonResponse({**response_data, 'favorites': favorites})
+
+
+
+def count_facets(qs, selected):
+    """
+    Fold one grouped (country, category, bedrooms) aggregate into per-facet counts.
 
-        logger.debug(
-            f"Properties list API accessed. User: {user.id if user else 'Anonymous'}, "
-            f"Country: {country}, Guests: {guests}, Check-in: {checkin_date}, Check-out: {checkout_date}"
-        )
-        serializer = PropertyModelDynamicSerializer(qs, fields=['id', 'title', 'price_per_night', 'image_url','country'], many=True)
-        response_data = {
-            'data': serializer.data,
-            'favorites': list(favorites),
-            'count': qs.count(),
+    Each facet is counted under the other facets' selections only, so choosing
+    a country still shows how many listings the sibling countries have.
+    """
+    counters = {facet: Counter() for facet in PROPERTY_FACETS}
+    total = 0
+    for row in qs.values(*PROPERTY_FACETS).annotate(count=Count('pk')).order_by():
+        matches = {
+            'country': not selected['country'] or row['country'] == selected['country'],
+            'category': not selected['category'] or row['category'] == selected['category'],
+            'bedrooms': not selected['bedrooms'] or row['bedrooms'] >= selected['bedrooms'],
+        }
+        for facet, counter in counters.items():
+            if all(matched for name, matched in matches.items() if name != facet):
+                counter[row[facet]] += row['count']
+        if all(matches.values()):
+            total += row['count']
+    return {
+        'total': total,
+        **{
+            facet: [{'value': value, 'count': count} for value, count in sorted(counter.items())]
+            for facet, counter in counters.items()
+        },
+    }
+
+
+class PropertyFacetsAPIView(APIView):
+    """
+    Per-value counts for the search sidebar, for the same query parameters as the property list.
+    """
+    permission_classes = []
+    authentication_classes = []
+
+    @swagger_auto_schema(
+        operation_summary="Property search facets",
+        operation_description="Counts per country, category and bedroom count for the given list filters.",
+        responses={200: property_facets_schema},
+    )
+    def get(self, request, *args, **kwargs):
+        user_id = optional_user_id(request)
+        is_favorites = request.GET.get('is_favorites', '')
+        category = request.GET.get('category', '')
+        try:
+            bedrooms = int(request.GET.get('numBedrooms') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'numBedrooms must be an integer'}, status=400)
+        selected = {
+            'country': request.GET.get('country', ''),
+            'category': category if category != 'undefined' else '',
+            'bedrooms': bedrooms,
         }
-        cache.set(cache_key, response_data, timeout=600)
-        return JsonResponse(response_data)
 
+        favorites = user_favorite_ids(user_id) if user_id else []
+        scope = f"{user_id}_{favorites_digest(favorites)}" if is_favorites and user_id else None
+        cache_key = properties_facets_key(request.GET, scope)
+
+        def build_facets():
+            return count_facets(filter_listings(request.GET, favorites, facet_filters=False), selected)
+
+        try:
+            return JsonResponse(get_or_rebuild(cache_key, build_facets, timeout=600))
+        except (InvalidGeoParameter, InvalidSearchParameter) as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
 
 class CreatePropertyAPIView(APIView):
@@ -203,19 +382,114 @@ class PropertyDetailAPIView(RetrieveAPIView):
     responses={200: property_detail_schema, 404: "Property not found"},
     )
     def retrieve(self, request, *args, **kwargs):
-        cache_key = f"property_detail_{kwargs['pk']}"
-        cached_data = cache.get(cache_key)
-
-        if cached_data:
-            return JsonResponse(cached_data, safe=False)
-
-        instance = self.get_object()
-        serializer = self.get_serializer(instance, fields=[
-            'id', 'title', 'description', 'price_per_night', 'image_url',
-            'bedrooms', 'bathrooms', 'guests', 'landlord', 'extra_images'
-        ])
-        cache.set(cache_key, serializer.data, timeout=3600)
-        return JsonResponse(serializer.data, safe=False)
+        def build_detail():
+            instance = self.get_object()
+            serializer = self.get_serializer(instance, fields=[
+                'id', 'title', 'description', 'price_per_night', 'image_url',
+                'bedrooms', 'bathrooms', 'guests', 'landlord', 'extra_images'
+            ])
+            return serializer.data
+
+        data = get_or_rebuild(property_detail_key(kwargs['pk']), build_detail, timeout=3600)
+        return JsonResponse(data, safe=False)
+
+
+class PropertyCacheStatsAPIView(APIView):
+    """
+    Hit/miss counters of the local and Redis cache tiers for the worker that serves the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        operation_summary="Property cache statistics",
+        operation_description="Per-tier hit/miss counters of the property cache in the worker serving this request.",
+        responses={200: cache_stats_schema},
+    )
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({'pid': os.getpid(), **catalogue_cache.stats()})
+
+
+def parse_day(value, default):
+    if not value:
+        return default
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise InvalidSearchParameter('from and to must be dates (YYYY-MM-DD)')
+    return day
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_bitmaps(nights, months):
+    """
+    Encode booked nights as one integer per month, where bit (day - 1) is set
+    when that night is booked.
+    """
+    bitmaps = {month: 0 for month in months}
+    for night in nights:
+        month = night.replace(day=1)
+        # The scanned range may span months that were already cached
+        if month in bitmaps:
+            bitmaps[month] |= 1 << (night.day - 1)
+    return bitmaps
+
+
+class PropertyAvailabilityAPIView(APIView):
+    """
+    Booked and held nights per calendar month as compact bitmaps, for the booking widget.
+    """
+    permission_classes = []
+    authentication_classes = []
+
+    @swagger_auto_schema(
+        operation_summary="Property availability calendar",
+        operation_description=(
+            "Booked nights between `from` and `to` (YYYY-MM-DD, default: the next 12 months). "
+            "Each month maps to an integer whose bit (day - 1) is set when that night is booked "
+            "or held by a checkout in progress."
+        ),
+        responses={200: availability_schema, 400: "Invalid date range", 404: "Property not found"},
+    )
+    def get(self, request, pk, *args, **kwargs):
+        try:
+            start = parse_day(request.GET.get('from'), date.today())
+            # Defaults to twelve whole calendar months
+            end = parse_day(request.GET.get('to'), date(start.year + 1, start.month, 1) - timedelta(days=1))
+        except InvalidSearchParameter as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        if end < start:
+            return JsonResponse({'error': 'to must not be before from'}, status=400)
+        if (end.year - start.year) * 12 + end.month - start.month >= AVAILABILITY_MAX_MONTHS:
+            return JsonResponse({'error': f'At most {AVAILABILITY_MAX_MONTHS} months per request'}, status=400)
+
+        months = [start.replace(day=1)]
+        while next_month(months[-1]) <= end:
+            months.append(next_month(months[-1]))
+
+        keys = {availability_key(pk, month): month for month in months}
+        cached = cache.get_many(keys)
+        missing = [month for key, month in keys.items() if key not in cached]
+        if missing:
+            if not Property.objects.filter(pk=pk).exists():
+                return JsonResponse({'error': 'Property not found'}, status=404)
+            # One range scan of the (property, night) index covers every missing month
+            nights = BookedNight.active().filter(
+                property_id=pk,
+                night__gte=missing[0],
+                night__lt=next_month(missing[-1]),
+            ).values_list('night', flat=True)
+            computed = {availability_key(pk, month): bitmap for month, bitmap in month_bitmaps(nights, missing).items()}
+            cache.set_many(computed, timeout=AVAILABILITY_TIMEOUT)
+            cached.update(computed)
+
+        return JsonResponse({
+            'months': {f'{month:%Y-%m}': cached[key] for key, month in keys.items()},
+        })
 
 
 class PropertiesReservationsAPIView(RetrieveAPIView):
@@ -240,7 +514,7 @@ class BookPropertyAPIView(APIView):
         operation_summary="Book a property",
         operation_description="Book a property by providing booking details such as start and end dates, total price, etc.",
         request_body=booking_request_schema,
-        responses={200: "Booking URL returned for payment"},
+        responses={200: "Booking URL returned for payment", 409: "Dates already booked or held"},
     )
     def post(self, request, pk, *args, **kwargs):
         try:
@@ -252,8 +526,19 @@ class BookPropertyAPIView(APIView):
             has_paid = request.data.get('has_paid', False)
 
             property = get_object_or_404(Property, pk=pk)
-            checkout_session = product_checkout_view(request, property, pk, total_price, start_date, end_date, number_of_nights, guests, has_paid)
-            return JsonResponse({'url': checkout_session.url})
+            # Hold the nights before sending the guest to pay, so two guests can
+            # never both pay for them
+            try:
+                hold = place_hold(property.pk, start_date, end_date, request.user)
+            except BookingConflict:
+                return JsonResponse({'success': False, 'error': 'These dates are no longer available'}, status=409)
+            try:
+                checkout_session = product_checkout_view(request, property, pk, total_price, start_date, end_date,
+                                                         number_of_nights, guests, has_paid, hold=hold)
+            except Exception:
+                release_hold(hold.pk)
+                raise
+            return JsonResponse({'url': checkout_session.url, 'hold_expires_at': hold.expires_at})
         except Exception as e:
             logger.error(f"Error: {e}")
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
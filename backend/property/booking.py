@@ -0,0 +1,152 @@
+import random
+import time
+from datetime import timedelta
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Property, Reservation, BookedNight, BookingHold
+
+# SQLite reports write contention as "database is locked" instead of waiting
+# on a row lock; the whole attempt is retried with a short randomized backoff.
+SQLITE_LOCK_RETRIES = 50
+SQLITE_LOCK_BACKOFF = 0.01
+# Stripe rejects Checkout session expiries less than 30 minutes away; the extra
+# minute absorbs the request latency. The hold outlives its session so that a
+# payment completed at the last moment still finds its nights held when the
+# guest lands on the success page.
+CHECKOUT_SESSION_TTL = timedelta(minutes=31)
+HOLD_TTL = CHECKOUT_SESSION_TTL + timedelta(minutes=5)
+
+
+class BookingConflict(Exception):
+    """The requested nights overlap an existing reservation or an active hold."""
+
+
+def _retry_when_locked(operation, *args):
+    attempt = 0
+    while True:
+        try:
+            return operation(*args)
+        except OperationalError as e:
+            attempt += 1
+            if connection.vendor != 'sqlite' or 'locked' not in str(e) or attempt > SQLITE_LOCK_RETRIES:
+                raise
+            time.sleep(random.uniform(0, SQLITE_LOCK_BACKOFF * attempt))
+
+
+def _lock_property(property_id):
+    if connection.features.has_select_for_update:
+        list(Property.objects.select_for_update().filter(pk=property_id).values_list('pk', flat=True))
+
+
+def _overlapping_nights(property_id, start_date, end_date):
+    return BookedNight.active().filter(property_id=property_id, night__gte=start_date, night__lt=end_date)
+
+
+def place_hold(property_id, start_date, end_date, created_by, ttl=HOLD_TTL):
+    """
+    Hold the nights of [start_date, end_date) for `created_by` until now + ttl,
+    or raise BookingConflict when any of them is reserved or held by an active
+    hold. A guest who restarts checkout for the same property replaces their
+    earlier hold. Serialized per property the same way as create_reservation.
+    """
+    if isinstance(start_date, str):
+        start_date = parse_date(start_date)
+    if isinstance(end_date, str):
+        end_date = parse_date(end_date)
+    if start_date is None or end_date is None or end_date <= start_date:
+        raise ValueError('end_date must be a date after start_date')
+    return _retry_when_locked(_place_hold, property_id, start_date, end_date, created_by, ttl)
+
+
+def _place_hold(property_id, start_date, end_date, created_by, ttl):
+    with transaction.atomic():
+        _lock_property(property_id)
+        BookingHold.objects.filter(property_id=property_id, created_by=created_by).delete()
+        hold = BookingHold.objects.create(
+            property_id=property_id,
+            start_date=start_date,
+            end_date=end_date,
+            created_by=created_by,
+            expires_at=timezone.now() + ttl,
+        )
+        # The hold's own nights were written by the post_save signal
+        if _overlapping_nights(property_id, start_date, end_date).exclude(hold=hold).exists():
+            raise BookingConflict(f'{property_id} is not available between {start_date} and {end_date}')
+    return hold
+
+
+def release_hold(hold_id):
+    """Give the nights of an abandoned checkout back; a no-op for unknown or converted holds."""
+    if hold_id:
+        BookingHold.objects.filter(pk=hold_id).delete()
+
+
+def release_expired_holds():
+    """Delete lapsed holds and their nights; returns how many holds were released."""
+    _, deleted = BookingHold.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted.get(BookingHold._meta.label, 0)
+
+
+def create_reservation(property_id, start_date, end_date, created_by, stripe_checkout_id=None, has_paid=False,
+                       hold_id=None, **fields):
+    """
+    Create a reservation unless its nights overlap another one; returns (reservation, created).
+
+    Conflicting writers are serialized per property: Postgres locks the property
+    row (bookings for other properties proceed in parallel) and backs it with
+    the reservation_no_overlap exclusion constraint. SQLite has no row locks,
+    so the insert comes first and takes the database write lock before the
+    overlap check reads anything.
+
+    Calls carrying a stripe_checkout_id are idempotent: a repeated or concurrent
+    call returns the reservation created by the first one, marking it paid if
+    this call says it is.
+
+    `hold_id` names the hold placed when the checkout started; it is released in
+    the same transaction, so the guest never conflicts with their own hold.
+    """
+    return _retry_when_locked(_create_reservation, property_id, start_date, end_date, created_by, stripe_checkout_id,
+                              has_paid, hold_id, fields)
+
+
+def _create_reservation(property_id, start_date, end_date, created_by, stripe_checkout_id, has_paid, hold_id, fields):
+    if stripe_checkout_id:
+        existing = _existing_checkout(stripe_checkout_id, has_paid)
+        if existing is not None:
+            return existing, False
+
+    try:
+        with transaction.atomic():
+            _lock_property(property_id)
+            if hold_id:
+                BookingHold.objects.filter(pk=hold_id, property_id=property_id).delete()
+            reservation = Reservation.objects.create(
+                property_id=property_id,
+                start_date=start_date,
+                end_date=end_date,
+                created_by=created_by,
+                stripe_checkout_id=stripe_checkout_id,
+                has_paid=has_paid,
+                **fields,
+            )
+            # The new reservation's own nights were written by the post_save signal
+            overlapping = _overlapping_nights(property_id, reservation.start_date, reservation.end_date)
+            if overlapping.exclude(reservation=reservation).exists():
+                raise BookingConflict(f'{property_id} is already booked between {start_date} and {end_date}')
+    except IntegrityError:
+        # Lost a race on the same checkout, or hit the exclusion constraint
+        if stripe_checkout_id:
+            existing = _existing_checkout(stripe_checkout_id, has_paid)
+            if existing is not None:
+                return existing, False
+        raise BookingConflict(f'{property_id} is already booked between {start_date} and {end_date}')
+    return reservation, True
+
+
+def _existing_checkout(stripe_checkout_id, has_paid):
+    reservation = Reservation.objects.filter(stripe_checkout_id=stripe_checkout_id).first()
+    if reservation is not None and has_paid and not reservation.has_paid:
+        reservation.has_paid = True
+        reservation.save(update_fields=['has_paid'])
+    return reservation
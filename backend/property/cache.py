@@ -0,0 +1,204 @@
+import hashlib
+import math
+import random
+import time
+from django.core.cache import cache
+from helpers.local_cache import TwoTierCache
+from .models import Property
+
+CATALOGUE_VERSION_KEY = 'properties_catalogue_version'
+AVAILABILITY_VERSION_KEY = 'properties_availability_version'
+POPULARITY_VERSION_KEY = 'properties_popularity_version'
+# Query parameters whose results change when nights are booked or held
+AVAILABILITY_PARAMS = ('checkIn', 'checkOut')
+# Orderings whose results change when favorites or reservations are counted
+POPULARITY_SORTS = ('popular',)
+FAVORITES_TIMEOUT = 3600
+AVAILABILITY_TIMEOUT = 3600
+
+# Entries outlive their logical TTL by this much so a stale copy can be served while one worker rebuilds
+STALE_GRACE = 60
+REBUILD_LOCK_TIMEOUT = 10
+REBUILD_WAIT = 2.0
+REBUILD_POLL_INTERVAL = 0.05
+# XFetch beta: > 1 favours earlier refreshes, < 1 later ones
+EARLY_REFRESH_BETA = 1.0
+
+# Hot catalogue reads (version key, list pages, property details) are served from
+# a per-worker tier first; writes are fanned out to the other workers via pub/sub.
+catalogue_cache = TwoTierCache('property_cache_invalidation', max_entries=2048, local_timeout=30)
+
+
+def _fresh_generation():
+    # Seeded from the clock so that a version key lost to eviction never
+    # restarts at a number whose cache entries might still be alive.
+    return int(time.time() * 1000)
+
+
+def _generation(key):
+    version = catalogue_cache.get(key)
+    if version is None:
+        cache.add(key, _fresh_generation(), timeout=None)
+        version = cache.get(key) or 0
+    return version
+
+
+def _bump_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Nothing to increment yet (first write, or the key was evicted)
+        cache.set(key, _fresh_generation(), timeout=None)
+    catalogue_cache.evict(key)
+
+
+def catalogue_version():
+    """
+    Current catalogue generation. Embedded in every properties_list key, so
+    bumping it makes all previously cached pages unreachable at once; the
+    orphaned entries simply age out through their TTL.
+    """
+    return _generation(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    _bump_generation(CATALOGUE_VERSION_KEY)
+
+
+def availability_version():
+    """
+    Generation of booked and held nights. Only embedded in the keys of
+    date-filtered queries, so a checkout starting or a hold lapsing leaves
+    every undated page cached.
+    """
+    return _generation(AVAILABILITY_VERSION_KEY)
+
+
+def bump_availability_version():
+    _bump_generation(AVAILABILITY_VERSION_KEY)
+
+
+def popularity_version():
+    """Generation of PropertyListing.popularity, embedded only in the keys of popularity-sorted queries."""
+    return _generation(POPULARITY_VERSION_KEY)
+
+
+def bump_popularity_version():
+    _bump_generation(POPULARITY_VERSION_KEY)
+
+
+def catalogue_generation(params):
+    """The generations a query's cached results depend on, as one key component."""
+    generations = [catalogue_version()]
+    if any(params.get(name) for name in AVAILABILITY_PARAMS):
+        generations.append(availability_version())
+    if params.get('sort') in POPULARITY_SORTS:
+        generations.append(popularity_version())
+    return '.'.join(str(generation) for generation in generations)
+
+
+def invalidate_property_detail(pk):
+    catalogue_cache.delete(property_detail_key(pk))
+
+
+def property_detail_key(pk):
+    return f"property_detail_{pk}"
+
+
+def properties_list_key(params, scope=None):
+    """
+    Catalogue pages are shared by every visitor with the same filters; only
+    pages that depend on the caller (is_favorites) carry a scope suffix.
+    """
+    key = f"properties_list_{catalogue_generation(params)}_{params.urlencode()}"
+    return f"{key}_{scope}" if scope else key
+
+
+def properties_facets_key(params, scope=None):
+    key = f"properties_facets_{catalogue_generation(params)}_{params.urlencode()}"
+    return f"{key}_{scope}" if scope else key
+
+
+def availability_key(property_id, month):
+    return f"property_availability_{property_id}_{month:%Y-%m}"
+
+
+def invalidate_availability_months(property_months):
+    """Drop cached calendar months, given (property_id, any date in the month) pairs."""
+    cache.delete_many({availability_key(property_id, night) for property_id, night in property_months})
+
+
+def favorites_key(user_id):
+    return f"property_favorites_{user_id}"
+
+
+def favorites_digest(favorite_ids):
+    return hashlib.md5(','.join(sorted(favorite_ids)).encode()).hexdigest()[:16]
+
+
+def user_favorite_ids(user_id):
+    """
+    The ids a user has favorited, cached as a compact list of strings and
+    merged into the shared catalogue payload at response time.
+    """
+    key = favorites_key(user_id)
+    favorite_ids = cache.get(key)
+    if favorite_ids is None:
+        favorite_ids = [str(pk) for pk in Property.objects.filter(favorited=user_id).values_list('id', flat=True)]
+        cache.set(key, favorite_ids, timeout=FAVORITES_TIMEOUT)
+    return favorite_ids
+
+
+def _needs_refresh(entry, now):
+    """
+    Probabilistic early expiration (XFetch): the closer an entry is to its
+    expiry, and the longer it took to build, the likelier a reader is to
+    refresh it ahead of time, so hot keys rarely expire for everyone at once.
+    """
+    jitter = entry['delta'] * EARLY_REFRESH_BETA * -math.log(1.0 - random.random())
+    return now + jitter >= entry['expires_at']
+
+
+def _rebuild(key, rebuild, timeout):
+    started = time.time()
+    value = rebuild()
+    finished = time.time()
+    catalogue_cache.set(key, {
+        'value': value,
+        'delta': finished - started,
+        'expires_at': finished + timeout,
+    }, timeout=timeout + STALE_GRACE)
+    return value
+
+
+def get_or_rebuild(key, rebuild, timeout):
+    """
+    Read-through cache with single-flight recompute.
+
+    Only the worker that wins a short lock runs `rebuild`; concurrent readers
+    get the stale value if one is still around, otherwise they wait briefly
+    for the winner to publish a fresh one.
+    """
+    entry = catalogue_cache.get(key)
+    if entry is not None and not _needs_refresh(entry, time.time()):
+        return entry['value']
+
+    lock_key = f"{key}_lock"
+    acquired = cache.add(lock_key, 1, timeout=REBUILD_LOCK_TIMEOUT)
+    # django-redis answers None rather than False when Redis is unreachable; nobody can hold the lock then
+    if acquired or acquired is None:
+        try:
+            return _rebuild(key, rebuild, timeout)
+        finally:
+            cache.delete(lock_key)
+
+    if entry is not None:
+        return entry['value']
+    deadline = time.time() + REBUILD_WAIT
+    while time.time() < deadline:
+        time.sleep(REBUILD_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+    # The lock holder is too slow or died; stop waiting and build it ourselves
+    return _rebuild(key, rebuild, timeout)
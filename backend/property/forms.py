@@ -13,6 +13,8 @@ class PropertyForm(forms.ModelForm):
             'guests',
             'country',
             'country_code',
+            'latitude',
+            'longitude',
             'category',
             'image',  # Main image
         )
@@ -0,0 +1,223 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.test import RequestFactory
+
+from helpers.pagination import keyset_page
+from property.api import (exclude_booked_properties, PROPERTIES_ORDERING, SEARCH_ORDERING, SORT_ORDERINGS,
+                          PropertyDetailAPIView)
+from property.models import Property, Reservation, BookedNight, PropertyListing
+from property.search import search_listings, within_boxes, annotate_distance
+from helpers.geo import encode_geohash, radius_bbox
+from useraccounts.models import User
+
+
+# A few common words plus a long tail, roughly like real listing copy
+WORDS = [
+    'sunny', 'quiet', 'cozy', 'modern', 'rustic', 'spacious', 'seaside', 'mountain', 'lake', 'garden',
+    'terrace', 'pool', 'loft', 'cottage', 'villa', 'studio', 'historic', 'central', 'family', 'romantic',
+] + [f'word{index}' for index in range(5000)]
+WORD_WEIGHTS = [1 / rank for rank in range(1, len(WORDS) + 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic properties/reservations inside a transaction that is rolled back "
+        "afterwards and report query latency for the property search paths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=['availability', 'pagination', 'filters', 'fulltext', 'geo', 'detail'])
+        parser.add_argument('--properties', type=int, default=2000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--pages', type=int, default=50,
+                            help='How many pages deep the pagination scenario walks.')
+        parser.add_argument('--sort', choices=list(SORT_ORDERINGS), default='newest',
+                            help='List order used by the pagination scenario.')
+        parser.add_argument('--steps', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Cumulative number of reservations to measure at.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        with transaction.atomic():
+            getattr(self, f"bench_{options['scenario']}")(options)
+            transaction.set_rollback(True)
+
+    def seed_properties(self, count, batch_size):
+        landlord = User(id=uuid.uuid4(), email=f'bench-{uuid.uuid4().hex}@example.com', name='Benchmark Landlord')
+        User.objects.bulk_create([landlord])
+        countries = ['Spain', 'France', 'Italy', 'Portugal', 'Greece']
+        categories = ['beach', 'villas', 'cabins', 'tiny_homes']
+        properties = [
+            Property(
+                title=f"{' '.join(random.choices(WORDS, WORD_WEIGHTS, k=3)).capitalize()} {index}",
+                description=' '.join(random.choices(WORDS, WORD_WEIGHTS, k=30)),
+                price_per_night=random.randint(30, 500),
+                bedrooms=random.randint(1, 6),
+                bathrooms=random.randint(1, 3),
+                guests=random.randint(1, 10),
+                country=random.choice(countries),
+                country_code='XX',
+                category=random.choice(categories),
+                image='uploads/properties/beach_1.jpg',
+                landlord=landlord,
+                # Roughly Europe
+                latitude=random.uniform(36, 60),
+                longitude=random.uniform(-10, 30),
+            )
+            for index in range(count)
+        ]
+        Property.objects.bulk_create(properties, batch_size=batch_size)
+        # bulk_create skips the signal that maintains the projection
+        PropertyListing.objects.bulk_create([
+            PropertyListing(
+                property=prop, title=prop.title, description=prop.description, price_per_night=prop.price_per_night, image=prop.image.name,
+                country=prop.country, category=prop.category, guests=prop.guests, bedrooms=prop.bedrooms,
+                bathrooms=prop.bathrooms, landlord=landlord, created_at=prop.created_at,
+                latitude=prop.latitude, longitude=prop.longitude,
+                geohash=encode_geohash(prop.latitude, prop.longitude),
+                popularity=random.randint(0, 200),
+            )
+            for prop in properties
+        ], batch_size=batch_size)
+        return landlord, [prop.id for prop in properties]
+
+    def seed_reservations(self, count, landlord, property_ids, batch_size):
+        first_day = date(2025, 1, 1)
+        for offset in range(0, count, batch_size):
+            reservations, nights = [], []
+            for _ in range(min(batch_size, count - offset)):
+                length = random.randint(1, 7)
+                start = first_day + timedelta(days=random.randint(0, 730))
+                reservation = Reservation(
+                    property_id=random.choice(property_ids),
+                    start_date=start,
+                    end_date=start + timedelta(days=length),
+                    number_of_nights=length,
+                    total_price=100.0 * length,
+                    created_by=landlord,
+                )
+                reservations.append(reservation)
+                nights.extend(
+                    BookedNight(property_id=reservation.property_id, reservation=reservation, night=night)
+                    for night in reservation.nights()
+                )
+            Reservation.objects.bulk_create(reservations)
+            BookedNight.objects.bulk_create(nights, batch_size=batch_size)
+
+    def time_query(self, run, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        return statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+    def bench_availability(self, options):
+        landlord, property_ids = self.seed_properties(options['properties'], options['batch_size'])
+        seeded = 0
+        for step in sorted(options['steps']):
+            self.seed_reservations(step - seeded, landlord, property_ids, options['batch_size'])
+            seeded = step
+
+            def run():
+                checkin = date(2025, 1, 1) + timedelta(days=random.randint(0, 730))
+                checkout = checkin + timedelta(days=random.randint(1, 14))
+                qs = exclude_booked_properties(Property.objects.all(), checkin, checkout)
+                list(qs.values_list('id', flat=True))
+
+            median, p95 = self.time_query(run, options['repeat'])
+            self.stdout.write(f'reservations={step:>9}  median={median:8.2f}ms  p95={p95:8.2f}ms')
+
+    def bench_pagination(self, options):
+        self.seed_properties(options['properties'], options['batch_size'])
+        page_size = options['page_size']
+        ordering = SORT_ORDERINGS[options['sort']]
+
+        def full_listing():
+            list(PropertyListing.objects.all())
+
+        cursors = [None]
+        for _ in range(options['pages'] - 1):
+            _, next_cursor = keyset_page(PropertyListing.objects.all(), ordering, cursors[-1], page_size)
+            cursors.append(next_cursor)
+
+        median, p95 = self.time_query(full_listing, options['repeat'])
+        self.stdout.write(f"full listing ({options['properties']} rows)  median={median:8.2f}ms  p95={p95:8.2f}ms")
+        for depth in (1, options['pages']):
+            cursor = cursors[depth - 1]
+            median, p95 = self.time_query(
+                lambda: keyset_page(PropertyListing.objects.all(), ordering, cursor, page_size),
+                options['repeat'],
+            )
+            self.stdout.write(f'cursor page {depth:>4}  median={median:8.2f}ms  p95={p95:8.2f}ms')
+
+    def bench_filters(self, options):
+        self.seed_properties(options['properties'], options['batch_size'])
+        page_size = options['page_size']
+        filters = {'country': 'Greece', 'category': 'tiny_homes', 'guests__gte': 8}
+
+        def from_properties():
+            list(Property.objects.filter(**filters).order_by('-created_at', '-id')[:page_size])
+
+        def from_listing():
+            list(PropertyListing.objects.filter(**filters).order_by(*PROPERTIES_ORDERING)[:page_size])
+
+        for label, run in (('property table', from_properties), ('search projection', from_listing)):
+            median, p95 = self.time_query(run, options['repeat'])
+            self.stdout.write(f'{label:<18}  median={median:8.2f}ms  p95={p95:8.2f}ms')
+
+    def bench_fulltext(self, options):
+        self.seed_properties(options['properties'], options['batch_size'])
+        page_size = options['page_size']
+        for text in ('sunny', 'seaside villa', 'word1234', 'word4321'):
+            def indexed():
+                list(search_listings(PropertyListing.objects.all(), text).order_by(*SEARCH_ORDERING)[:page_size])
+
+            def scan():
+                qs = Property.objects.all()
+                for word in text.split():
+                    qs = qs.filter(Q(title__icontains=word) | Q(description__icontains=word))
+                list(qs.order_by('-created_at', '-id')[:page_size])
+
+            for label, run in (('full-text index', indexed), ('icontains, unranked', scan)):
+                median, p95 = self.time_query(run, options['repeat'])
+                self.stdout.write(f'{text!r:<22} {label:<19}  median={median:8.2f}ms  p95={p95:8.2f}ms')
+
+    def bench_geo(self, options):
+        self.seed_properties(options['properties'], options['batch_size'])
+        latitude, longitude, radius = 48.86, 2.35, 25
+
+        def cells():
+            qs = within_boxes(PropertyListing.objects.all(), radius_bbox(latitude, longitude, radius))
+            list(annotate_distance(qs, latitude, longitude).filter(distance_km__lte=radius).order_by('distance_km'))
+
+        def coordinates_only():
+            (south, west, north, east), = radius_bbox(latitude, longitude, radius)
+            qs = PropertyListing.objects.filter(latitude__range=(south, north), longitude__range=(west, east))
+            list(annotate_distance(qs, latitude, longitude).filter(distance_km__lte=radius).order_by('distance_km'))
+
+        for label, run in (('geohash cells', cells), ('lat/lng range', coordinates_only)):
+            median, p95 = self.time_query(run, options['repeat'])
+            self.stdout.write(f'{radius}km radius  {label:<14}  median={median:8.2f}ms  p95={p95:8.2f}ms')
+
+    def bench_detail(self, options):
+        _, property_ids = self.seed_properties(1, options['batch_size'])
+        view = PropertyDetailAPIView.as_view()
+        request = RequestFactory().get(f'/api/properties/{property_ids[0]}/')
+        view(request, pk=property_ids[0])  # Warm both cache tiers
+
+        median, p95 = self.time_query(lambda: cache.get('benchmark_search_probe'), options['repeat'])
+        self.stdout.write(f'redis round trip     median={median:8.3f}ms  p95={p95:8.3f}ms')
+        median, p95 = self.time_query(lambda: view(request, pk=property_ids[0]), options['repeat'])
+        self.stdout.write(f'cached detail fetch  median={median:8.3f}ms  p95={p95:8.3f}ms')
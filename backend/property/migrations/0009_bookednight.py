@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:02
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_booked_nights(apps, schema_editor):
+    Reservation = apps.get_model('property', 'Reservation')
+    BookedNight = apps.get_model('property', 'BookedNight')
+    batch = []
+    for reservation in Reservation.objects.only('id', 'property_id', 'start_date', 'end_date').iterator(chunk_size=2000):
+        for offset in range((reservation.end_date - reservation.start_date).days):
+            batch.append(BookedNight(
+                property_id=reservation.property_id,
+                reservation_id=reservation.id,
+                night=reservation.start_date + timedelta(days=offset),
+            ))
+        if len(batch) >= 5000:
+            BookedNight.objects.bulk_create(batch)
+            batch = []
+    BookedNight.objects.bulk_create(batch)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0008_reservation_has_paid_reservation_stripe_checkout_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookedNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='property.property')),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='property.reservation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['property', 'night'], name='bookednight_property_night')],
+            },
+        ),
+        migrations.RunPython(backfill_booked_nights, migrations.RunPython.noop),
+    ]
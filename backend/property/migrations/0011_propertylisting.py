@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_listings(apps, schema_editor):
+    Property = apps.get_model('property', 'Property')
+    PropertyListing = apps.get_model('property', 'PropertyListing')
+    batch = []
+    for property in Property.objects.iterator(chunk_size=2000):
+        batch.append(PropertyListing(
+            property_id=property.id,
+            title=property.title,
+            price_per_night=property.price_per_night,
+            image=property.image.name,
+            country=property.country,
+            category=property.category,
+            guests=property.guests,
+            bedrooms=property.bedrooms,
+            bathrooms=property.bathrooms,
+            landlord_id=property.landlord_id,
+            created_at=property.created_at,
+        ))
+        if len(batch) >= 2000:
+            PropertyListing.objects.bulk_create(batch)
+            batch = []
+    PropertyListing.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0010_property_created_at_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyListing',
+            fields=[
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='property.property')),
+                ('title', models.CharField(max_length=255)),
+                ('price_per_night', models.IntegerField()),
+                ('image', models.CharField(max_length=255)),
+                ('country', models.CharField(max_length=255)),
+                ('category', models.CharField(max_length=255)),
+                ('guests', models.IntegerField()),
+                ('bedrooms', models.IntegerField()),
+                ('bathrooms', models.IntegerField()),
+                ('created_at', models.DateTimeField()),
+                ('landlord', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'property'], name='listing_created_at'), models.Index(fields=['country', 'category', 'created_at', 'property'], name='listing_country_category'), models.Index(fields=['country', 'created_at', 'property'], name='listing_country'), models.Index(fields=['category', 'created_at', 'property'], name='listing_category'), models.Index(fields=['landlord', 'created_at', 'property'], name='listing_landlord')],
+            },
+        ),
+        migrations.RunPython(backfill_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,91 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# The SQL is spelled out here rather than imported so later changes to the search
+# code cannot rewrite this migration; 0019 replaces the SQLite index.
+POSTGRES_INSTALL = [
+    """
+    ALTER TABLE property_propertylisting ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX listing_search_vector ON property_propertylisting USING gin (search_vector)",
+]
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS listing_search_vector",
+    "ALTER TABLE property_propertylisting DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS property_listing_fts_insert",
+    "DROP TRIGGER IF EXISTS property_listing_fts_delete",
+    "DROP TRIGGER IF EXISTS property_listing_fts_update",
+    "DROP TABLE IF EXISTS property_listing_fts",
+]
+SQLITE_INSTALL = SQLITE_UNINSTALL + [
+    # External-content index over the listing table, kept in step by triggers
+    """
+    CREATE VIRTUAL TABLE property_listing_fts USING fts5(
+        title, description, content='property_propertylisting', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_insert AFTER INSERT ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_delete AFTER DELETE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_update AFTER UPDATE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END
+    """,
+    "INSERT INTO property_listing_fts(property_listing_fts) VALUES ('rebuild')",
+]
+
+
+def copy_descriptions(apps, schema_editor):
+    Property = apps.get_model('property', 'Property')
+    PropertyListing = apps.get_model('property', 'PropertyListing')
+    PropertyListing.objects.update(
+        description=Subquery(Property.objects.filter(pk=OuterRef('property_id')).values('description')[:1])
+    )
+
+
+def run_for_vendor(postgres, sqlite):
+    def run(apps, schema_editor):
+        statements = {'postgresql': postgres, 'sqlite': sqlite}.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0011_propertylisting'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='propertylisting',
+            name='description',
+            field=models.TextField(default=''),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_descriptions, migrations.RunPython.noop),
+        # Postgres gets a generated tsvector column with a GIN index; SQLite (dev and
+        # tests) an FTS5 table keyed by the listing rowid
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_INSTALL, SQLITE_INSTALL),
+            run_for_vendor(POSTGRES_UNINSTALL, SQLITE_UNINSTALL),
+        ),
+    ]
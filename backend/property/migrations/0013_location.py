@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0012_propertylisting_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='propertylisting',
+            name='geohash',
+            field=models.CharField(max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='propertylisting',
+            name='latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='propertylisting',
+            name='longitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(fields=['geohash'], name='listing_geohash'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# The full-text triggers as 0012 created them, spelled out so later changes to the
+# search code cannot rewrite this migration
+SQLITE_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS property_listing_fts_insert",
+    "DROP TRIGGER IF EXISTS property_listing_fts_delete",
+    "DROP TRIGGER IF EXISTS property_listing_fts_update",
+    "DROP TABLE IF EXISTS property_listing_fts",
+    """
+    CREATE VIRTUAL TABLE property_listing_fts USING fts5(
+        title, description, content='property_propertylisting', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_insert AFTER INSERT ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_delete AFTER DELETE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_update AFTER UPDATE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END
+    """,
+    "INSERT INTO property_listing_fts(property_listing_fts) VALUES ('rebuild')",
+]
+
+
+def reinstall_sqlite_search_index(apps, schema_editor):
+    # Postgres alters the table in place and keeps its generated search column
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_SEARCH_INDEX:
+        schema_editor.execute(statement)
+
+
+def backfill_popularity(apps, schema_editor):
+    Property = apps.get_model('property', 'Property')
+    Reservation = apps.get_model('property', 'Reservation')
+    PropertyListing = apps.get_model('property', 'PropertyListing')
+
+    def count(qs):
+        counted = qs.filter(property_id=OuterRef('property_id')).values('property_id').annotate(total=Count('pk'))
+        return Coalesce(Subquery(counted.values('total')), Value(0))
+
+    PropertyListing.objects.update(
+        popularity=count(Property.favorited.through.objects.all()) + count(Reservation.objects.all())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0013_location'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # On SQLite adding a defaulted column rebuilds the table, which drops the
+        # full-text triggers; they are reinstalled afterwards in both directions.
+        migrations.RunPython(migrations.RunPython.noop, reinstall_sqlite_search_index),
+        migrations.AddField(
+            model_name='propertylisting',
+            name='popularity',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(fields=['price_per_night', 'property'], name='listing_price'),
+        ),
+        migrations.AddIndex(
+            model_name='propertylisting',
+            index=models.Index(fields=['popularity', 'property'], name='listing_popularity'),
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+        migrations.RunPython(reinstall_sqlite_search_index, migrations.RunPython.noop),
+    ]
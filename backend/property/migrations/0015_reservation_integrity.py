@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import F
+
+
+def remove_duplicate_reservations(apps, schema_editor):
+    """
+    Duplicate webhook deliveries wrote some checkouts more than once, which
+    the unique index below would refuse. Keep one reservation per checkout,
+    the paid one if any, else the oldest, and delete the rest with their
+    booked nights. Blank checkout ids become NULL so they do not collide.
+    """
+    Reservation = apps.get_model('property', 'Reservation')
+    PropertyListing = apps.get_model('property', 'PropertyListing')
+    Reservation.objects.filter(stripe_checkout_id='').update(stripe_checkout_id=None)
+
+    by_checkout = defaultdict(list)
+    for reservation in (Reservation.objects
+                        .filter(stripe_checkout_id__isnull=False)
+                        .order_by('stripe_checkout_id', '-has_paid', 'created_at', 'id')
+                        .only('id', 'property_id', 'stripe_checkout_id', 'has_paid', 'created_at')):
+        by_checkout[reservation.stripe_checkout_id].append(reservation)
+    duplicates = [reservation for reservations in by_checkout.values() for reservation in reservations[1:]]
+    if not duplicates:
+        return
+    removed_per_property = defaultdict(int)
+    for reservation in duplicates:
+        removed_per_property[reservation.property_id] += 1
+    Reservation.objects.filter(pk__in=[reservation.pk for reservation in duplicates]).delete()
+    # Popularity counted every copy
+    for property_id, removed in removed_per_property.items():
+        PropertyListing.objects.filter(pk=property_id).update(popularity=F('popularity') - removed)
+    duplicated = sum(1 for reservations in by_checkout.values() if len(reservations) > 1)
+    print(f"\n  Removed {len(duplicates)} duplicate reservations of {duplicated} checkouts")
+
+
+def check_overlapping_reservations(apps, schema_editor):
+    """
+    Overlapping stays of different guests cannot be resolved automatically:
+    someone has to decide who keeps the dates. On Postgres, where the
+    exclusion constraint below would fail on them, stop with the list.
+    """
+    Reservation = apps.get_model('property', 'Reservation')
+    conflicts = []
+    latest_by_property = {}
+    for reservation in Reservation.objects.order_by('property_id', 'start_date', 'end_date', 'id'):
+        latest = latest_by_property.get(reservation.property_id)
+        if latest is not None and reservation.start_date < latest.end_date:
+            conflicts.append(
+                f"property {reservation.property_id}: reservation {latest.id} "
+                f"({latest.start_date}..{latest.end_date}) overlaps {reservation.id} "
+                f"({reservation.start_date}..{reservation.end_date})"
+            )
+        if latest is None or reservation.end_date > latest.end_date:
+            latest_by_property[reservation.property_id] = reservation
+    if not conflicts:
+        return
+    report = "\n  ".join(conflicts)
+    if schema_editor.connection.vendor == 'postgresql':
+        raise RuntimeError(
+            f"{len(conflicts)} overlapping reservations must be resolved before "
+            f"reservation_no_overlap can be added:\n  {report}"
+        )
+    print(f"\n  Warning: {len(conflicts)} overlapping reservations:\n  {report}")
+
+
+def add_overlap_constraint(apps, schema_editor):
+    # Exclusion constraints need a GiST index over (uuid, daterange), hence btree_gist.
+    # SQLite relies on the locking in property.booking instead.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    schema_editor.execute(
+        "ALTER TABLE property_reservation ADD CONSTRAINT reservation_no_overlap "
+        "EXCLUDE USING gist (property_id WITH =, daterange(start_date, end_date, '[)') WITH &&)"
+    )
+
+
+def drop_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("ALTER TABLE property_reservation DROP CONSTRAINT IF EXISTS reservation_no_overlap")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0014_listing_sort'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_reservations, migrations.RunPython.noop),
+        migrations.RunPython(check_overlapping_reservations, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='reservation',
+            name='stripe_checkout_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(add_overlap_constraint, drop_overlap_constraint),
+    ]
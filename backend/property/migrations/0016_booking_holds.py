@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:56
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0015_reservation_integrity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookednight',
+            name='expires_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='bookednight',
+            name='reservation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='property.reservation'),
+        ),
+        migrations.CreateModel(
+            name='BookingHold',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('start_date', models.DateField()),
+                ('end_date', models.DateField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booking_holds', to=settings.AUTH_USER_MODEL)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='property.property')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='bookednight',
+            name='hold',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='property.bookinghold'),
+        ),
+    ]
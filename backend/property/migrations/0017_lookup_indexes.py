@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0016_booking_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['property', 'start_date', 'end_date'], name='reservation_property_dates'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0017_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='property',
+            name='property_created_at_id',
+        ),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS property_listing_fts_insert",
+    "DROP TRIGGER IF EXISTS property_listing_fts_delete",
+    "DROP TRIGGER IF EXISTS property_listing_fts_update",
+    "DROP TABLE IF EXISTS property_listing_fts",
+]
+# The listing key joins in as an unindexed column, so searches can join the
+# index to the listing table through the ORM instead of matching on rowid
+SQLITE_INSTALL = SQLITE_DROP + [
+    """
+    CREATE VIRTUAL TABLE property_listing_fts USING fts5(
+        property_id UNINDEXED, title, description,
+        content='property_propertylisting', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_insert AFTER INSERT ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(rowid, property_id, title, description)
+        VALUES (new.rowid, new.property_id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_delete AFTER DELETE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, property_id, title, description)
+        VALUES ('delete', old.rowid, old.property_id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_update AFTER UPDATE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, property_id, title, description)
+        VALUES ('delete', old.rowid, old.property_id, old.title, old.description);
+        INSERT INTO property_listing_fts(rowid, property_id, title, description)
+        VALUES (new.rowid, new.property_id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO property_listing_fts(property_listing_fts) VALUES ('rebuild')",
+]
+# The index as 0012 created it
+SQLITE_RESTORE = SQLITE_DROP + [
+    """
+    CREATE VIRTUAL TABLE property_listing_fts USING fts5(
+        title, description, content='property_propertylisting', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_insert AFTER INSERT ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_delete AFTER DELETE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER property_listing_fts_update AFTER UPDATE ON property_propertylisting BEGIN
+        INSERT INTO property_listing_fts(property_listing_fts, rowid, title, description)
+        VALUES ('delete', old.rowid, old.title, old.description);
+        INSERT INTO property_listing_fts(rowid, title, description) VALUES (new.rowid, new.title, new.description);
+    END
+    """,
+    "INSERT INTO property_listing_fts(property_listing_fts) VALUES ('rebuild')",
+]
+
+
+def run_on_sqlite(statements):
+    # Postgres keeps searching its generated column and has no index table
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('property', '0018_drop_property_created_at_id'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(SQLITE_INSTALL), run_on_sqlite(SQLITE_RESTORE)),
+        migrations.CreateModel(
+            name='ListingSearchIndex',
+            fields=[
+                ('listing', models.OneToOneField(db_column='property_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='property.propertylisting')),
+            ],
+            options={
+                'db_table': 'property_listing_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,7 +1,12 @@
 import uuid
+from datetime import timedelta
 from django.db import models
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.conf import settings
 
+from helpers.geo import encode_geohash
 from useraccounts.models import User
 
 
@@ -15,12 +20,14 @@ class Property(models.Model):
     guests = models.IntegerField()
     country = models.CharField(max_length=255)
     country_code = models.CharField(max_length=10)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
     favorited = models.ManyToManyField(User, related_name='favorites', blank=True)
     category = models.CharField(max_length=255)
     image = models.ImageField(upload_to='uploads/properties')
     landlord = models.ForeignKey(User, related_name='properties', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+
     def image_url(self):
         return f'{settings.WEBSITE_URL}{self.image.url}'
 
@@ -34,6 +41,15 @@ class PropertyImage(models.Model):
         return f"{settings.WEBSITE_URL}{self.image.url}"
     
 
+def stay_nights(start, end):
+    """Dates of every night covered by a stay, checkout day excluded."""
+    if isinstance(start, str):
+        start = parse_date(start)
+    if isinstance(end, str):
+        end = parse_date(end)
+    return [start + timedelta(days=offset) for offset in range((end - start).days)]
+
+
 class Reservation(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     property = models.ForeignKey(Property, related_name='reservations', on_delete=models.CASCADE)
@@ -42,7 +58,144 @@ class Reservation(models.Model):
     number_of_nights = models.IntegerField()
     guests = models.IntegerField(default=1)
     total_price = models.FloatField()
-    stripe_checkout_id = models.CharField(max_length=255, null=True, blank=True)  # New field
+    # Unique so a checkout can only ever produce one reservation, see property.booking
+    stripe_checkout_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
     has_paid = models.BooleanField(default=False)
     created_by = models.ForeignKey(User, related_name='reservations', on_delete=models.CASCADE)
     created_at = models.DateField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A property's reservations by date, e.g. the landlord's reservation list
+            models.Index(fields=['property', 'start_date', 'end_date'], name='reservation_property_dates'),
+        ]
+
+    def nights(self):
+        return stay_nights(self.start_date, self.end_date)
+
+
+class BookingHold(models.Model):
+    """
+    Nights held for a guest while they pay on Stripe Checkout, so nobody else
+    can start paying for the same dates. Paying turns the hold into a
+    reservation; otherwise it lapses at expires_at and is swept up by
+    property.tasks.release_expired_holds. See property.booking.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    property = models.ForeignKey(Property, related_name='holds', on_delete=models.CASCADE)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    created_by = models.ForeignKey(User, related_name='booking_holds', on_delete=models.CASCADE)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def nights(self):
+        return stay_nights(self.start_date, self.end_date)
+
+
+class BookedNight(models.Model):
+    """
+    One row per night a property is occupied by a reservation or held by a
+    checkout in progress.
+
+    Kept in sync from the Reservation and BookingHold signals so that
+    availability search is a single indexed anti-join on (property, night)
+    instead of a Python loop over every overlapping reservation. Held nights
+    carry the hold's expires_at and stop counting once it has passed, whether
+    or not the sweeper has deleted them yet.
+    """
+    property = models.ForeignKey(Property, related_name='booked_nights', on_delete=models.CASCADE)
+    reservation = models.ForeignKey(Reservation, related_name='booked_nights', null=True, on_delete=models.CASCADE)
+    hold = models.ForeignKey(BookingHold, related_name='booked_nights', null=True, on_delete=models.CASCADE)
+    night = models.DateField()
+    expires_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['property', 'night'], name='bookednight_property_night'),
+        ]
+
+    @classmethod
+    def active(cls):
+        """Nights that currently block a booking: reserved ones and unexpired holds."""
+        return cls.objects.filter(models.Q(expires_at__isnull=True) | models.Q(expires_at__gt=timezone.now()))
+
+
+class PropertyListing(models.Model):
+    """
+    Denormalized, read-only projection of Property holding the list-card fields
+    and every column the search filters on. Refreshed from the Property signals;
+    the list endpoint reads from this table alone. The full-text index over
+    title/description is created outside the ORM, see property.search.
+    """
+    property = models.OneToOneField(Property, primary_key=True, related_name='listing', on_delete=models.CASCADE)
+    title = models.CharField(max_length=255)
+    description = models.TextField()
+    price_per_night = models.IntegerField()
+    image = models.CharField(max_length=255)
+    country = models.CharField(max_length=255)
+    category = models.CharField(max_length=255)
+    guests = models.IntegerField()
+    bedrooms = models.IntegerField()
+    bathrooms = models.IntegerField()
+    landlord = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+    # Spatial index key for bbox/radius lookups; null when the property has no location
+    geohash = models.CharField(max_length=12, null=True)
+    # Favorites plus reservations, kept up to date by the property signals
+    popularity = models.IntegerField(default=0)
+
+    class Meta:
+        # Equality filters first, then the pagination order, so a filtered page is a
+        # single ordered index walk that stops after page_size + 1 rows. Range filters
+        # (guests, bedrooms, bathrooms) are checked against the rows on that walk.
+        indexes = [
+            models.Index(fields=['created_at', 'property'], name='listing_created_at'),
+            models.Index(fields=['country', 'category', 'created_at', 'property'], name='listing_country_category'),
+            models.Index(fields=['country', 'created_at', 'property'], name='listing_country'),
+            models.Index(fields=['category', 'created_at', 'property'], name='listing_category'),
+            models.Index(fields=['landlord', 'created_at', 'property'], name='listing_landlord'),
+            models.Index(fields=['geohash'], name='listing_geohash'),
+            models.Index(fields=['price_per_night', 'property'], name='listing_price'),
+            models.Index(fields=['popularity', 'property'], name='listing_popularity'),
+        ]
+
+    @classmethod
+    def refresh(cls, property):
+        has_location = property.latitude is not None and property.longitude is not None
+        cls.objects.update_or_create(property=property, defaults={
+            'title': property.title,
+            'description': property.description,
+            'price_per_night': property.price_per_night,
+            'image': property.image.name,
+            'country': property.country,
+            'category': property.category,
+            'guests': property.guests,
+            'bedrooms': property.bedrooms,
+            'bathrooms': property.bathrooms,
+            'landlord_id': property.landlord_id,
+            'created_at': property.created_at,
+            'latitude': property.latitude,
+            'longitude': property.longitude,
+            'geohash': encode_geohash(property.latitude, property.longitude) if has_location else None,
+        })
+
+    def image_url(self):
+        return f'{settings.WEBSITE_URL}{default_storage.url(self.image)}'
+
+
+class ListingSearchIndex(models.Model):
+    """
+    The SQLite FTS5 table over PropertyListing title/description, mapped so the
+    ORM can join it; see property.search. Its rows are kept in step by triggers
+    and never written through the ORM. Postgres searches a generated column on
+    the listing table instead and has no such table.
+    """
+    listing = models.OneToOneField(PropertyListing, primary_key=True, db_column='property_id', db_constraint=False,
+                                   related_name='search_index', on_delete=models.DO_NOTHING)
+
+    class Meta:
+        managed = False
+        db_table = 'property_listing_fts'
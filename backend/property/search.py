@@ -0,0 +1,78 @@
+import math
+import re
+from django.db import connection
+from django.db.models import BooleanField, FloatField, F, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Sqrt
+from helpers.geo import cover_ranges, KM_PER_DEGREE
+
+class InvalidSearchParameter(ValueError):
+    pass
+
+
+LISTING_TABLE = 'property_propertylisting'
+SQLITE_FTS_TABLE = 'property_listing_fts'
+# Title matches count ten times as much as description matches
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+# The indexes themselves are created by the migrations: a generated, GIN-indexed
+# search_vector column on Postgres, and on SQLite (dev and tests) an FTS5 table
+# mapped as ListingSearchIndex (see property 0019). SQLite migrations that rebuild
+# the listing table drop its triggers and must install them again.
+
+
+def fts5_query(text):
+    """
+    Turn free text into an FTS5 expression that requires every word. Words are
+    quoted so user input can never be parsed as FTS5 syntax.
+    """
+    return ' '.join(f'"{word}"' for word in re.findall(r'\w+', text))
+
+
+def search_listings(qs, text):
+    """
+    Restrict a PropertyListing queryset to full-text matches for `text` and
+    annotate `search_rank`, where higher means more relevant.
+    """
+    if connection.vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', %s)"
+        match = RawSQL(f"{LISTING_TABLE}.search_vector @@ {tsquery}", [text], output_field=BooleanField())
+        # float8 so the rank survives the round trip through a pagination cursor exactly
+        rank = RawSQL(f"ts_rank({LISTING_TABLE}.search_vector, {tsquery})::float8", [text], output_field=FloatField())
+        return qs.annotate(search_rank=rank).filter(match)
+
+    expression = fts5_query(text)
+    if not expression:
+        return qs.none()
+    # Joined rather than correlated: FTS5 evaluates MATCH once and scores each hit
+    # in the same pass, whereas a per-row subquery re-runs the match for every row.
+    match = RawSQL(f"{SQLITE_FTS_TABLE} MATCH %s", [expression], output_field=BooleanField())
+    # bm25() is lower-is-better, so negate it; the unindexed property_id column has no weight
+    rank = RawSQL(f"-bm25({SQLITE_FTS_TABLE}, 0, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})", [], output_field=FloatField())
+    return qs.filter(search_index__isnull=False).annotate(search_rank=rank).filter(match)
+
+
+def within_boxes(qs, boxes):
+    """
+    Restrict a PropertyListing queryset to the given (south, west, north, east)
+    boxes. The geohash ranges covering each box narrow the scan to a few index
+    ranges; the coordinate check then drops the cell margins.
+    """
+    cells, exact = Q(), Q()
+    for south, west, north, east in boxes:
+        for start, stop in cover_ranges(south, west, north, east):
+            cells |= Q(geohash__gte=start, geohash__lt=stop) if stop else Q(geohash__gte=start)
+        exact |= Q(latitude__range=(south, north), longitude__range=(west, east))
+    return qs.filter(cells).filter(exact)
+
+
+def annotate_distance(qs, latitude, longitude):
+    """
+    Annotate `distance_km` from (latitude, longitude) using the equirectangular
+    approximation, which is accurate to well under 1% at city-search radii.
+    """
+    dx = (F('longitude') - Value(longitude)) * Value(math.cos(math.radians(latitude)))
+    dy = F('latitude') - Value(latitude)
+    distance = Sqrt(dx * dx + dy * dy) * Value(KM_PER_DEGREE)
+    return qs.annotate(distance_km=distance)
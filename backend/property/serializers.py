@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Property, Reservation, PropertyImage
+from .models import Property, Reservation, PropertyImage, PropertyListing
 from useraccounts.serializers import UserModelDynamicSerializer
 
 class PropertyImagesSerializer(serializers.ModelSerializer):
@@ -28,6 +28,25 @@ class PropertyModelDynamicSerializer(serializers.ModelSerializer):
         model = Property
         fields = '__all__'
     
+class PropertyListingSerializer(serializers.ModelSerializer):
+    id = serializers.CharField(source='property_id')
+    image_url = serializers.SerializerMethodField()
+
+    def get_image_url(self, obj):
+        return obj.image_url()
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Only present on radius searches
+        if getattr(instance, 'distance_km', None) is not None:
+            data['distance_km'] = round(instance.distance_km, 2)
+        return data
+
+    class Meta:
+        model = PropertyListing
+        fields = ['id', 'title', 'price_per_night', 'image_url', 'country', 'latitude', 'longitude']
+
+
 class ReservationListSerializer(serializers.ModelSerializer):
     property = PropertyModelDynamicSerializer(read_only=True, fields=[
             'id',
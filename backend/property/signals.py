@@ -0,0 +1,182 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Property, PropertyImage, Reservation, BookedNight, BookingHold, PropertyListing
+from .cache import (bump_catalogue_version, bump_availability_version, bump_popularity_version,
+                    invalidate_property_detail, invalidate_availability_months, favorites_key)
+
+
+def after_commit(invalidate, *args):
+    """
+    Run a cache invalidation once the surrounding transaction commits (at once
+    outside one). Invalidating earlier lets a concurrent reader rebuild the
+    entry from rows that are not committed yet, caching the stale value.
+    """
+    transaction.on_commit(lambda: invalidate(*args))
+
+
+@receiver(post_save, sender=Reservation)
+def sync_booked_nights(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Rebuild the booked nights of a reservation whenever its dates may have changed.
+    Deletion is handled by the cascade on BookedNight.reservation.
+    """
+    if raw:
+        return
+    if update_fields and not {'start_date', 'end_date', 'property'} & set(update_fields):
+        return
+    nights = instance.nights()
+    changed = {(instance.property_id, night) for night in nights}
+    if not created:
+        old_nights = BookedNight.objects.filter(reservation=instance)
+        changed.update(old_nights.values_list('property_id', 'night'))
+        old_nights.delete()
+    BookedNight.objects.bulk_create([
+        BookedNight(property_id=instance.property_id, reservation=instance, night=night)
+        for night in nights
+    ])
+    after_commit(invalidate_availability_months, changed)
+
+
+@receiver(post_delete, sender=Reservation)
+def release_booked_nights(sender, instance, **kwargs):
+    # The nights themselves go with the cascade; only the cached calendar needs dropping
+    after_commit(invalidate_availability_months, [(instance.property_id, night) for night in instance.nights()])
+
+
+@receiver(post_save, sender=BookingHold)
+def hold_booked_nights(sender, instance, created, raw=False, **kwargs):
+    """Holds are never rescheduled, so their nights are only written once."""
+    if raw or not created:
+        return
+    nights = instance.nights()
+    BookedNight.objects.bulk_create([
+        BookedNight(property_id=instance.property_id, hold=instance, night=night, expires_at=instance.expires_at)
+        for night in nights
+    ])
+    after_commit(invalidate_availability_months, [(instance.property_id, night) for night in nights])
+
+
+@receiver(post_delete, sender=BookingHold)
+def release_held_nights(sender, instance, **kwargs):
+    after_commit(invalidate_availability_months, [(instance.property_id, night) for night in instance.nights()])
+
+
+@receiver(post_save, sender=Property)
+def sync_property_listing(sender, instance, raw=False, **kwargs):
+    """
+    Keep the search projection in step with the property. Deletion is handled by
+    the cascade on PropertyListing.property; bulk updates bypass signals and need
+    an explicit PropertyListing.refresh.
+    """
+    if raw:
+        return
+    PropertyListing.refresh(instance)
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def invalidate_property(sender, instance, **kwargs):
+    after_commit(invalidate_property_detail, instance.pk)
+    after_commit(bump_catalogue_version)
+
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_delete, sender=PropertyImage)
+def invalidate_property_images(sender, instance, **kwargs):
+    after_commit(invalidate_property_detail, instance.property_id)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=BookingHold)
+@receiver(post_delete, sender=BookingHold)
+def invalidate_availability(sender, instance, **kwargs):
+    # Only the date-filtered pages go; the popularity reservations add is handled by bump_popularity
+    after_commit(bump_availability_version)
+
+
+def bump_popularity(property_ids, delta):
+    if property_ids and delta:
+        # Clamped at zero, so a miscount can never push a listing below unpopular
+        PropertyListing.objects.filter(pk__in=property_ids).update(
+            popularity=Greatest(F('popularity') + delta, Value(0))
+        )
+        # Popularity-sorted pages are the only cached results that read it
+        after_commit(bump_popularity_version)
+
+
+@receiver(post_save, sender=Reservation)
+def count_reservation(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_popularity([instance.property_id], 1)
+
+
+@receiver(post_delete, sender=Reservation)
+def uncount_reservation(sender, instance, **kwargs):
+    bump_popularity([instance.property_id], -1)
+
+
+@receiver(m2m_changed, sender=Property.favorited.through)
+def count_favorites(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep PropertyListing.popularity in step with favorites using relative
+    updates, so concurrent toggles never overwrite each other.
+    """
+    if action == 'pre_clear':
+        # The cleared rows are unknown once they are gone
+        if reverse:
+            instance._cleared_favorite_properties = set(instance.favorites.values_list('pk', flat=True))
+        else:
+            instance._cleared_favorite_count = instance.favorited.count()
+        return
+    if action == 'pre_remove':
+        # pk_set lists whatever was asked to be removed, favorited or not; keep only the rows that exist
+        if reverse:
+            instance._removed_favorite_properties = set(
+                sender.objects.filter(user=instance, property__in=pk_set).values_list('property_id', flat=True)
+            )
+        else:
+            instance._removed_favorite_count = sender.objects.filter(property=instance, user__in=pk_set).count()
+        return
+    if action == 'post_add':
+        # Django already drops ids that were favorited before from pk_set
+        if reverse:
+            bump_popularity(pk_set, 1)
+        else:
+            bump_popularity([instance.pk], len(pk_set))
+    elif action == 'post_remove':
+        if reverse:
+            bump_popularity(getattr(instance, '_removed_favorite_properties', set()), -1)
+        else:
+            bump_popularity([instance.pk], -getattr(instance, '_removed_favorite_count', 0))
+    elif action == 'post_clear':
+        if reverse:
+            bump_popularity(getattr(instance, '_cleared_favorite_properties', set()), -1)
+        else:
+            bump_popularity([instance.pk], -getattr(instance, '_cleared_favorite_count', 0))
+
+
+@receiver(m2m_changed, sender=Property.favorited.through)
+def invalidate_favorites(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Favorites live in a per-user cache entry, so only the affected users'
+    sets are dropped; the shared catalogue pages stay valid.
+    """
+    if action == 'pre_clear':
+        # The cleared ids are unknown once the rows are gone
+        if reverse:
+            instance._cleared_favorite_users = {instance.pk}
+        else:
+            instance._cleared_favorite_users = set(instance.favorited.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_favorite_users', set())
+    elif action in ('post_add', 'post_remove'):
+        user_ids = {instance.pk} if reverse else pk_set
+    else:
+        return
+    after_commit(cache.delete_many, [favorites_key(user_id) for user_id in user_ids])
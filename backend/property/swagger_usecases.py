@@ -9,7 +9,9 @@ property_list_schema = openapi.Schema(
         "price_per_night": openapi.Schema(type=openapi.TYPE_INTEGER, description="Price per night"),
         "image_url": openapi.Schema(type=openapi.TYPE_STRING, description="URL of the property image"),
         "country": openapi.Schema(type=openapi.TYPE_STRING, description="Country"),
-
+        "latitude": openapi.Schema(type=openapi.TYPE_NUMBER, description="Latitude, if the property has a location"),
+        "longitude": openapi.Schema(type=openapi.TYPE_NUMBER, description="Longitude, if the property has a location"),
+        "distance_km": openapi.Schema(type=openapi.TYPE_NUMBER, description="Distance from `near`, radius searches only"),
     },
 )
 
@@ -74,4 +76,48 @@ create_property_request_schema = openapi.Schema(
         "image": openapi.Schema(type=openapi.TYPE_STRING, format="binary", description="Main property image"),
     },
     required=["title", "description", "price_per_night", "bedrooms", "bathrooms", "guests", "country"],
-)
\ No newline at end of file
+)
+
+cache_stats_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "pid": openapi.Schema(type=openapi.TYPE_INTEGER, description="Worker process id"),
+        "local_hits": openapi.Schema(type=openapi.TYPE_INTEGER, description="Reads served by the in-process tier"),
+        "local_misses": openapi.Schema(type=openapi.TYPE_INTEGER, description="Reads that fell through to Redis"),
+        "redis_hits": openapi.Schema(type=openapi.TYPE_INTEGER, description="Reads served by Redis"),
+        "redis_misses": openapi.Schema(type=openapi.TYPE_INTEGER, description="Reads missing from both tiers"),
+        "local_entries": openapi.Schema(type=openapi.TYPE_INTEGER, description="Entries held in the in-process tier"),
+    },
+)
+
+facet_values_schema = openapi.Schema(
+    type=openapi.TYPE_ARRAY,
+    items=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            "value": openapi.Schema(type=openapi.TYPE_STRING, description="Facet value"),
+            "count": openapi.Schema(type=openapi.TYPE_INTEGER, description="Matching properties"),
+        },
+    ),
+)
+
+property_facets_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "total": openapi.Schema(type=openapi.TYPE_INTEGER, description="Properties matching every filter"),
+        "country": facet_values_schema,
+        "category": facet_values_schema,
+        "bedrooms": facet_values_schema,
+    },
+)
+
+availability_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "months": openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            description="YYYY-MM -> bitmap of booked nights, bit (day - 1) set when booked",
+            additional_properties=openapi.Schema(type=openapi.TYPE_INTEGER),
+        ),
+    },
+)
@@ -2,6 +2,7 @@ from celery import shared_task
 from helpers.messaging import send_message
 from useraccounts.models import User
 from .models import Property
+from . import booking
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.utils import timezone
@@ -221,4 +222,17 @@ def archive_old_properties():
             f.write(f"{property.name}, {property.location}, {property.created_at}\n")
     
     # Optionally, delete old properties
-    old_properties.delete()
\ No newline at end of file
+    old_properties.delete()
+
+
+@shared_task
+def release_expired_holds():
+    """
+    Delete lapsed checkout holds. Reads already ignore them; this frees the
+    rows and drops the cached calendars and search pages that still show the
+    nights as taken.
+    """
+    released = booking.release_expired_holds()
+    if released:
+        logger.info(f"Released {released} expired booking holds")
+    return released
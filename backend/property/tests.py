@@ -1,7 +1,25 @@
 import pytest
-from unittest.mock import patch
+from helpers.pagination import encode_cursor
+from unittest.mock import patch, Mock
 from useraccounts.conftest import create_landlord, create_reservation
 from rest_framework.test import APIClient
+from property.models import Property, Reservation, PropertyListing, BookingHold, BookedNight
+from property.api import PROPERTIES_ORDERING, SORT_ORDERINGS
+from property.search import within_boxes, search_listings
+from helpers.geo import parse_bbox
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from useraccounts.models import User
+from property.cache import get_or_rebuild, STALE_GRACE, catalogue_cache
+from property.booking import create_reservation as book, BookingConflict, place_hold, release_expired_holds
+from property.tasks import release_expired_holds as release_expired_holds_task
+from property.management.commands.benchmark_search import Command as BenchmarkSearch
+from datetime import timedelta
+from django.utils import timezone
+from django.db import connection, transaction
+import threading
+import time
 from django.core.files.uploadedfile import SimpleUploadedFile
 from PIL import Image
 import io
@@ -122,11 +140,12 @@ def test_property_detail(
 
     # Assert: Verify Redis interactions
     mock_redis_get.assert_called_once_with(f"property_detail_{property_instance.id}")
-    mock_redis_set.assert_called_once_with(
-        f"property_detail_{property_instance.id}",
-        response_data,
-        timeout=3600
-    )
+    mock_redis_set.assert_called_once()
+    cache_key, entry = mock_redis_set.call_args.args
+    assert cache_key == f"property_detail_{property_instance.id}"
+    assert entry["value"] == response_data
+    assert time.time() < entry["expires_at"] <= time.time() + 3600
+    assert mock_redis_set.call_args.kwargs["timeout"] == 3600 + STALE_GRACE
 
 
 @pytest.mark.django_db
@@ -239,3 +258,667 @@ def test_property_list_basic(
     if mock_redis_set.call_count > 0:
         mock_redis_set.assert_called()
 
+
+
+@pytest.mark.django_db
+def test_property_list_excludes_booked_dates(api_client: APIClient, create_reservation):
+    # The fixture reservation books the nights of 2025-01-01 .. 2025-01-04
+    reservation = create_reservation
+    assert reservation.booked_nights.count() == 4
+
+    response = api_client.get("/api/properties/?checkIn=2025-01-03&checkOut=2025-01-07")
+    assert response.status_code == 200
+    assert response.json()["count"] == 0
+
+    # Checking in on the checkout day of the existing stay is allowed
+    response = api_client.get("/api/properties/?checkIn=2025-01-05&checkOut=2025-01-07")
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["data"]] == [str(reservation.property.id)]
+
+    # Cancelling the reservation frees the nights again
+    Reservation.objects.filter(pk=reservation.pk).delete()
+    assert not reservation.property.booked_nights.exists()
+
+
+@pytest.mark.django_db
+def test_property_list_cursor_pagination(api_client: APIClient, create_property):
+    landlord = create_property.landlord
+    for index in range(2):
+        Property.objects.create(
+            title=f"Extra Property {index}",
+            description="Another test property.",
+            price_per_night=80,
+            bedrooms=1,
+            bathrooms=1,
+            guests=2,
+            country="Testland",
+            country_code="TL",
+            category="Test Category",
+            landlord=landlord,
+            image="uploads/properties/beach_1.jpg",
+        )
+
+    response = api_client.get("/api/properties/?cursor=&page_size=2")
+    assert response.status_code == 200
+    first_page = response.json()
+    assert "count" not in first_page
+    assert len(first_page["data"]) == 2
+    assert first_page["next"]
+
+    response = api_client.get(f"/api/properties/?cursor={first_page['next']}&page_size=2")
+    second_page = response.json()
+    assert len(second_page["data"]) == 1
+    assert second_page["next"] is None
+
+    seen = [item["id"] for item in first_page["data"] + second_page["data"]]
+    assert len(set(seen)) == 3
+
+    response = api_client.get("/api/properties/?cursor=not-a-cursor")
+    assert response.status_code == 400
+    # Well-formed, but not values the ordering columns can hold
+    response = api_client.get(f"/api/properties/?cursor={encode_cursor(['notadate', 'nope'])}")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_property_listing_follows_property(create_property):
+    property_instance = create_property
+    listing = PropertyListing.objects.get(pk=property_instance.pk)
+    assert listing.title == "Test Property"
+    assert listing.image_url() == property_instance.image_url()
+
+    property_instance.title = "Renamed Property"
+    property_instance.save()
+    assert PropertyListing.objects.get(pk=property_instance.pk).title == "Renamed Property"
+
+    Property.objects.filter(pk=property_instance.pk).delete()
+    assert not PropertyListing.objects.filter(pk=property_instance.pk).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("filters, ordering, index", [
+    ({}, PROPERTIES_ORDERING, "listing_created_at"),
+    ({"country": "Testland", "category": "Test Category", "guests__gte": 2}, PROPERTIES_ORDERING, "listing_country_category"),
+    ({"country": "Testland", "bedrooms__gte": 1}, PROPERTIES_ORDERING, "listing_country"),
+    ({"category": "Test Category"}, PROPERTIES_ORDERING, "listing_category"),
+    ({"price_per_night__lte": 100}, SORT_ORDERINGS["price"], "listing_price"),
+    ({"guests__gte": 2}, SORT_ORDERINGS["-price"], "listing_price"),
+    ({"guests__gte": 2}, SORT_ORDERINGS["popular"], "listing_popularity"),
+])
+def test_property_list_page_is_an_ordered_index_walk(filters, ordering, index):
+    plan = PropertyListing.objects.filter(**filters).order_by(*ordering)[:21].explain()
+    assert index in plan
+    # No sort step: the page is read in index order and the scan stops early
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_property_facets(api_client: APIClient, create_property, django_assert_num_queries):
+    cache.clear()
+    landlord = create_property.landlord
+    for country, category, bedrooms in [("Testland", "Cabins", 3), ("Otherland", "Test Category", 1)]:
+        Property.objects.create(
+            title=f"{country} {category}",
+            description="Another test property.",
+            price_per_night=80,
+            bedrooms=bedrooms,
+            bathrooms=1,
+            guests=2,
+            country=country,
+            country_code="XX",
+            category=category,
+            landlord=landlord,
+            image="uploads/properties/beach_1.jpg",
+        )
+
+    with django_assert_num_queries(1):
+        response = api_client.get("/api/properties/facets/?category=Test%20Category")
+    assert response.status_code == 200
+    facets = response.json()
+    assert facets["total"] == 2
+    # Countries are counted within the selected category, categories across all of them
+    assert facets["country"] == [{"value": "Otherland", "count": 1}, {"value": "Testland", "count": 1}]
+    assert facets["category"] == [{"value": "Cabins", "count": 1}, {"value": "Test Category", "count": 2}]
+    assert facets["bedrooms"] == [{"value": 1, "count": 1}, {"value": 2, "count": 1}]
+
+    with django_assert_num_queries(0):
+        assert api_client.get("/api/properties/facets/?category=Test%20Category").json() == facets
+
+    response = api_client.get("/api/properties/facets/?numBedrooms=two")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_property_list_full_text_search(api_client: APIClient, create_property):
+    landlord = create_property.landlord
+    listings = [
+        ("Seaside cottage", "Quiet house near the harbour.", "Testland"),
+        ("Mountain cabin", "Hike down to a sandy seaside beach.", "Testland"),
+        ("Seaside loft", "Bright loft by the water.", "Otherland"),
+    ]
+    for title, description, country in listings:
+        Property.objects.create(
+            title=title,
+            description=description,
+            price_per_night=80,
+            bedrooms=1,
+            bathrooms=1,
+            guests=2,
+            country=country,
+            country_code="XX",
+            category="Test Category",
+            landlord=landlord,
+            image="uploads/properties/beach_1.jpg",
+        )
+
+    response = api_client.get("/api/properties/?q=seaside&country=Testland")
+    titles = [item["title"] for item in response.json()["data"]]
+    # Title matches outrank description matches; other filters still apply
+    assert titles == ["Seaside cottage", "Mountain cabin"]
+
+    first_page = api_client.get("/api/properties/?q=seaside&cursor=&page_size=2").json()
+    second_page = api_client.get(f"/api/properties/?q=seaside&cursor={first_page['next']}&page_size=2").json()
+    titles = [item["title"] for item in first_page["data"] + second_page["data"]]
+    assert sorted(titles) == ["Mountain cabin", "Seaside cottage", "Seaside loft"]
+    assert titles[-1] == "Mountain cabin"
+    assert second_page["next"] is None
+
+    # Edits reach the index; user input is never parsed as query syntax
+    loft = Property.objects.get(title="Seaside loft")
+    loft.title = "Harbour loft"
+    loft.save()
+    assert len(api_client.get("/api/properties/?q=seaside").json()["data"]) == 2
+    response = api_client.get('/api/properties/?q=%22seaside%20OR%20*')
+    assert response.status_code == 200
+
+    facets = api_client.get("/api/properties/facets/?q=seaside").json()
+    assert facets["country"] == [{"value": "Testland", "count": 2}]
+
+
+@pytest.mark.django_db
+def test_postgres_search_uses_websearch_syntax():
+    text = '"seaside cottage" -loft'
+    with patch("property.search.connection") as postgres:
+        postgres.vendor = "postgresql"
+        qs = search_listings(PropertyListing.objects.all(), text)
+    sql, params = qs.query.sql_with_params()
+    # The raw input goes to websearch_to_tsquery as a parameter, for both the match and the rank
+    assert "property_propertylisting.search_vector @@ websearch_to_tsquery('english', %s)" in sql
+    assert "ts_rank(property_propertylisting.search_vector, websearch_to_tsquery('english', %s))::float8" in sql
+    assert list(params) == [text, text]
+    assert "property_listing_fts" not in sql
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="needs the Postgres search column")
+def test_property_list_postgres_full_text_search(api_client: APIClient, create_property):
+    landlord = create_property.landlord
+    for title, description in [
+        ("Seaside cottage", "Quiet house near the harbour."),
+        ("Seaside loft", "Bright loft by the water."),
+        ("Mountain cabin", "A cottage by the seaside, in spirit."),
+    ]:
+        Property.objects.create(
+            title=title, description=description, price_per_night=80, bedrooms=1, bathrooms=1, guests=2,
+            country="Testland", country_code="XX", category="Test Category", landlord=landlord,
+            image="uploads/properties/beach_1.jpg",
+        )
+
+    def titles(q):
+        return [item["title"] for item in api_client.get("/api/properties/", {"q": q}).json()["data"]]
+
+    # Stemmed, and title matches outrank description matches
+    assert titles("cottages") == ["Seaside cottage", "Mountain cabin"]
+    assert titles('"seaside cottage"') == ["Seaside cottage"]
+    assert titles("seaside -loft") == ["Seaside cottage", "Mountain cabin"]
+    assert sorted(titles("loft or cabin")) == ["Mountain cabin", "Seaside loft"]
+
+
+@pytest.mark.django_db
+def test_property_list_geo_search(api_client: APIClient, create_property):
+    landlord = create_property.landlord
+    places = [("Paris", 48.8566, 2.3522), ("Versailles", 48.8049, 2.1204), ("London", 51.5074, -0.1278)]
+    for title, latitude, longitude in places:
+        Property.objects.create(
+            title=title,
+            description="Another test property.",
+            price_per_night=80,
+            bedrooms=1,
+            bathrooms=1,
+            guests=2,
+            country="Testland",
+            country_code="XX",
+            category="Test Category",
+            landlord=landlord,
+            image="uploads/properties/beach_1.jpg",
+            latitude=latitude,
+            longitude=longitude,
+        )
+
+    data = api_client.get("/api/properties/?near=48.86,2.35&radius=25").json()["data"]
+    assert [item["title"] for item in data] == ["Paris", "Versailles"]
+    assert data[0]["distance_km"] < 1 < 15 < data[1]["distance_km"] < 20
+
+    data = api_client.get("/api/properties/?bbox=2.2,48.8,2.5,48.9").json()["data"]
+    assert [item["title"] for item in data] == ["Paris"]
+    assert (data[0]["latitude"], data[0]["longitude"]) == (48.8566, 2.3522)
+    # A map pan only scans the geohash ranges covering the box
+    plan = within_boxes(PropertyListing.objects.all(), parse_bbox("2.2,48.8,2.5,48.9")).explain()
+    assert "listing_geohash" in plan
+
+    first_page = api_client.get("/api/properties/?near=48.86,2.35&radius=500&cursor=&page_size=2").json()
+    second_page = api_client.get(f"/api/properties/?near=48.86,2.35&radius=500&cursor={first_page['next']}&page_size=2").json()
+    assert [item["title"] for item in first_page["data"] + second_page["data"]] == ["Paris", "Versailles", "London"]
+
+    facets = api_client.get("/api/properties/facets/?near=48.86,2.35&radius=25").json()
+    assert facets["total"] == 2
+
+    assert api_client.get("/api/properties/?near=48.86,2.35&radius=far").status_code == 400
+    assert api_client.get("/api/properties/?bbox=1,2,3").status_code == 400
+
+
+@pytest.mark.django_db
+def test_property_list_price_range_and_sort(api_client: APIClient, create_property):
+    landlord = create_property.landlord
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    cheap, pricey = [
+        Property.objects.create(
+            title=title,
+            description="Another test property.",
+            price_per_night=price,
+            bedrooms=1,
+            bathrooms=1,
+            guests=2,
+            country="Testland",
+            country_code="XX",
+            category="Test Category",
+            landlord=landlord,
+            image="uploads/properties/beach_1.jpg",
+        )
+        for title, price in [("Cheap", 40), ("Pricey", 300)]
+    ]
+
+    def titles(query):
+        return [item["title"] for item in api_client.get(f"/api/properties/?{query}").json()["data"]]
+
+    assert titles("sort=price") == ["Cheap", "Test Property", "Pricey"]
+    assert titles("sort=-price&min_price=50") == ["Pricey", "Test Property"]
+    assert titles("min_price=50&max_price=200") == ["Test Property"]
+    first_page = api_client.get("/api/properties/?sort=-price&cursor=&page_size=2").json()
+    second_page = api_client.get(f"/api/properties/?sort=-price&cursor={first_page['next']}&page_size=2").json()
+    assert [item["title"] for item in second_page["data"]] == ["Cheap"]
+
+    # Popularity counts favorites and reservations as they happen
+    pricey.favorited.add(landlord, guest)
+    guest.favorites.add(cheap)
+    Reservation.objects.create(
+        property=cheap, start_date="2030-01-01", end_date="2030-01-03", number_of_nights=2,
+        total_price=80, guests=1, created_by=guest,
+    )
+    Reservation.objects.create(
+        property=cheap, start_date="2030-02-01", end_date="2030-02-03", number_of_nights=2,
+        total_price=80, guests=1, created_by=guest,
+    )
+    assert PropertyListing.objects.get(pk=cheap.pk).popularity == 3
+    assert titles("sort=popular") == ["Cheap", "Pricey", "Test Property"]
+
+    pricey.favorited.remove(guest)
+    guest.favorites.clear()
+    Reservation.objects.filter(property=cheap).first().delete()
+    assert PropertyListing.objects.get(pk=pricey.pk).popularity == 1
+    assert PropertyListing.objects.get(pk=cheap.pk).popularity == 1
+
+    # Removing favorites that were never there, from either side, changes nothing
+    stranger = User.objects.create(email="stranger@test.com", name="Stranger")
+    pricey.favorited.remove(stranger)
+    stranger.favorites.remove(pricey, cheap)
+    pricey.favorited.add(landlord)
+    assert PropertyListing.objects.get(pk=pricey.pk).popularity == 1
+    assert PropertyListing.objects.get(pk=cheap.pk).popularity == 1
+    # Counters drifted by hand or by a race never go negative
+    PropertyListing.objects.filter(pk=cheap.pk).update(popularity=0)
+    cheap.favorited.add(stranger)
+    PropertyListing.objects.filter(pk=cheap.pk).update(popularity=0)
+    cheap.favorited.remove(stranger)
+    assert PropertyListing.objects.get(pk=cheap.pk).popularity == 0
+
+    assert api_client.get("/api/properties/?sort=cheapest").status_code == 400
+    assert api_client.get("/api/properties/?min_price=cheap").status_code == 400
+
+
+# Transactional, so cache invalidation runs on commit as it does in production
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_property_availability_calendar(api_client: APIClient, create_reservation, django_assert_num_queries):
+    cache.clear()
+    reservation = create_reservation
+    property_id = reservation.property_id
+    Reservation.objects.filter(pk=reservation.pk).update(start_date="2030-01-30", end_date="2030-02-02")
+    reservation.refresh_from_db()
+    reservation.save()  # Re-sync the booked nights: Jan 30, Jan 31, Feb 1
+    url = f"/api/properties/{property_id}/availability/?from=2030-01-15&to=2030-03-10"
+
+    with django_assert_num_queries(2):
+        response = api_client.get(url)
+    assert response.status_code == 200
+    assert response.json() == {"months": {
+        "2030-01": (1 << 29) | (1 << 30),
+        "2030-02": 1,
+        "2030-03": 0,
+    }}
+    with django_assert_num_queries(0):
+        assert api_client.get(url).json()["months"]["2030-02"] == 1
+
+    # Moving the stay drops both the old and the new months from the cache
+    reservation.start_date = "2030-03-01"
+    reservation.end_date = "2030-03-03"
+    reservation.save()
+    assert api_client.get(url).json()["months"] == {"2030-01": 0, "2030-02": 0, "2030-03": 3}
+
+    Reservation.objects.filter(pk=reservation.pk).delete()
+    assert api_client.get(url).json()["months"]["2030-03"] == 0
+
+    assert api_client.get(f"/api/properties/{property_id}/availability/?from=2030-13-01").status_code == 400
+    assert api_client.get(f"/api/properties/{property_id}/availability/?from=2030-01-01&to=2033-01-01").status_code == 400
+
+
+# Transactional, so cache invalidation runs on commit as it does in production
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_property_list_cache_is_versioned(api_client: APIClient, create_property, django_assert_num_queries):
+    cache.clear()
+    property_instance = create_property
+
+    response = api_client.get("/api/properties/?country=Testland")
+    assert response.json()["data"][0]["title"] == "Test Property"
+
+    # A hit is answered from the cache alone
+    with django_assert_num_queries(0):
+        response = api_client.get("/api/properties/?country=Testland")
+    assert response.json()["data"][0]["title"] == "Test Property"
+
+    # Editing a property bumps the catalogue version, even though the count is unchanged,
+    # but only once the edit commits: a reader in between must not cache the old row as new
+    with transaction.atomic():
+        property_instance.title = "Renamed Property"
+        property_instance.save()
+        with django_assert_num_queries(0):
+            api_client.get("/api/properties/?country=Testland")
+    response = api_client.get("/api/properties/?country=Testland")
+    assert response.json()["count"] == 1
+    assert response.json()["data"][0]["title"] == "Renamed Property"
+
+
+# Transactional, so cache invalidation runs on commit as it does in production
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_property_list_shares_catalogue_across_users(api_client: APIClient, create_property, django_assert_num_queries):
+    cache.clear()
+    property_instance = create_property
+    fan = User.objects.create(email="fan@test.com", name="Fan")
+    property_instance.favorited.add(fan)
+
+    def get_as(user):
+        token = AccessToken.for_user(user)
+        return api_client.get("/api/properties/", HTTP_AUTHORIZATION=f"Bearer {token}").json()
+
+    assert get_as(fan)["favorites"] == [str(property_instance.id)]
+
+    # Another user reuses the same catalogue entry and only loads their user snapshot and favorites
+    with django_assert_num_queries(2):
+        response_data = get_as(property_instance.landlord)
+    assert response_data["favorites"] == []
+    assert response_data["data"][0]["id"] == str(property_instance.id)
+
+    # Toggling a favorite refreshes just that user's set
+    property_instance.favorited.add(property_instance.landlord)
+    with django_assert_num_queries(1):
+        response_data = get_as(property_instance.landlord)
+    assert response_data["favorites"] == [str(property_instance.id)]
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_cache_rebuild_is_single_flight_at_ttl_boundary():
+    cache.clear()
+    rebuilds = []
+
+    def rebuild():
+        rebuilds.append(1)
+        time.sleep(0.2)  # Stands in for the database work behind a popular page
+        return {"count": len(rebuilds)}
+
+    def hammer(results):
+        barrier.wait()
+        results.append(get_or_rebuild("properties_list_hot", rebuild, timeout=600))
+
+    # Cold key: 20 concurrent readers trigger exactly one rebuild
+    barrier = threading.Barrier(20)
+    results = []
+    threads = [threading.Thread(target=hammer, args=(results,)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(rebuilds) == 1
+    assert results == [{"count": 1}] * 20
+
+    # Logically expired key: one reader refreshes, the rest are served the stale value
+    entry = cache.get("properties_list_hot")
+    entry["expires_at"] = time.time() - 1
+    catalogue_cache.set("properties_list_hot", entry, timeout=STALE_GRACE)
+    barrier = threading.Barrier(20)
+    results = []
+    threads = [threading.Thread(target=hammer, args=(results,)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(rebuilds) == 2
+    assert {"count": 2} in results
+    assert all(result in ({"count": 1}, {"count": 2}) for result in results)
+
+
+# Transactional, so cache invalidation runs on commit as it does in production
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_popular_pages_follow_favorites(api_client: APIClient, create_property, django_assert_num_queries):
+    cache.clear()
+    first = create_property
+    second = Property.objects.create(
+        title="Second", description="Second", price_per_night=100, bedrooms=1, bathrooms=1, guests=1,
+        country="Testland", country_code="TL", category="beach", landlord=first.landlord,
+        image=first.image.name,
+    )
+    fan, other_fan = User.objects.bulk_create([User(email=f"{name}@test.com", name=name) for name in ("fan", "other")])
+    second.favorited.add(other_fan)
+
+    def titles(query):
+        return [item["title"] for item in api_client.get(f"/api/properties/{query}").json()["data"]]
+
+    newest = titles("")
+    assert titles("?sort=popular") == ["Second", "Test Property"]
+    first.favorited.add(fan, other_fan)
+    assert titles("?sort=popular") == ["Test Property", "Second"]
+    # Only popularity-sorted pages were invalidated
+    with django_assert_num_queries(0):
+        assert titles("") == newest
+    fan.favorites.remove(first)
+    other_fan.favorites.remove(first)
+    assert titles("?sort=popular") == ["Second", "Test Property"]
+
+
+# Transactional, so cache invalidation runs on commit as it does in production
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_property_detail_served_from_local_tier(api_client: APIClient, create_property):
+    cache.clear()
+    property_instance = create_property
+    url = f"/api/properties/{property_instance.id}/"
+    before = catalogue_cache.stats()
+
+    api_client.get(url)
+    with patch.object(cache, "get", side_effect=AssertionError("shared cache should not be read")):
+        response = api_client.get(url)
+    assert response.json()["title"] == "Test Property"
+
+    stats = catalogue_cache.stats()
+    assert stats["local_hits"] - before["local_hits"] == 1
+    assert stats["redis_misses"] - before["redis_misses"] == 1
+
+    # A property change evicts the local copy as well as the shared one
+    property_instance.title = "Renamed Property"
+    property_instance.save()
+    assert api_client.get(url).json()["title"] == "Renamed Property"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_bookings_never_overlap(create_property):
+    property_instance = create_property
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    stays = [("2030-05-01", "2030-05-04")] * 6 + [(f"2030-06-{day:02d}", f"2030-06-{day + 1:02d}") for day in range(1, 7)]
+    barrier = threading.Barrier(len(stays))
+    outcomes = []
+
+    def attempt(start_date, end_date):
+        try:
+            barrier.wait()
+            book(
+                property_id=property_instance.pk, start_date=start_date, end_date=end_date, created_by=guest,
+                number_of_nights=1, total_price=100, guests=1,
+            )
+            outcomes.append((start_date, 'booked'))
+        except BookingConflict:
+            outcomes.append((start_date, 'conflict'))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=attempt, args=stay) for stay in stays]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Exactly one of the overlapping attempts wins; disjoint stays all succeed
+    assert sorted(outcome for start, outcome in outcomes if start == "2030-05-01") == ["booked"] + ["conflict"] * 5
+    assert all(outcome == "booked" for start, outcome in outcomes if start.startswith("2030-06"))
+    assert Reservation.objects.filter(property=property_instance).count() == 7
+
+
+@pytest.mark.django_db
+def test_booking_is_idempotent_per_checkout(create_property):
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    stay = dict(
+        property_id=create_property.pk, start_date="2030-05-01", end_date="2030-05-04", created_by=guest,
+        number_of_nights=3, total_price=300, guests=1, stripe_checkout_id="cs_test_1",
+    )
+    first, created = book(**stay)
+    assert created and not first.has_paid
+
+    again, created = book(**stay, has_paid=True)
+    assert not created and again.pk == first.pk and again.has_paid
+
+    with pytest.raises(BookingConflict):
+        book(**{**stay, "stripe_checkout_id": "cs_test_2", "start_date": "2030-05-03", "end_date": "2030-05-06"})
+
+
+# Transactional, so cache invalidation runs on commit as it does in production
+@pytest.mark.django_db(transaction=True)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_booking_hold_blocks_dates_until_it_expires(api_client: APIClient, create_property, django_assert_num_queries):
+    cache.clear()
+    property_instance = create_property
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    rival = User.objects.create(email="rival@test.com", name="Rival")
+    search = "/api/properties/?checkIn=2030-05-02&checkOut=2030-05-03"
+    calendar = f"/api/properties/{property_instance.pk}/availability/?from=2030-05-01&to=2030-05-31"
+    assert api_client.get(search).json()["count"] == 1
+    undated = api_client.get("/api/properties/").json()
+
+    hold = place_hold(property_instance.pk, "2030-05-01", "2030-05-04", guest)
+    assert api_client.get(search).json()["count"] == 0
+    # Pages without dates do not depend on holds and stay cached
+    with django_assert_num_queries(0):
+        assert api_client.get("/api/properties/").json() == undated
+    assert api_client.get(calendar).json()["months"] == {"2030-05": 0b111}
+    with pytest.raises(BookingConflict):
+        place_hold(property_instance.pk, "2030-05-03", "2030-05-05", rival)
+    with pytest.raises(BookingConflict):
+        book(property_id=property_instance.pk, start_date="2030-05-03", end_date="2030-05-05", created_by=rival,
+             number_of_nights=2, total_price=200, guests=1)
+
+    # Restarting checkout replaces the guest's own hold instead of conflicting with it
+    hold = place_hold(property_instance.pk, "2030-05-01", "2030-05-03", guest)
+    assert list(BookingHold.objects.values_list("pk", flat=True)) == [hold.pk]
+
+    # A lapsed hold stops counting straight away; the sweeper then deletes it
+    past = timezone.now() - timedelta(minutes=1)
+    BookingHold.objects.filter(pk=hold.pk).update(expires_at=past)
+    BookedNight.objects.filter(hold=hold).update(expires_at=past)
+    rival_hold = place_hold(property_instance.pk, "2030-05-02", "2030-05-04", rival)
+    assert release_expired_holds_task() == 1
+    assert list(BookingHold.objects.values_list("pk", flat=True)) == [rival_hold.pk]
+    assert api_client.get(calendar).json()["months"] == {"2030-05": 0b110}
+    assert release_expired_holds() == 0
+
+
+@pytest.mark.django_db
+@patch("my_stripe.views.ensure_stripe_customer", return_value="cus_guest")
+@patch("stripe.checkout.Session.create")
+def test_paying_turns_the_hold_into_a_reservation(mock_session_create, mock_customer, api_client: APIClient,
+                                                   create_property):
+    mock_session_create.return_value = Mock(url="https://checkout.stripe.test/cs_test_1")
+    property_instance = create_property
+    guest = User.objects.create(email="guest@test.com", name="Guest")
+    rival = User.objects.create(email="rival@test.com", name="Rival")
+    stay = {"start_date": "2030-05-01", "end_date": "2030-05-04", "total_price": "300", "number_of_nights": 3,
+            "guests": 1}
+
+    api_client.force_authenticate(user=guest)
+    response = api_client.post(f"/api/properties/{property_instance.pk}/book/", data=stay, format="json")
+    assert response.status_code == 200
+    assert response.json()["url"] == "https://checkout.stripe.test/cs_test_1"
+    hold = BookingHold.objects.get(created_by=guest)
+    # The checkout is tied to the hold and closes before the hold lapses
+    session = mock_session_create.call_args.kwargs
+    assert session["customer"] == "cus_guest"
+    assert session["metadata"]["hold_id"] == str(hold.pk)
+    assert session["metadata"]["user_id"] == str(guest.pk)
+    assert session["expires_at"] < hold.expires_at.timestamp()
+    assert session["line_items"][0]["price_data"]["unit_amount"] == 30000
+
+    api_client.force_authenticate(user=rival)
+    response = api_client.post(f"/api/properties/{property_instance.pk}/book/", data=stay, format="json")
+    assert response.status_code == 409
+
+    reservation, created = book(
+        property_id=property_instance.pk, start_date="2030-05-01", end_date="2030-05-04", created_by=guest,
+        number_of_nights=3, total_price=300, guests=1, stripe_checkout_id="cs_test_1", hold_id=str(hold.pk),
+    )
+    assert created
+    assert not BookingHold.objects.exists()
+    assert set(BookedNight.objects.values_list("reservation", flat=True)) == {reservation.pk}
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_property_list_query_plans(api_client: APIClient, query_plans):
+    seeder = BenchmarkSearch()
+    landlord, property_ids = seeder.seed_properties(2000, 1000)
+    seeder.seed_reservations(2000, landlord, property_ids, 1000)
+
+    for query in [
+        "",
+        "?country=Spain&category=beach",
+        "?category=cabins&numBedrooms=2",
+        "?sort=price&max_price=100",
+        "?sort=popular",
+        "?checkIn=2025-03-01&checkOut=2025-03-05&country=Italy",
+        "?q=sunny",
+        "?near=45,5&radius=50",
+    ]:
+        cache.clear()
+        with query_plans() as plans:
+            assert api_client.get(f"/api/properties/{query}").status_code == 200
+        assert plans.plans, query
+        assert plans.sequential_scans() == [], query
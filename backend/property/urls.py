@@ -3,9 +3,12 @@ from . import api
 
 urlpatterns = [
     path('properties/', api.PropertiesListAPIView.as_view(), name='api_properties_list'),
+    path('properties/facets/', api.PropertyFacetsAPIView.as_view(), name='api_properties_facets'),
+    path('properties/cache-stats/', api.PropertyCacheStatsAPIView.as_view(), name='api_properties_cache_stats'),
     path('properties/create/', api.CreatePropertyAPIView.as_view(), name='api_create'),
     path('properties/<uuid:pk>/', api.PropertyDetailAPIView.as_view(), name='api_properties_detail'),
     path('properties/<uuid:pk>/book/', api.BookPropertyAPIView.as_view(), name='api_properties_book'),
     path('properties/<uuid:pk>/toggle_favorite/', api.ToggleFavoriteAPIView.as_view(), name='api_toggle_favorite'),
+    path('properties/<uuid:pk>/availability/', api.PropertyAvailabilityAPIView.as_view(), name='api_properties_availability'),
     path('properties/<uuid:pk>/reservations/', api.PropertiesReservationsAPIView.as_view(), name='api_properties_reservations')
 ]
\ No newline at end of file
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['property', 'created_at'], name='review_property_created_at'),
+        ),
+    ]
@@ -9,6 +9,11 @@ class Review(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # A property's reviews, newest first
+            models.Index(fields=['property', 'created_at'], name='review_property_created_at'),
+        ]
 
     def __str__(self):
         return f"Review by {self.user.name} on {self.property.id} - review text: {self.text}"
@@ -1,6 +1,8 @@
 import pytest
 from rest_framework import status
 from property.models import Property
+from useraccounts.models import User
+from .models import Review, ReviewReport
 
 @pytest.mark.django_db
 def test_create_review(create_review):
@@ -41,3 +43,28 @@ def test_create_review_report(api_client, create_report_review):
     report_response = create_report_review
 
     assert report_response.get('success') == 'Report was created successfully'
+
+
+@pytest.mark.django_db
+def test_get_reviews_query_plans(api_client, create_property, query_plans):
+    landlord = create_property.landlord
+    properties = Property.objects.bulk_create([
+        Property(title=f"Property {n}", description="Seeded", price_per_night=100, bedrooms=1, bathrooms=1, guests=2,
+                 country="Testland", country_code="TL", category="Test Category", landlord=landlord,
+                 image="uploads/properties/beach_1.jpg")
+        for n in range(200)
+    ])
+    guests = User.objects.bulk_create([User(email=f"guest{n}@test.com", name=f"Guest {n}") for n in range(50)])
+    reviews = Review.objects.bulk_create([
+        Review(user=guests[n % 50], property=properties[n % 200], text=f"Review {n}") for n in range(5000)
+    ] + [Review(user=guests[n % 50], property=create_property, text=f"Review {n}") for n in range(30)])
+    ReviewReport.objects.bulk_create([
+        ReviewReport(review=review, reported_by=guests[0], reason="Spam", status=ReviewReport.Status.DISMISSED)
+        for review in reviews[::10]
+    ])
+
+    with query_plans() as plans:
+        response = api_client.get(f"/api/reviews/all/{create_property.id}?page=2")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["total_reviews"] == 27
+    assert plans.sequential_scans() == []
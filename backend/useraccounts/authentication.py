@@ -1,17 +1,85 @@
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from .models import User
 
+# Fields every request path needs; anything else is loaded lazily on first access
+USER_SNAPSHOT_FIELDS = ('id', 'email', 'name', 'role', 'is_active', 'is_staff', 'is_superuser')
+# Matches the access token lifetime, and User saves drop the entry anyway
+USER_SNAPSHOT_TIMEOUT = 300
 
-class CookiesJWTAuthentication(JWTAuthentication):
+
+def user_snapshot_key(user_id):
+    return f"user_snapshot_{user_id}"
+
+
+def get_cached_user(user_id):
+    """
+    Resolve a user from a cached snapshot of USER_SNAPSHOT_FIELDS, falling back
+    to a single users-table read on a miss. The returned instance behaves like
+    a normal User; fields outside the snapshot are deferred.
+    """
+    key = user_snapshot_key(user_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = User.objects.filter(pk=user_id).values(*USER_SNAPSHOT_FIELDS).first()
+        if snapshot is None:
+            return None
+        cache.set(key, snapshot, timeout=USER_SNAPSHOT_TIMEOUT)
+    # from_db expects values in model field order
+    field_names = [field.attname for field in User._meta.concrete_fields if field.attname in snapshot]
+    return User.from_db('default', field_names, [snapshot[name] for name in field_names])
+
+
+def user_from_token(raw_token):
+    """
+    Decode an access token once and resolve its user, or return None when the
+    token is invalid or the user is missing or inactive.
+    """
+    try:
+        token = AccessToken(raw_token)
+        user = get_cached_user(token[api_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError):
+        return None
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that reads the user from the snapshot cache instead of
+    querying the users table on every request.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        if not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return user
+
+
+class CookiesJWTAuthentication(CachedJWTAuthentication):
     def authenticate(self, request):
         access_token = request.COOKIES.get('access_token')
 
         if not access_token:
             return None
-        
+
         validate_token = self.get_validated_token(access_token)
 
         try:
             user = self.get_user(validate_token)
         except:
             return None
-        return (user, validate_token)
\ No newline at end of file
+        return (user, validate_token)
@@ -0,0 +1,49 @@
+import stripe
+from django.conf import settings
+from .models import User
+
+stripe.api_key = settings.STRIPE_SECRET_KEY
+
+
+def _create_customer(user):
+    # Keyed per user so a retried task and a concurrent checkout share one customer
+    return stripe.Customer.create(email=user.email, name=f"{user.name}", idempotency_key=f"customer-{user.pk}")
+
+
+def ensure_stripe_customer(user):
+    """
+    Return the user's Stripe customer id, creating the customer on first use.
+
+    Normally the customer already exists, provisioned in the background right
+    after signup; this covers users who reach checkout before that task ran or
+    after it gave up. The id is written with a conditional update, so racing
+    callers keep whichever id was stored first.
+    """
+    if user.stripe_customer_id:
+        return user.stripe_customer_id
+    customer = _create_customer(user)
+    if not User.objects.filter(pk=user.pk, stripe_customer_id__isnull=True).update(stripe_customer_id=customer.id):
+        customer_id = User.objects.filter(pk=user.pk).values_list('stripe_customer_id', flat=True).first()
+        if customer_id:
+            user.stripe_customer_id = customer_id
+            return customer_id
+    user.stripe_customer_id = customer.id
+    return customer.id
+
+
+def provision_stripe_customers(user_ids):
+    """
+    Create the missing customers for a batch of users, e.g. after a bulk import
+    that bypassed the post_save signal, and store every id with one bulk_update.
+    Returns the number of customers created.
+    """
+    users = list(User.objects.filter(pk__in=user_ids, stripe_customer_id__isnull=True).only('id', 'email', 'name'))
+    provisioned = []
+    try:
+        for user in users:
+            user.stripe_customer_id = _create_customer(user).id
+            provisioned.append(user)
+    finally:
+        # Keep what was created even if Stripe fails part-way; a retry skips those users
+        User.objects.bulk_update(provisioned, ['stripe_customer_id'])
+    return len(provisioned)
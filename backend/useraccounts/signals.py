@@ -1,23 +1,25 @@
-import stripe
-from django.conf import settings
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from useraccounts.models import User
+from useraccounts.authentication import user_snapshot_key
+from useraccounts.tasks import queue_stripe_customer
 from django.dispatch import receiver
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
-def create_stripe_customer(user):
-    # Check if user already has a customer ID in your database
-    if not user.stripe_customer_id:
-        customer = stripe.Customer.create(
-            email=user.email,
-            name=f"{user.name}",
-        )
-        user.stripe_customer_id = customer.id
-        user.save()  # Save customer ID to your database
-    return user.stripe_customer_id
+@receiver(post_save, sender=User)
+def create_customer_signal(sender, instance, created, raw=False, **kwargs):
+    """
+    Provision the Stripe customer in the background once the signup commits,
+    so signups neither wait on nor fail with Stripe or the broker. Checkout
+    creates it on demand if the task has not run yet, see useraccounts.customers,
+    and provision_missing_stripe_customers catches up every night.
+    """
+    if created and not raw:
+        transaction.on_commit(lambda: queue_stripe_customer(instance.pk))
+
 
 @receiver(post_save, sender=User)
-def create_customer_signal(sender, instance, created, **kwargs):
-    if created:
-        create_stripe_customer(instance)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    cache.delete(user_snapshot_key(instance.pk))
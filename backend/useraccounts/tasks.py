@@ -1,6 +1,8 @@
+import stripe
 from celery import shared_task
 from helpers.messaging import send_message
 from .models import User
+from . import customers
 from django.contrib.auth.tokens import default_token_generator
 from django.conf import settings
 import logging
@@ -58,4 +60,39 @@ def send_reset_email(email, reset_url):
         from_email,       # Sender email address
         email,          # Recipient email address
         html_message=message  # HTML version of the message
-    )
\ No newline at end of file
+    )
+
+
+# Transient Stripe failures; anything else (e.g. an invalid request) will not succeed on retry
+STRIPE_RETRYABLE_ERRORS = (stripe.error.APIConnectionError, stripe.error.RateLimitError, stripe.error.APIError)
+
+
+@shared_task(autoretry_for=STRIPE_RETRYABLE_ERRORS, retry_backoff=True, retry_backoff_max=600, max_retries=8)
+def create_stripe_customer(user_id):
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        customers.ensure_stripe_customer(user)
+
+
+@shared_task(autoretry_for=STRIPE_RETRYABLE_ERRORS, retry_backoff=True, retry_backoff_max=600, max_retries=8)
+def provision_stripe_customers(user_ids):
+    created = customers.provision_stripe_customers(user_ids)
+    logger.info(f"Provisioned {created} Stripe customers")
+    return created
+
+
+def queue_stripe_customer(user_id):
+    """Queue the customer for a new user; if the broker is unreachable the nightly sweep or checkout creates it."""
+    try:
+        create_stripe_customer.delay(user_id)
+    except Exception as e:
+        logger.error(f"Could not queue Stripe customer creation for user {user_id}: {e}")
+
+
+@shared_task
+def provision_missing_stripe_customers(batch_size=500):
+    """Catch up on users whose signup task was never queued or gave up."""
+    user_ids = list(User.objects.filter(stripe_customer_id__isnull=True).values_list('pk', flat=True)[:batch_size])
+    if user_ids:
+        provision_stripe_customers.delay(user_ids)
+    return len(user_ids)
@@ -1,5 +1,16 @@
 import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from chat.token_auth import get_user
+from unittest.mock import patch, Mock
+import stripe
+from useraccounts.models import User
+from useraccounts.customers import ensure_stripe_customer
+from useraccounts.tasks import create_stripe_customer, provision_stripe_customers, provision_missing_stripe_customers
 
 @pytest.mark.django_db
 def test_landlord_detail_success(api_client, create_landlord):
@@ -78,4 +89,77 @@ def test_update_profile(api_client:APIClient, create_landlord):
     assert 'avatar' in updated_data or 'avatar_url' in updated_data
 
 
+@pytest.mark.django_db
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_jwt_user_resolved_from_snapshot(api_client: APIClient, create_landlord, django_assert_num_queries):
+    cache.clear()
+    user = create_landlord
+    api_client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+    url = '/api/auth/myreservations/'
+
+    assert api_client.get(url).status_code == 200
+
+    # Only the reservations query remains once the snapshot is cached
+    with django_assert_num_queries(1):
+        assert api_client.get(url).status_code == 200
 
+    # Saving the user drops the snapshot, so deactivation takes effect immediately
+    user.is_active = False
+    user.save()
+    assert api_client.get(url).status_code == 401
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+def test_websocket_token_middleware_uses_snapshot(create_landlord):
+    cache.clear()
+    user = create_landlord
+
+    resolved = async_to_sync(get_user)(str(AccessToken.for_user(user)))
+    assert resolved.pk == user.pk
+    assert resolved.name == user.name
+
+    assert isinstance(async_to_sync(get_user)("not-a-token"), AnonymousUser)
+
+
+@pytest.mark.django_db
+def test_signup_provisions_stripe_customer_in_background(django_capture_on_commit_callbacks):
+    outage = stripe.error.APIConnectionError("Stripe is down")
+    with patch("stripe.Customer.create", side_effect=outage) as mock_create, \
+            patch("useraccounts.tasks.create_stripe_customer.delay") as mock_delay:
+        with django_capture_on_commit_callbacks(execute=True):
+            user = User.objects.create(email="guest@test.com", name="Guest")
+        # Signup succeeded without touching Stripe; the customer is left to the task
+        mock_create.assert_not_called()
+        mock_delay.assert_called_once_with(user.pk)
+
+        # With the broker down too, signup still succeeds and the nightly sweep catches up
+        mock_delay.side_effect = ConnectionError("broker down")
+        with django_capture_on_commit_callbacks(execute=True):
+            offline = User.objects.create(email="offline@test.com", name="Offline")
+    with patch("useraccounts.tasks.provision_stripe_customers.delay") as mock_provision:
+        assert provision_missing_stripe_customers() == 2
+    assert set(mock_provision.call_args.args[0]) == {user.pk, offline.pk}
+
+    with patch("stripe.Customer.create", return_value=Mock(id="cus_guest")) as mock_create:
+        create_stripe_customer(user.pk)
+        create_stripe_customer(user.pk)
+        # Checkout finds the stored id instead of creating another customer
+        assert ensure_stripe_customer(User.objects.get(pk=user.pk)) == "cus_guest"
+    mock_create.assert_called_once_with(email="guest@test.com", name="Guest", idempotency_key=f"customer-{user.pk}")
+
+
+@pytest.mark.django_db
+def test_bulk_imported_users_are_provisioned_in_one_batch(django_assert_num_queries):
+    users = User.objects.bulk_create([User(email=f"import{n}@test.com", name=f"Import {n}") for n in range(3)])
+    ids = [user.pk for user in users]
+    customers = iter(Mock(id=f"cus_{n}") for n in range(3))
+
+    with patch("stripe.Customer.create", side_effect=lambda **kwargs: next(customers)) as mock_create:
+        # One read, one bulk write
+        with django_assert_num_queries(2):
+            assert provision_stripe_customers(ids) == 3
+        assert provision_stripe_customers(ids) == 0
+    assert mock_create.call_count == 3
+    assert sorted(User.objects.filter(pk__in=ids).values_list("stripe_customer_id", flat=True)) == \
+        ["cus_0", "cus_1", "cus_2"]